@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from .tokens import RoleRefreshToken
 from .models import User
 
 class UserSerializer(serializers.ModelSerializer):
@@ -39,8 +40,4 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 class CustomTokenSerializer(TokenObtainPairSerializer):
-    @classmethod
-    def get_token(cls, user):
-        token = super().get_token(user)
-        token['role'] = user.role
-        return token
\ No newline at end of file
+    token_class = RoleRefreshToken
\ No newline at end of file
@@ -0,0 +1,15 @@
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+class RoleRefreshToken(RefreshToken):
+    """
+    Refresh token carrying the user's role. Access tokens issued from it,
+    including on refresh, copy the claim, so WebSocket connections can be
+    authenticated from the token alone.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['role'] = user.role
+        return token
@@ -100,9 +100,9 @@ def login_user(request):
     user = authenticate(request, email=email, password=password)
     
     if user is not None:
-        from rest_framework_simplejwt.tokens import RefreshToken
-        # Generate tokens
-        refresh = RefreshToken.for_user(user)
+        from .tokens import RoleRefreshToken
+        # Generate tokens; the access token carries the role for WebSocket authentication
+        refresh = RoleRefreshToken.for_user(user)
         
         return Response({
             'success': _('Login successful'),
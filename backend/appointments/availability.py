@@ -0,0 +1,163 @@
+from bisect import bisect_right
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+from .models import Appointment, TimeSlot
+
+# Appointments in these states no longer occupy the doctor's time
+CANCELLED_STATUSES = ['cancelled', 'CANCELLED']
+
+
+def make_aware(value):
+    """Interpret naive datetimes in the current time zone"""
+    if timezone.is_naive(value):
+        return timezone.make_aware(value)
+    return value
+
+
+class IntervalIndex:
+    """
+    Sorted, non-overlapping set of [start, end) intervals.
+
+    Overlapping or touching intervals are merged when the index is built, so
+    both the starts and the ends are sorted and a binary search finds the
+    first interval relevant to a query in O(log n); walking the k intervals
+    that intersect the query range then costs O(k).
+    """
+
+    def __init__(self, intervals=()):
+        merged = []
+        for start, end in sorted(intervals):
+            if start >= end:
+                continue
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self.starts = [start for start, _ in merged]
+        self.ends = [end for _, end in merged]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _first_after(self, start):
+        # Index of the first interval ending after `start`
+        return bisect_right(self.ends, start)
+
+    def overlaps(self, start, end):
+        """Whether any interval intersects [start, end)"""
+        i = self._first_after(start)
+        return i < len(self.starts) and self.starts[i] < end
+
+    def covers(self, start, end):
+        """Whether [start, end) lies entirely within a single interval"""
+        i = self._first_after(start)
+        return i < len(self.starts) and self.starts[i] <= start and self.ends[i] >= end
+
+    def between(self, start, end):
+        """Yield the intervals intersecting [start, end), clipped to it"""
+        i = self._first_after(start)
+        while i < len(self.starts) and self.starts[i] < end:
+            yield max(self.starts[i], start), min(self.ends[i], end)
+            i += 1
+
+    def gaps(self, start, end):
+        """Yield the parts of [start, end) not covered by any interval"""
+        cursor = start
+        for busy_start, busy_end in self.between(start, end):
+            if busy_start > cursor:
+                yield cursor, busy_start
+            cursor = busy_end
+        if cursor < end:
+            yield cursor, end
+
+
+class AvailabilityEngine:
+    """
+    A doctor's availability over a period: the open intervals of their
+    materialized time slots minus the intervals of booked appointments.
+    """
+
+    def __init__(self, open_intervals, booked_intervals, slots=()):
+        self.open = IntervalIndex(open_intervals)
+        self.booked = IntervalIndex(booked_intervals)
+        # Time slot rows the engine was loaded from, for listing them
+        self.slots = list(slots)
+
+    @classmethod
+    def load(cls, doctor, start, end, include_unavailable=False):
+        """
+        Load slots and appointments overlapping [start, end) in two queries.
+
+        The slot rows (id, date, start_time, end_time, is_available), ordered
+        by date and start time, are kept in slots, including the unavailable
+        ones when include_unavailable is set; only available slots are open.
+        """
+        start, end = make_aware(start), make_aware(end)
+        slots = TimeSlot.objects.filter(
+            doctor=doctor,
+            date__gte=timezone.localtime(start).date(),
+            # Slots lie within a day, so none on the day starting at end overlaps
+            date__lte=timezone.localtime(end - timedelta(microseconds=1)).date()
+        )
+        if not include_unavailable:
+            slots = slots.filter(is_available=True)
+        slots = list(slots.order_by('date', 'start_time').values(
+            'id', 'date', 'start_time', 'end_time', 'is_available'
+        ))
+        return cls(
+            [slot_interval(slot['date'], slot['start_time'], slot['end_time']) for slot in slots if slot['is_available']],
+            booked_intervals(doctor, start, end),
+            slots
+        )
+
+    def is_booked(self, start, end):
+        """Whether an appointment already overlaps [start, end)"""
+        return self.booked.overlaps(make_aware(start), make_aware(end))
+
+    def is_free(self, start, end):
+        """Whether [start, end) is inside an open slot and not booked"""
+        start, end = make_aware(start), make_aware(end)
+        return self.open.covers(start, end) and not self.booked.overlaps(start, end)
+
+    def free_intervals(self, start, end):
+        """List the free intervals between start and end"""
+        start, end = make_aware(start), make_aware(end)
+        free = []
+        for open_start, open_end in self.open.between(start, end):
+            free.extend(self.booked.gaps(open_start, open_end))
+        return free
+
+
+def slot_interval(slot_date, start_time, end_time):
+    """Aware [start, end) datetimes of a time slot"""
+    return (
+        make_aware(datetime.combine(slot_date, start_time)),
+        make_aware(datetime.combine(slot_date, end_time))
+    )
+
+
+def conflicting_appointments(doctor, start, end):
+    """Appointments of a doctor that overlap [start, end)"""
+    return Appointment.objects.filter(
+        doctor=doctor,
+        start_time__lt=make_aware(end),
+        end_time__gt=make_aware(start)
+    ).exclude(status__in=CANCELLED_STATUSES)
+
+
+def booked_intervals(doctor, start, end):
+    """(start, end) pairs of the appointments of a doctor overlapping [start, end)"""
+    return list(conflicting_appointments(doctor, start, end).values_list('start_time', 'end_time'))
+
+
+def is_doctor_booked(doctor, start, end):
+    """Whether the doctor already has an appointment overlapping [start, end)"""
+    return conflicting_appointments(doctor, start, end).exists()
+
+
+def date_range_bounds(start_date, end_date):
+    """Aware datetimes spanning whole days from start_date to end_date inclusive"""
+    return (
+        make_aware(datetime.combine(start_date, time.min)),
+        make_aware(datetime.combine(end_date + timedelta(days=1), time.min))
+    )
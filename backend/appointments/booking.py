@@ -0,0 +1,94 @@
+from datetime import timedelta
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils.translation import gettext_lazy as _
+from accounts.models import User
+from notifications.services import enqueue_appointment_confirmation
+from .availability import CANCELLED_STATUSES, conflicting_appointments, is_doctor_booked, make_aware
+from .models import Appointment, TimeSlot
+
+# Appointments fit in a day (a time slot or a fixed-length specific time),
+# which bounds how far back the calendar looks for ones overlapping a window
+MAX_APPOINTMENT_DURATION = timedelta(days=1)
+
+
+class BookingConflict(Exception):
+    """Raised when the requested time slot or time range is already taken"""
+
+
+def book_appointment(appointment_data, time_slot=None):
+    """
+    Create an appointment atomically, guaranteeing that concurrent requests
+    cannot book the same slot or overlapping times with the same doctor.
+
+    The time slot is claimed with a conditional UPDATE ... WHERE is_available,
+    so only one transaction can flip it. The doctor's row is locked for the
+    rest of the transaction so overlap checks of concurrent bookings are
+    serialized; on PostgreSQL an exclusion constraint backs this up at the
+    database level. The confirmation is queued in the outbox in the same
+    transaction and sent by the process_outbox worker.
+
+    Raises BookingConflict if the booking cannot be made, and ValidationError
+    if the appointment is longer than MAX_APPOINTMENT_DURATION.
+    """
+    doctor = appointment_data['doctor']
+    appointment_data = dict(
+        appointment_data,
+        start_time=make_aware(appointment_data['start_time']),
+        end_time=make_aware(appointment_data['end_time'])
+    )
+    if appointment_data['end_time'] - appointment_data['start_time'] > MAX_APPOINTMENT_DURATION:
+        raise ValidationError(_('An appointment cannot last longer than a day'))
+
+    try:
+        with transaction.atomic():
+            if time_slot is not None:
+                claimed = TimeSlot.objects.filter(id=time_slot.id, is_available=True).update(is_available=False)
+                if not claimed:
+                    raise BookingConflict(_('Time slot is no longer available'))
+                time_slot.is_available = False
+
+            # Serialize bookings for this doctor until the transaction ends
+            list(User.objects.select_for_update().filter(id=doctor.id).values_list('id', flat=True))
+
+            if is_doctor_booked(doctor, appointment_data['start_time'], appointment_data['end_time']):
+                raise BookingConflict(_('The doctor already has an appointment at this time'))
+
+            appointment = Appointment.objects.create(**appointment_data)
+            enqueue_appointment_confirmation(appointment)
+            return appointment
+    except IntegrityError:
+        # The exclusion constraint caught an overlap the lock did not
+        raise BookingConflict(_('The doctor already has an appointment at this time'))
+
+
+def update_appointment(appointment, status=None, notes=None):
+    """
+    Update the status and notes of an appointment.
+
+    Moving a cancelled appointment back to an active status books its time
+    again, so it goes through the same overlap check as book_appointment,
+    under the doctor's row lock and backed by the exclusion constraint.
+
+    Raises BookingConflict if the doctor has another appointment at that time.
+    """
+    reactivated = (
+        status is not None and status not in CANCELLED_STATUSES and appointment.status in CANCELLED_STATUSES
+    )
+    if status:
+        appointment.status = status
+    if notes:
+        appointment.notes = notes
+
+    try:
+        with transaction.atomic():
+            if reactivated:
+                list(User.objects.select_for_update().filter(id=appointment.doctor_id).values_list('id', flat=True))
+                if conflicting_appointments(
+                    appointment.doctor_id, appointment.start_time, appointment.end_time
+                ).exclude(id=appointment.id).exists():
+                    raise BookingConflict(_('The doctor already has an appointment at this time'))
+            appointment.save()
+    except IntegrityError:
+        raise BookingConflict(_('The doctor already has an appointment at this time'))
+    return appointment
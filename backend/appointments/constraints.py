@@ -0,0 +1,43 @@
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import BigIntegerRangeField, DateTimeRangeField
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Func
+
+
+class Int8Range(Func):
+    """int8range(lower, upper, bounds)"""
+    function = 'INT8RANGE'
+    output_field = BigIntegerRangeField()
+
+
+class TsTzRange(Func):
+    """tstzrange(lower, upper, bounds)"""
+    function = 'TSTZRANGE'
+    output_field = DateTimeRangeField()
+
+
+class PostgresExclusionConstraint(ExclusionConstraint):
+    """
+    Exclusion constraint created on PostgreSQL only.
+
+    Other backends, such as the SQLite test database, have no EXCLUDE
+    constraints, so the constraint is left out of their tables and not
+    validated there; appointments.booking's row lock covers them.
+    """
+
+    @staticmethod
+    def supported(schema_editor):
+        return schema_editor.connection.vendor == 'postgresql'
+
+    def constraint_sql(self, model, schema_editor):
+        return super().constraint_sql(model, schema_editor) if self.supported(schema_editor) else None
+
+    def create_sql(self, model, schema_editor):
+        return super().create_sql(model, schema_editor) if self.supported(schema_editor) else None
+
+    def remove_sql(self, model, schema_editor):
+        return super().remove_sql(model, schema_editor) if self.supported(schema_editor) else None
+
+    def validate(self, model, instance, exclude=None, using=DEFAULT_DB_ALIAS):
+        if connections[using].vendor == 'postgresql':
+            super().validate(model, instance, exclude=exclude, using=using)
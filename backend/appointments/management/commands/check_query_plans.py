@@ -0,0 +1,91 @@
+import re
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from appointments.booking import MAX_APPOINTMENT_DURATION
+from appointments.models import Appointment, TimeSlot
+from medical_inventory.alerts import expiring_items, short_items
+from medical_inventory.models import InventoryTransaction
+from notifications.models import Notification
+
+# Patterns identifying a full table scan in EXPLAIN output, per database vendor
+SEQ_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    # SQLite reports index walks as SCAN too; those lines name the index used
+    'sqlite': re.compile(r'\bSCAN (\w+)\b(?![^\n]*\bUSING (?:COVERING )?INDEX\b)'),
+}
+
+
+def canonical_queries():
+    """The hot queries of the app, shaped like the views issue them"""
+    now = timezone.now()
+    today = now.date()
+    return [
+        ('Doctor appointment feed',
+         Appointment.objects.filter(doctor_id=1).order_by('start_time', 'id')[:100]),
+        ('Patient appointment feed',
+         Appointment.objects.filter(patient_id=1).order_by('start_time', 'id')[:100]),
+        ('Appointments of a day',
+         Appointment.objects.filter(start_time__gte=now, start_time__lt=now + timedelta(days=1))
+         .order_by('start_time', 'id')[:100]),
+        ('Doctor calendar window',
+         Appointment.objects.filter(doctor_id=1, start_time__gt=now - MAX_APPOINTMENT_DURATION,
+                                    start_time__lt=now + timedelta(days=42), end_time__gt=now)
+         .order_by('start_time', 'id')),
+        ('Available time slots',
+         TimeSlot.objects.filter(doctor_id=1, date__gte=today, date__lte=today + timedelta(days=7), is_available=True)
+         .order_by('date', 'start_time')),
+        ('Due appointment reminders',
+         Appointment.objects.filter(reminder_sent_at__isnull=True, start_time__gt=now,
+                                    start_time__lte=now + timedelta(days=7))
+         .order_by('start_time', 'id')[:200]),
+        ('Unread notifications',
+         Notification.objects.filter(user_id=1, is_read=False).order_by('-created_at')[:20]),
+        ('Notification list',
+         Notification.objects.filter(user_id=1).order_by('-created_at')[:20]),
+        ('Missed notifications replay',
+         Notification.objects.filter(user_id=1, id__gt=1000).order_by('id')[:101]),
+        ('Expiring inventory items', expiring_items(today, 30)[:500]),
+        ('Short inventory items', short_items()[:500]),
+        ('Inventory usage window',
+         InventoryTransaction.objects.filter(transaction_type='usage', timestamp__gte=now - timedelta(days=90),
+                                             timestamp__lt=now)),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Runs EXPLAIN on the canonical appointment, time slot, notification and inventory queries and fails on sequential scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the full plan of every query')
+
+    def handle(self, *args, **options):
+        pattern = SEQ_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(f'Query plan checks are not supported on {connection.vendor}')
+
+        failures = []
+        for label, queryset in canonical_queries():
+            with transaction.atomic():
+                if connection.vendor == 'postgresql':
+                    # Small or empty tables make a sequential scan the cheapest
+                    # plan; discourage it so we learn whether an index is usable
+                    with connection.cursor() as cursor:
+                        cursor.execute('SET LOCAL enable_seqscan = off')
+                plan = queryset.explain()
+
+            table = queryset.model._meta.db_table
+            scanned = [name for name in pattern.findall(plan) if name == table]
+            if options['verbose_plans']:
+                self.stdout.write(f'{label}:\n{plan}\n')
+            if scanned:
+                failures.append(label)
+                self.stdout.write(self.style.ERROR(f'{label}: sequential scan on {table}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{label}: uses an index'))
+
+        if failures:
+            raise CommandError(f'{len(failures)} queries degrade to a sequential scan: {", ".join(failures)}')
+
+        self.stdout.write(self.style.SUCCESS('All canonical queries use an index'))
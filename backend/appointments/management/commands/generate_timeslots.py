@@ -0,0 +1,51 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from accounts.models import User
+from appointments.schedules import ScheduleTemplate, generate_time_slots, parse_date_value
+
+
+class Command(BaseCommand):
+    help = 'Generates recurring time slots for a doctor from a weekly schedule template'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctor-id', type=int, help='Doctor to generate slots for (defaults to the only doctor, required when there are several)')
+        parser.add_argument('--start-date', type=str, help='First day to generate, YYYY-MM-DD (defaults to today)')
+        parser.add_argument('--end-date', type=str, help='Last day to generate, YYYY-MM-DD')
+        parser.add_argument('--weeks', type=int, default=13, help='Number of weeks to generate when --end-date is omitted')
+        parser.add_argument('--weekdays', nargs='+', default=['0', '1', '2', '3', '4'],
+                            help='Working days as 0-6 (Monday first) or day names')
+        parser.add_argument('--start-time', type=str, default='09:00', help='Start of the working day, HH:MM')
+        parser.add_argument('--end-time', type=str, default='17:00', help='End of the working day, HH:MM')
+        parser.add_argument('--slot-minutes', type=int, default=30, help='Length of each slot in minutes')
+        parser.add_argument('--break', dest='breaks', action='append', default=[],
+                            help='Break as HH:MM-HH:MM, may be repeated')
+        parser.add_argument('--exclude', dest='exceptions', action='append', default=[],
+                            help='Date without slots as YYYY-MM-DD, may be repeated')
+
+    def handle(self, *args, **options):
+        doctors = User.objects.filter(role='doctor')
+        if options['doctor_id']:
+            doctors = doctors.filter(id=options['doctor_id'])
+        doctors = list(doctors[:2])
+        if not doctors:
+            raise CommandError('No doctor found. Create a doctor first.')
+        if len(doctors) > 1:
+            raise CommandError('Several doctors found. Choose one with --doctor-id.')
+        doctor = doctors[0]
+
+        try:
+            template = ScheduleTemplate.from_data(options)
+            start_date = parse_date_value(options['start_date']) if options['start_date'] else timezone.now().date()
+            if options['end_date']:
+                end_date = parse_date_value(options['end_date'])
+            else:
+                end_date = start_date + timedelta(weeks=options['weeks']) - timedelta(days=1)
+            result = generate_time_slots(doctor, template, start_date, end_date)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result['created']} of {result['generated']} time slots for {doctor.get_full_name()} "
+            f"from {result['start_date']} to {result['end_date']}"
+        ))
@@ -0,0 +1,64 @@
+import appointments.constraints
+import django.contrib.postgres.fields.ranges
+from django.db import migrations, models
+
+CANCELLED_STATUSES = ['cancelled', 'CANCELLED']
+
+
+def cancel_overlapping_appointments(apps, schema_editor):
+    """
+    Cancel the active appointments overlapping an earlier one of the same
+    doctor, which the exclusion constraint would reject, and report them.
+    """
+    # The constraint only exists on PostgreSQL
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Appointment = apps.get_model('appointments', 'Appointment')
+    rows = Appointment.objects.using(schema_editor.connection.alias).exclude(
+        status__in=CANCELLED_STATUSES
+    ).order_by('doctor_id', 'start_time', 'id').values_list('id', 'doctor_id', 'start_time', 'end_time', 'notes')
+
+    # Sweep each doctor's appointments by start time; one starting before the
+    # end of the last kept appointment overlaps it
+    overlapping = {}
+    kept_doctor, kept_id, kept_end = None, None, None
+    for appointment_id, doctor_id, start_time, end_time, notes in rows.iterator():
+        if doctor_id == kept_doctor and start_time < kept_end:
+            overlapping[appointment_id] = (kept_id, notes)
+        else:
+            kept_doctor, kept_id, kept_end = doctor_id, appointment_id, end_time
+
+    for appointment_id, (kept_id, notes) in overlapping.items():
+        note = f'Cancelled on migration: overlaps appointment {kept_id}'
+        Appointment.objects.using(schema_editor.connection.alias).filter(id=appointment_id).update(
+            status='cancelled',
+            notes=f'{notes}\n{note}' if notes else note
+        )
+        print(f'  Cancelled appointment {appointment_id}, which overlaps appointment {kept_id}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0003_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(cancel_overlapping_appointments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=appointments.constraints.PostgresExclusionConstraint(
+                condition=models.Q(('status__in', CANCELLED_STATUSES), _negated=True),
+                expressions=[
+                    (appointments.constraints.Int8Range(
+                        'doctor', 'doctor', django.contrib.postgres.fields.ranges.RangeBoundary(inclusive_upper=True)
+                    ), '='),
+                    (appointments.constraints.TsTzRange(
+                        'start_time', 'end_time', django.contrib.postgres.fields.ranges.RangeBoundary()
+                    ), '&&'),
+                ],
+                name='appointment_no_doctor_overlap',
+                violation_error_message='The doctor already has an appointment at this time'
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-17 06:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0004_appointment_no_overlap_constraint'),
+        ('patients', '0002_alter_patient_blood_type_alter_patient_user'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='reminder_sent_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Reminder Sent At'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('reminder_sent_at__isnull', True)), fields=['start_time', 'id'], name='appt_reminder_due_idx'),
+        ),
+    ]
@@ -1,9 +1,11 @@
+from django.contrib.postgres.fields import RangeBoundary, RangeOperators
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from accounts.models import User
 from patients.models import Patient
+from .constraints import Int8Range, PostgresExclusionConstraint, TsTzRange
 
 class TimeSlot(models.Model):
     """Model for defining available time slots for appointments"""
@@ -26,6 +28,14 @@ class TimeSlot(models.Model):
         verbose_name_plural = _('Time Slots')
         ordering = ['date', 'start_time']
         unique_together = ('doctor', 'date', 'start_time')
+        indexes = [
+            # Bookable slots of a doctor over a date range
+            models.Index(
+                fields=['doctor', 'date', 'start_time'],
+                condition=models.Q(is_available=True),
+                name='timeslot_available_idx'
+            ),
+        ]
     
     def __str__(self):
         return f"{self.doctor.get_full_name()} - {self.date} {self.start_time}-{self.end_time}"
@@ -67,4 +77,35 @@ class Appointment(models.Model):
     end_time = models.DateTimeField()
     status = models.CharField(max_length=10, choices=STATUS_CHOICES)
     notes = models.TextField(blank=True)
-    reason = models.CharField(max_length=255, blank=True, null=True, verbose_name=_('Reason'))
\ No newline at end of file
+    reason = models.CharField(max_length=255, blank=True, null=True, verbose_name=_('Reason'))
+    # Set when the reminder is claimed for sending, so it goes out at most once
+    reminder_sent_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Reminder Sent At'))
+    
+    class Meta:
+        indexes = [
+            # Doctor and patient feeds, paginated on (start_time, id)
+            models.Index(fields=['doctor', 'start_time', 'id'], name='appt_doctor_start_idx'),
+            models.Index(fields=['patient', 'start_time', 'id'], name='appt_patient_start_idx'),
+            # Secretary feed and day/window filters across all doctors
+            models.Index(fields=['start_time', 'id'], name='appt_start_idx'),
+            # Reminder scheduler: upcoming appointments still awaiting their reminder
+            models.Index(
+                fields=['start_time', 'id'],
+                condition=models.Q(reminder_sent_at__isnull=True),
+                name='appt_reminder_due_idx'
+            ),
+        ]
+        constraints = [
+            # No two active appointments of a doctor overlap. The doctor is
+            # compared as a single-point range so the GiST index only needs
+            # the built-in range operator class, not btree_gist
+            PostgresExclusionConstraint(
+                name='appointment_no_doctor_overlap',
+                expressions=[
+                    (Int8Range('doctor', 'doctor', RangeBoundary(inclusive_upper=True)), RangeOperators.EQUAL),
+                    (TsTzRange('start_time', 'end_time', RangeBoundary()), RangeOperators.OVERLAPS),
+                ],
+                condition=~models.Q(status__in=['cancelled', 'CANCELLED']),
+                violation_error_message=_('The doctor already has an appointment at this time'),
+            ),
+        ]
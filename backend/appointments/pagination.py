@@ -0,0 +1,103 @@
+import base64
+from datetime import datetime, time, timedelta
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+# Page size used when the client does not send ?limit=
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# Longest calendar window a single request may ask for
+MAX_CALENDAR_WINDOW = timedelta(days=366)
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+def encode_cursor(appointment):
+    """Encode the (start_time, id) position of an appointment as an opaque cursor"""
+    raw = f"{appointment.start_time.isoformat()}|{appointment.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Decode a cursor back into a (start_time, id) pair, raising ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        start_str, id_str = raw.split('|')
+        start_time = parse_datetime(start_str)
+        appointment_id = int(id_str)
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+    if start_time is None:
+        raise ValueError('Invalid cursor')
+    return start_time, appointment_id
+
+
+def parse_page_size(value):
+    """Parse the ?limit= parameter, clamped to MAX_PAGE_SIZE"""
+    if value in (None, ''):
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        limit = 0
+    if limit < 1:
+        raise ValueError('Limit must be a positive integer')
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def paginate_by_start_time(queryset, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Return one page of appointments ordered by (start_time, id) and the cursor
+    of the next page, or None when this is the last page.
+
+    The page is located with a keyset predicate rather than OFFSET, so the
+    cost of fetching any page is independent of how deep into the feed it is.
+    """
+    queryset = queryset.order_by('start_time', 'id')
+    if cursor:
+        start_time, appointment_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(start_time__gt=start_time) | Q(start_time=start_time, id__gt=appointment_id)
+        )
+
+    # Fetch one extra row to know whether another page exists
+    page = list(queryset[:limit + 1])
+    if len(page) > limit:
+        page = page[:limit]
+        return page, encode_cursor(page[-1])
+    return page, None
+
+
+def parse_window_bound(value):
+    """
+    Parse a calendar window bound as sent by FullCalendar, which is either a
+    date (YYYY-MM-DD) or an ISO 8601 datetime, into an aware datetime.
+    """
+    if not value:
+        raise ValueError('Missing window bound')
+    value = value.strip()
+    if 'T' in value:
+        # Query strings decode the '+' of a UTC offset to a space
+        value = value.replace(' ', '+')
+    bound = parse_datetime(value)
+    if bound is None:
+        parsed_date = parse_date(value)
+        if parsed_date is None:
+            raise ValueError('Invalid window bound')
+        bound = datetime.combine(parsed_date, time.min)
+    if timezone.is_naive(bound):
+        bound = timezone.make_aware(bound)
+    return bound
+
+
+def parse_calendar_window(start_value, end_value):
+    """Parse and validate the start/end window of a calendar request"""
+    window_start = parse_window_bound(start_value)
+    window_end = parse_window_bound(end_value)
+    if window_end <= window_start:
+        raise ValueError('End must be after start')
+    if window_end - window_start > MAX_CALENDAR_WINDOW:
+        raise ValueError('Calendar window is too large')
+    return window_start, window_end
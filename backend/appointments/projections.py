@@ -0,0 +1,92 @@
+from .models import Appointment
+
+# Columns needed to render an appointment in the list, calendar and detail
+# endpoints. Related rows are joined in the same SELECT so serializing a page
+# of appointments costs one query no matter how many rows it contains.
+APPOINTMENT_FIELDS = (
+    'id',
+    'start_time',
+    'end_time',
+    'status',
+    'reason',
+    'notes',
+    'patient_name',
+    'doctor',
+    'doctor__id',
+    'doctor__first_name',
+    'doctor__last_name',
+    'patient',
+    'patient__id',
+    'patient__user',
+    'patient__user__id',
+    'patient__user__first_name',
+    'patient__user__last_name',
+)
+
+
+def appointment_queryset():
+    """Base queryset for reading appointments with their doctor and patient"""
+    return Appointment.objects.select_related('doctor', 'patient__user').only(*APPOINTMENT_FIELDS)
+
+
+def appointments_for_user(user):
+    """Appointments visible to a user based on their role, or None for unknown roles"""
+    queryset = appointment_queryset()
+    if user.role == 'doctor':
+        # Doctors see their own appointments
+        return queryset.filter(doctor=user)
+    if user.role == 'patient':
+        # Patients see their own appointments
+        return queryset.filter(patient__user=user)
+    if user.role == 'secretary':
+        # Secretaries see all appointments
+        return queryset
+    return None
+
+
+def get_patient_name(appointment):
+    """Display name of the appointment's patient"""
+    if appointment.patient:
+        return f"{appointment.patient.user.first_name} {appointment.patient.user.last_name}"
+    return appointment.patient_name
+
+
+def get_doctor_name(appointment):
+    """Display name of the appointment's doctor"""
+    return f"{appointment.doctor.first_name} {appointment.doctor.last_name}"
+
+
+def serialize_appointment(appointment):
+    """Serialize an appointment for the list and detail endpoints"""
+    return {
+        'id': appointment.id,
+        'doctor_id': appointment.doctor.id,
+        'doctor_name': get_doctor_name(appointment),
+        'patient_id': appointment.patient.id if appointment.patient else None,
+        'patient_name': get_patient_name(appointment),
+        'start_time': appointment.start_time.strftime('%Y-%m-%d %H:%M'),
+        'end_time': appointment.end_time.strftime('%Y-%m-%d %H:%M'),
+        'reason': appointment.reason,
+        'notes': appointment.notes,
+        'status': appointment.status
+    }
+
+
+def serialize_calendar_event(appointment):
+    """Serialize an appointment as a calendar event"""
+    patient_name = get_patient_name(appointment)
+    return {
+        'id': appointment.id,
+        'title': f"{patient_name} - {appointment.reason}",
+        'start': appointment.start_time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'end': appointment.end_time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'extendedProps': {
+            'doctor_id': appointment.doctor.id,
+            'doctor_name': get_doctor_name(appointment),
+            'patient_id': appointment.patient.id if appointment.patient else None,
+            'patient_name': patient_name,
+            'reason': appointment.reason,
+            'notes': appointment.notes,
+            'status': appointment.status
+        }
+    }
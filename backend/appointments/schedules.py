@@ -0,0 +1,143 @@
+from datetime import datetime, timedelta
+from django.utils import timezone
+from .models import TimeSlot
+
+WEEKDAY_NAMES = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+# Upper bound on the span a single generation request may cover
+MAX_SCHEDULE_DAYS = 366
+
+
+def parse_time_value(value):
+    """Parse an HH:MM string into a time"""
+    try:
+        return datetime.strptime(str(value).strip(), '%H:%M').time()
+    except ValueError:
+        raise ValueError(f'Invalid time "{value}". Use HH:MM')
+
+
+def parse_date_value(value):
+    """Parse a YYYY-MM-DD string into a date"""
+    try:
+        return datetime.strptime(str(value).strip(), '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'Invalid date "{value}". Use YYYY-MM-DD')
+
+
+def parse_weekday(value):
+    """Parse a weekday given as 0-6 (Monday first) or as an English day name"""
+    if isinstance(value, str) and value.strip().lower() in WEEKDAY_NAMES:
+        return WEEKDAY_NAMES.index(value.strip().lower())
+    try:
+        weekday = int(value)
+    except (TypeError, ValueError):
+        weekday = -1
+    if not 0 <= weekday <= 6:
+        raise ValueError(f'Invalid weekday "{value}"')
+    return weekday
+
+
+def parse_time_range(value):
+    """Parse a {'start': 'HH:MM', 'end': 'HH:MM'} dict or an 'HH:MM-HH:MM' string"""
+    if isinstance(value, dict):
+        start, end = value.get('start'), value.get('end')
+    else:
+        start, _, end = str(value).partition('-')
+    start_time, end_time = parse_time_value(start), parse_time_value(end)
+    if start_time >= end_time:
+        raise ValueError(f'Range "{value}" must end after it starts')
+    return start_time, end_time
+
+
+class ScheduleTemplate:
+    """
+    Weekly recurring working hours of a doctor, cut into fixed-length slots.
+
+    Working hours repeat on the given weekdays; breaks remove any slot they
+    overlap, and exception dates (holidays, leave) produce no slots at all.
+    """
+
+    def __init__(self, weekdays, start_time, end_time, slot_minutes=30, breaks=None, exceptions=None):
+        if not weekdays:
+            raise ValueError('At least one weekday is required')
+        if start_time >= end_time:
+            raise ValueError('End time must be after start time')
+        if slot_minutes <= 0:
+            raise ValueError('Slot length must be a positive number of minutes')
+        self.weekdays = set(weekdays)
+        self.start_time = start_time
+        self.end_time = end_time
+        self.slot_length = timedelta(minutes=slot_minutes)
+        self.breaks = sorted(breaks or [])
+        self.exceptions = set(exceptions or [])
+
+    @classmethod
+    def from_data(cls, data):
+        """Build a template from request data or command options"""
+        try:
+            slot_minutes = int(data.get('slot_minutes', 30))
+        except (TypeError, ValueError):
+            raise ValueError('Slot length must be a positive number of minutes')
+        return cls(
+            weekdays=[parse_weekday(day) for day in data.get('weekdays') or range(5)],
+            start_time=parse_time_value(data.get('start_time', '09:00')),
+            end_time=parse_time_value(data.get('end_time', '17:00')),
+            slot_minutes=slot_minutes,
+            breaks=[parse_time_range(value) for value in data.get('breaks') or []],
+            exceptions=[parse_date_value(value) for value in data.get('exceptions') or []],
+        )
+
+    def slot_times(self, day):
+        """Yield the (start, end) times of the slots on a given day"""
+        if day.weekday() not in self.weekdays or day in self.exceptions:
+            return
+        current = datetime.combine(day, self.start_time)
+        day_end = datetime.combine(day, self.end_time)
+        while current + self.slot_length <= day_end:
+            slot_start, slot_end = current.time(), (current + self.slot_length).time()
+            current += self.slot_length
+            if any(slot_start < break_end and break_start < slot_end for break_start, break_end in self.breaks):
+                continue
+            yield slot_start, slot_end
+
+    def iter_slots(self, doctor, start_date, end_date):
+        """Yield unsaved TimeSlot instances for every slot between two dates (inclusive)"""
+        day = start_date
+        while day <= end_date:
+            for slot_start, slot_end in self.slot_times(day):
+                yield TimeSlot(
+                    doctor=doctor,
+                    date=day,
+                    start_time=slot_start,
+                    end_time=slot_end,
+                    is_available=True
+                )
+            day += timedelta(days=1)
+
+
+def generate_time_slots(doctor, template, start_date, end_date):
+    """
+    Materialize a schedule template into TimeSlot rows with a single bulk
+    insert. Slots that already exist for the doctor at the same date and
+    start time are left untouched thanks to the unique constraint.
+
+    Returns a dict with the number of slots generated and actually created.
+    """
+    # Time slots cannot be created in the past
+    start_date = max(start_date, timezone.now().date())
+    if end_date < start_date:
+        raise ValueError('End date must not be before start date or today')
+    if (end_date - start_date).days >= MAX_SCHEDULE_DAYS:
+        raise ValueError(f'A schedule can cover at most {MAX_SCHEDULE_DAYS} days')
+
+    slots = list(template.iter_slots(doctor, start_date, end_date))
+    existing = TimeSlot.objects.filter(doctor=doctor, date__gte=start_date, date__lte=end_date)
+    count_before = existing.count()
+    TimeSlot.objects.bulk_create(slots, ignore_conflicts=True)
+
+    return {
+        'generated': len(slots),
+        'created': existing.count() - count_before,
+        'start_date': start_date,
+        'end_date': end_date,
+    }
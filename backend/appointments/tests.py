@@ -1,3 +1,409 @@
-from django.test import TestCase
+import threading
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from accounts.models import User
+from patients.models import Patient
+from .models import Appointment, TimeSlot
+from .pagination import NEXT_CURSOR_HEADER
+from .availability import IntervalIndex
+from .booking import BookingConflict, book_appointment, update_appointment
+from .schedules import ScheduleTemplate, generate_time_slots, parse_time_value
+from .management.commands.check_query_plans import SEQ_SCAN_PATTERNS
 
-# Create your tests here.
+
+class AppointmentAPITestCase(TestCase):
+    """Shared fixtures for the appointment endpoint tests"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(
+            email='doctor@example.com', password='pass', role='doctor',
+            first_name='Greg', last_name='House'
+        )
+        cls.secretary = User.objects.create_user(
+            email='secretary@example.com', password='pass', role='secretary'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.secretary)
+        self.created = 0
+
+    def create_appointments(self, count):
+        start = timezone.now() + timedelta(days=1)
+        for _ in range(count):
+            self.created += 1
+            patient_user = User.objects.create_user(
+                email=f'patient{self.created}@example.com', password='pass',
+                role='patient', first_name='Patient', last_name=str(self.created)
+            )
+            Appointment.objects.create(
+                patient=Patient.objects.create(user=patient_user),
+                doctor=self.doctor,
+                start_time=start + timedelta(hours=self.created),
+                end_time=start + timedelta(hours=self.created, minutes=30),
+                status='scheduled',
+                reason='Checkup'
+            )
+
+
+class AppointmentQueryCountTests(AppointmentAPITestCase):
+    """The appointment feeds must not issue extra queries per row"""
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context), response
+
+    def assert_constant_queries(self, url):
+        self.create_appointments(1)
+        small_count, _ = self.count_queries(url)
+        self.create_appointments(25)
+        large_count, response = self.count_queries(url)
+        self.assertEqual(small_count, large_count)
+        return response
+
+    def test_list_query_count_is_constant(self):
+        response = self.assert_constant_queries(reverse('get_appointments'))
+        self.assertEqual(len(response.data), 26)
+        self.assertEqual(response.data[0]['doctor_name'], 'Greg House')
+
+    def test_calendar_query_count_is_constant(self):
+        today = timezone.now().date()
+        url = f"{reverse('get_calendar_appointments')}?start={today}&end={today + timedelta(days=7)}"
+        response = self.assert_constant_queries(url)
+        self.assertEqual(len(response.data), 26)
+        self.assertTrue(response.data[0]['title'].startswith('Patient '))
+
+    def test_detail_uses_single_query(self):
+        self.create_appointments(1)
+        appointment = Appointment.objects.get()
+        url = reverse('appointment_detail', args=[appointment.id])
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.data['patient_name'], 'Patient 1')
+
+
+class AppointmentFeedPaginationTests(AppointmentAPITestCase):
+    """Keyset pagination of the list feed and windowing of the calendar feed"""
+
+    def test_cursor_walks_every_appointment_once(self):
+        self.create_appointments(7)
+        url = reverse('get_appointments')
+        seen = []
+        cursor = None
+        while True:
+            params = {'limit': 3}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data), 3)
+            seen.extend(appointment['id'] for appointment in response.data)
+            cursor = response.get(NEXT_CURSOR_HEADER)
+            if not cursor:
+                break
+        expected = list(Appointment.objects.order_by('start_time', 'id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_feed_is_paginated_by_default(self):
+        self.create_appointments(5)
+        url = reverse('get_appointments')
+        with mock.patch('appointments.pagination.DEFAULT_PAGE_SIZE', 2):
+            response = self.client.get(url)
+            self.assertEqual(len(response.data), 2)
+            response = self.client.get(url, {'cursor': response[NEXT_CURSOR_HEADER]})
+            self.assertEqual(len(response.data), 2)
+            self.assertIn(NEXT_CURSOR_HEADER, response)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse('get_appointments'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_calendar_requires_window(self):
+        response = self.client.get(reverse('get_calendar_appointments'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_calendar_only_returns_window(self):
+        self.create_appointments(3)
+        first = Appointment.objects.order_by('start_time').first()
+        window_start = first.start_time - timedelta(minutes=1)
+        response = self.client.get(reverse('get_calendar_appointments'), {
+            'start': window_start.isoformat(),
+            'end': (window_start + timedelta(minutes=30)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([event['id'] for event in response.data], [first.id])
+
+
+    def test_calendar_includes_appointment_started_before_window(self):
+        self.create_appointments(2)
+        first, second = Appointment.objects.order_by('start_time')
+        window_start = first.start_time + timedelta(minutes=15)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('get_calendar_appointments'), {
+                'start': window_start.isoformat(),
+                'end': (window_start + timedelta(minutes=30)).isoformat(),
+            })
+        self.assertEqual([event['id'] for event in response.data], [first.id])
+        # start_time is bounded below as well as above
+        query = next(query['sql'] for query in context.captured_queries if 'appointments_appointment' in query['sql'])
+        self.assertEqual(query.count('"start_time" >'), 1)
+
+    def test_booking_longer_than_a_day_is_rejected(self):
+        start = timezone.now() + timedelta(days=1)
+        patient = Patient.objects.create(user=User.objects.create_user(
+            email='long@example.com', password='pass', role='patient'
+        ))
+        with self.assertRaises(ValidationError):
+            book_appointment({
+                'doctor': self.doctor, 'patient': patient, 'reason': 'Surgery', 'notes': '',
+                'status': 'scheduled', 'start_time': start, 'end_time': start + timedelta(days=2),
+            })
+        self.assertFalse(Appointment.objects.exists())
+
+
+class ScheduleGenerationTests(AppointmentAPITestCase):
+    """Bulk materialization of recurring schedule templates"""
+
+    def test_template_honors_breaks_and_exceptions(self):
+        monday = timezone.now().date() + timedelta(days=7 - timezone.now().weekday())
+        template = ScheduleTemplate.from_data({
+            'weekdays': ['monday', 'tuesday'],
+            'start_time': '09:00',
+            'end_time': '12:00',
+            'slot_minutes': 30,
+            'breaks': ['10:00-10:30'],
+            'exceptions': [str(monday + timedelta(days=1))],
+        })
+        result = generate_time_slots(self.doctor, template, monday, monday + timedelta(days=6))
+        self.assertEqual(result['created'], 5)
+        starts = list(TimeSlot.objects.values_list('start_time', flat=True))
+        self.assertNotIn(parse_time_value('10:00'), starts)
+
+    def test_generation_is_one_insert_and_idempotent(self):
+        start = timezone.now().date() + timedelta(days=1)
+        template = ScheduleTemplate.from_data({'weekdays': range(7)})
+        with CaptureQueriesContext(connection) as context:
+            first = generate_time_slots(self.doctor, template, start, start + timedelta(days=90))
+        inserts = [query for query in context.captured_queries if query['sql'].startswith('INSERT')]
+        if connection.features.max_query_params is None:
+            self.assertEqual(len(inserts), 1)
+        self.assertEqual(first['created'], 91 * 16)
+        second = generate_time_slots(self.doctor, template, start, start + timedelta(days=90))
+        self.assertEqual(second['created'], 0)
+
+    def test_generate_endpoint(self):
+        start = timezone.now().date() + timedelta(days=1)
+        response = self.client.post(reverse('generate_time_slots'), {
+            'doctor_id': self.doctor.id,
+            'start_date': str(start),
+            'end_date': str(start + timedelta(days=6)),
+            'weekdays': [0, 1, 2, 3, 4],
+            'slot_minutes': 60,
+            'breaks': [{'start': '12:00', 'end': '13:00'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 5 * 7)
+
+    def test_command_needs_doctor_id_when_several_doctors_exist(self):
+        # User.save allows one doctor, but older databases may hold several
+        User.objects.filter(id=self.secretary.id).update(role='doctor')
+        with self.assertRaises(CommandError):
+            call_command('generate_timeslots', '--weeks', '1', stdout=StringIO())
+        self.assertFalse(TimeSlot.objects.exists())
+
+        out = StringIO()
+        call_command('generate_timeslots', '--doctor-id', str(self.doctor.id), '--weeks', '1', stdout=out)
+        self.assertIn('Greg House', out.getvalue())
+        self.assertEqual(set(TimeSlot.objects.values_list('doctor_id', flat=True)), {self.doctor.id})
+
+
+class AvailabilityEngineTests(AppointmentAPITestCase):
+    """Free interval lookups and double booking protection"""
+
+    def test_interval_index_merges_and_finds_gaps(self):
+        index = IntervalIndex([(1, 3), (2, 4), (6, 7), (7, 8)])
+        self.assertEqual(len(index), 2)
+        self.assertTrue(index.overlaps(3, 5))
+        self.assertFalse(index.overlaps(4, 6))
+        self.assertTrue(index.covers(6, 8))
+        self.assertEqual(list(index.gaps(0, 10)), [(0, 1), (4, 6), (8, 10)])
+
+    def test_booked_slot_is_hidden_and_free_intervals_exclude_it(self):
+        day = timezone.now().date() + timedelta(days=1)
+        template = ScheduleTemplate.from_data({'weekdays': range(7), 'start_time': '09:00', 'end_time': '11:00'})
+        generate_time_slots(self.doctor, template, day, day)
+        self.client.force_authenticate(user=self.doctor)
+        self.create_patient_and_book(day, '09:30')
+
+        url = reverse('available_time_slots')
+        response = self.client.get(url, {'doctor_id': self.doctor.id, 'date': str(day)})
+        self.assertEqual([slot['start_time'] for slot in response.data], ['09:00', '10:00', '10:30'])
+
+        response = self.client.get(url, {'doctor_id': self.doctor.id, 'date': str(day), 'mode': 'intervals'})
+        self.assertEqual([(interval['start'][11:16], interval['end'][11:16]) for interval in response.data],
+                         [('09:00', '09:30'), ('10:00', '11:00')])
+
+    def test_availability_loads_slots_once(self):
+        day = timezone.now().date() + timedelta(days=1)
+        template = ScheduleTemplate.from_data({'weekdays': range(7), 'start_time': '09:00', 'end_time': '11:00'})
+        generate_time_slots(self.doctor, template, day, day + timedelta(days=1))
+        TimeSlot.objects.filter(date=day, start_time=parse_time_value('09:00')).update(is_available=False)
+        self.client.force_authenticate(user=self.doctor)
+        self.create_patient_and_book(day, '10:00')
+
+        url = reverse('available_time_slots')
+        # The doctor, then the slots and the appointments the engine loads
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {'doctor_id': self.doctor.id, 'date': str(day)})
+        self.assertEqual([slot['start_time'] for slot in response.data], ['09:30', '10:30'])
+
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {
+                'doctor_id': self.doctor.id, 'date': str(day), 'include_unavailable': 'true'
+            })
+        self.assertEqual([(slot['start_time'], slot['is_available']) for slot in response.data],
+                         [('09:00', False), ('09:30', True), ('10:00', False), ('10:30', True)])
+
+    def test_overlapping_booking_is_rejected(self):
+        day = timezone.now().date() + timedelta(days=1)
+        self.client.force_authenticate(user=self.doctor)
+        self.assertEqual(self.create_patient_and_book(day, '14:00').status_code, 201)
+        self.assertEqual(self.create_patient_and_book(day, '14:15').status_code, 409)
+        self.assertEqual(self.create_patient_and_book(day, '14:30').status_code, 201)
+
+    def test_reactivating_over_a_booking_is_rejected(self):
+        day = timezone.now().date() + timedelta(days=1)
+        self.client.force_authenticate(user=self.doctor)
+        first_id = self.create_patient_and_book(day, '14:00').data['id']
+        url = reverse('appointment_detail', args=[first_id])
+        self.assertEqual(self.client.put(url, {'status': 'cancelled'}, format='json').status_code, 200)
+        self.assertEqual(self.create_patient_and_book(day, '14:15').status_code, 201)
+
+        response = self.client.put(url, {'status': 'scheduled'}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Appointment.objects.get(id=first_id).status, 'cancelled')
+        # Other updates of the cancelled appointment still go through
+        self.assertEqual(self.client.put(url, {'notes': 'Rebooked later'}, format='json').status_code, 200)
+
+    def create_patient_and_book(self, day, specific_time):
+        self.created += 1
+        patient_user = User.objects.create_user(
+            email=f'booker{self.created}@example.com', password='pass', role='patient'
+        )
+        return self.client.post(reverse('create_appointment'), {
+            'doctor_id': self.doctor.id,
+            'patient_id': patient_user.id,
+            'reason': 'Checkup',
+            'specific_time': specific_time,
+            'date': str(day),
+        }, format='json')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Exclusion constraints are PostgreSQL only')
+class OverlapConstraintTests(AppointmentAPITestCase):
+    """The database rejects overlapping active appointments of a doctor"""
+
+    def create_appointment(self, start, minutes=30, status='scheduled'):
+        self.created += 1
+        patient_user = User.objects.create_user(
+            email=f'overlap{self.created}@example.com', password='pass', role='patient'
+        )
+        return Appointment.objects.create(
+            patient=Patient.objects.create(user=patient_user), doctor=self.doctor, status=status,
+            start_time=start, end_time=start + timedelta(minutes=minutes)
+        )
+
+    def test_overlapping_appointment_is_rejected(self):
+        start = timezone.now() + timedelta(days=1)
+        self.create_appointment(start)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.create_appointment(start + timedelta(minutes=15))
+        # Back-to-back and cancelled appointments do not conflict
+        self.create_appointment(start + timedelta(minutes=30))
+        self.create_appointment(start, status='cancelled')
+
+    def test_constraint_violation_on_update_is_a_conflict(self):
+        start = timezone.now() + timedelta(days=1)
+        self.create_appointment(start)
+        cancelled = self.create_appointment(start, status='cancelled')
+        # Without the overlap check, the constraint still catches the overlap
+        with mock.patch('appointments.booking.conflicting_appointments', return_value=Appointment.objects.none()):
+            with self.assertRaises(BookingConflict):
+                update_appointment(cancelled, 'scheduled')
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentBookingTests(TransactionTestCase):
+    """Hundreds of simultaneous bookings of one slot must yield one appointment"""
+
+    # Threads hold one connection each; stay below PostgreSQL's default max_connections
+    THREADS = 50
+    BOOKINGS_PER_THREAD = 4
+
+    def test_only_one_concurrent_booking_wins(self):
+        doctor = User.objects.create_user(email='doctor@example.com', password='pass', role='doctor')
+        patient = Patient.objects.create(
+            user=User.objects.create_user(email='patient@example.com', password='pass', role='patient')
+        )
+        day = timezone.now().date() + timedelta(days=1)
+        slot = TimeSlot.objects.create(
+            doctor=doctor, date=day, start_time=parse_time_value('09:00'), end_time=parse_time_value('09:30')
+        )
+        barrier = threading.Barrier(self.THREADS)
+        outcomes = []
+
+        def book():
+            barrier.wait()
+            try:
+                for _ in range(self.BOOKINGS_PER_THREAD):
+                    try:
+                        book_appointment({
+                            'doctor': doctor,
+                            'patient': patient,
+                            'reason': 'Checkup',
+                            'notes': '',
+                            'status': 'scheduled',
+                            'start_time': datetime.combine(day, slot.start_time),
+                            'end_time': datetime.combine(day, slot.end_time),
+                        }, TimeSlot.objects.get(id=slot.id))
+                        outcomes.append('booked')
+                    except BookingConflict:
+                        outcomes.append('rejected')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=book) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(outcomes), self.THREADS * self.BOOKINGS_PER_THREAD)
+        self.assertEqual(outcomes.count('booked'), 1)
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertFalse(TimeSlot.objects.get(id=slot.id).is_available)
+
+
+class QueryPlanCheckTests(SimpleTestCase):
+    """check_query_plans only reports plans that read a whole table"""
+
+    def test_sqlite_index_scans_are_not_table_scans(self):
+        plan = '\n'.join([
+            'SCAN appointments_appointment USING INDEX appt_start_idx',
+            'SCAN notifications_notification USING COVERING INDEX notif_user_id_idx',
+            'SEARCH appointments_timeslot USING INDEX appointments_timeslot_doctor_id (doctor_id=?)',
+            'SCAN medical_inventory_inventoryitem',
+        ])
+        self.assertEqual(SEQ_SCAN_PATTERNS['sqlite'].findall(plan), ['medical_inventory_inventoryitem'])
@@ -5,6 +5,7 @@ urlpatterns = [
     # TimeSlot endpoints
     path('timeslots/', views.available_time_slots, name='available_time_slots'),
     path('timeslots/create/', views.create_time_slot, name='create_time_slot'),
+    path('timeslots/generate/', views.generate_time_slots_view, name='generate_time_slots'),
     path('timeslots/<int:time_slot_id>/', views.time_slot_detail, name='time_slot_detail'),
     
     # Appointment endpoints
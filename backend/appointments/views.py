@@ -11,11 +11,19 @@ from rest_framework.permissions import IsAuthenticated
 from .models import Appointment, TimeSlot
 from accounts.models import User
 from patients.models import Patient
-from notifications.services import send_appointment_confirmation, send_appointment_reminder
 from accounts.permissions import IsDoctor, IsSecretary, IsPatient, CanManageAppointments
 from datetime import datetime, timedelta, date, time, time
 from django.core.exceptions import ValidationError
 from .calendar import generate_ical
+from .projections import (
+    appointment_queryset, appointments_for_user, serialize_appointment, serialize_calendar_event
+)
+from .availability import AvailabilityEngine, date_range_bounds, slot_interval
+from .booking import MAX_APPOINTMENT_DURATION, BookingConflict, book_appointment, update_appointment
+from .schedules import ScheduleTemplate, generate_time_slots, parse_date_value
+from .pagination import (
+    NEXT_CURSOR_HEADER, paginate_by_start_time, parse_calendar_window, parse_page_size
+)
 
 # TimeSlot views
 @api_view(['GET'])
@@ -55,31 +63,35 @@ def available_time_slots(request):
             'error': _('Invalid date format. Use YYYY-MM-DD')
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    # Build query for time slots
-    query = {
-        'doctor': doctor,
-        'date__gte': start_date,
-        'date__lte': end_date
-    }
+    # Load the doctor's slots and booked appointments over the range
+    range_start, range_end = date_range_bounds(start_date, end_date)
+    availability = AvailabilityEngine.load(doctor, range_start, range_end, include_unavailable)
     
-    # Only include available slots if specified
-    if not include_unavailable:
-        query['is_available'] = True
+    # Return the free intervals instead of individual slots if requested
+    if request.query_params.get('mode') == 'intervals':
+        free_intervals = [{
+            'start': timezone.localtime(interval_start).strftime('%Y-%m-%dT%H:%M:%S'),
+            'end': timezone.localtime(interval_end).strftime('%Y-%m-%dT%H:%M:%S')
+        } for interval_start, interval_end in availability.free_intervals(range_start, range_end)]
+        return Response(free_intervals, status=status.HTTP_200_OK)
     
-    # Get time slots
-    time_slots = TimeSlot.objects.filter(**query).order_by('date', 'start_time')
-    
-    # Serialize the time slots
+    # Serialize the time slots, marking slots overlapped by an appointment as unavailable
+    doctor_name = f"{doctor.first_name} {doctor.last_name}"
     time_slots_data = []
-    for slot in time_slots:
+    for slot in availability.slots:
+        is_available = slot['is_available'] and not availability.is_booked(
+            *slot_interval(slot['date'], slot['start_time'], slot['end_time'])
+        )
+        if not is_available and not include_unavailable:
+            continue
         time_slots_data.append({
-            'id': slot.id,
-            'doctor_id': slot.doctor.id,
-            'doctor_name': f"{slot.doctor.first_name} {slot.doctor.last_name}",
-            'date': slot.date.strftime('%Y-%m-%d'),
-            'start_time': slot.start_time.strftime('%H:%M'),
-            'end_time': slot.end_time.strftime('%H:%M'),
-            'is_available': slot.is_available
+            'id': slot['id'],
+            'doctor_id': doctor.id,
+            'doctor_name': doctor_name,
+            'date': slot['date'].strftime('%Y-%m-%d'),
+            'start_time': slot['start_time'].strftime('%H:%M'),
+            'end_time': slot['end_time'].strftime('%H:%M'),
+            'is_available': is_available
         })
     
     print(f"DEBUG - Found {len(time_slots_data)} time slots")
@@ -142,6 +154,59 @@ def create_time_slot(request):
         'id': time_slot.id
     }, status=status.HTTP_201_CREATED)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, CanManageAppointments])
+def generate_time_slots_view(request):
+    """Generate recurring time slots for a doctor from a weekly schedule template"""
+    user = request.user
+    
+    # Only doctors and secretaries can create time slots
+    if user.role not in ['doctor', 'secretary']:
+        return Response({
+            'error': _('Only doctors and secretaries can create time slots')
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    # Get data from request
+    doctor_id = request.data.get('doctor_id')
+    start_date_str = request.data.get('start_date')
+    end_date_str = request.data.get('end_date')
+    
+    # Validate required fields
+    if not all([doctor_id, start_date_str, end_date_str]):
+        return Response({
+            'error': _('Please provide doctor_id, start_date and end_date')
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Get the doctor
+    try:
+        doctor = User.objects.get(id=doctor_id, role='doctor')
+    except User.DoesNotExist:
+        return Response({
+            'error': _('Doctor not found')
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    # Parse the template and materialize it
+    try:
+        template = ScheduleTemplate.from_data(request.data)
+        result = generate_time_slots(
+            doctor,
+            template,
+            parse_date_value(start_date_str),
+            parse_date_value(end_date_str)
+        )
+    except ValueError as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'success': _('Time slots generated successfully'),
+        'generated': result['generated'],
+        'created': result['created'],
+        'start_date': result['start_date'].strftime('%Y-%m-%d'),
+        'end_date': result['end_date'].strftime('%Y-%m-%d')
+    }, status=status.HTTP_201_CREATED)
+
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticated, CanManageAppointments])
 def time_slot_detail(request, time_slot_id):
@@ -366,23 +431,20 @@ def create_appointment(request):
                 'error': _('Either time slot or specific time with date must be provided')
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        appointment = Appointment(**appointment_data)
-        appointment.save()
-        
-        # Mark time slot as unavailable if we used one
-        if time_slot:
-            time_slot.is_available = False
-            time_slot.save()
-        
-        # Send appointment confirmation via SMS and email
-        notification_result = send_appointment_confirmation(appointment)
+        # Atomically claim the time slot (if any) and create the appointment
+        try:
+            appointment = book_appointment(appointment_data, time_slot)
+        except BookingConflict as e:
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_409_CONFLICT)
         
+        # The SMS and email confirmation was queued with the appointment
         return Response({
             'success': _('Appointment scheduled successfully'),
             'id': appointment.id,
             'notifications': {
-                'email_sent': notification_result.get('email', False),
-                'sms_sent': notification_result.get('sms', {}).get('success', False) if notification_result.get('sms') else False
+                'queued': True
             }
         }, status=status.HTTP_201_CREATED)
         
@@ -567,24 +629,20 @@ def create_appointment_patient(request):
                 'error': _('Either time slot or specific time with date must be provided')
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Create the appointment
-        appointment = Appointment(**appointment_data)
-        appointment.save()
-        
-        # Mark time slot as unavailable if we used one
-        if time_slot:
-            time_slot.is_available = False
-            time_slot.save()
-        
-        # Send appointment confirmation via SMS and email
-        notification_result = send_appointment_confirmation(appointment)
+        # Atomically claim the time slot (if any) and create the appointment
+        try:
+            appointment = book_appointment(appointment_data, time_slot)
+        except BookingConflict as e:
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_409_CONFLICT)
         
+        # The SMS and email confirmation was queued with the appointment
         return Response({
             'success': _('Appointment scheduled successfully'),
             'id': appointment.id,
             'notifications': {
-                'email_sent': notification_result.get('email', False),
-                'sms_sent': notification_result.get('sms', {}).get('success', False) if notification_result.get('sms') else False
+                'queued': True
             }
         }, status=status.HTTP_201_CREATED)
         
@@ -606,16 +664,8 @@ def get_appointments(request):
     user = request.user
     
     # Filter appointments based on user role
-    if user.role == 'doctor':
-        # Doctors see their own appointments
-        appointments = Appointment.objects.filter(doctor=user)
-    elif user.role == 'patient':
-        # Patients see their own appointments
-        appointments = Appointment.objects.filter(patient=user)
-    elif user.role == 'secretary':
-        # Secretaries see all appointments
-        appointments = Appointment.objects.all()
-    else:
+    appointments = appointments_for_user(user)
+    if appointments is None:
         return Response({
             'error': _('Invalid user role')
         }, status=status.HTTP_403_FORBIDDEN)
@@ -637,7 +687,7 @@ def get_appointments(request):
     if patient_id:
         try:
             patient = User.objects.get(id=patient_id, role='patient')
-            appointments = appointments.filter(patient=patient)
+            appointments = appointments.filter(patient__user=patient)
         except User.DoesNotExist:
             return Response({
                 'error': _('Patient not found')
@@ -646,29 +696,36 @@ def get_appointments(request):
     if date_str:
         try:
             selected_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-            appointments = appointments.filter(start_time__date=selected_date)
+            # Filter on a start_time range rather than start_time__date so the
+            # lookup can use the start_time indexes
+            day_start = timezone.make_aware(datetime.combine(selected_date, time.min))
+            appointments = appointments.filter(
+                start_time__gte=day_start,
+                start_time__lt=day_start + timedelta(days=1)
+            )
         except ValueError:
             return Response({
                 'error': _('Invalid date format. Use YYYY-MM-DD')
             }, status=status.HTTP_400_BAD_REQUEST)
     
+    # Fetch one keyset page ordered by (start_time, id)
+    try:
+        limit = parse_page_size(request.query_params.get('limit'))
+        page, next_cursor = paginate_by_start_time(
+            appointments, request.query_params.get('cursor'), limit
+        )
+    except ValueError as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
     # Serialize the appointments
-    appointments_data = []
-    for appointment in appointments:
-        appointments_data.append({
-            'id': appointment.id,
-            'doctor_id': appointment.doctor.id,
-            'doctor_name': f"{appointment.doctor.first_name} {appointment.doctor.last_name}",
-            'patient_id': appointment.patient.id if appointment.patient else None,
-            'patient_name': f"{appointment.patient.user.first_name} {appointment.patient.user.last_name}" if appointment.patient else appointment.patient_name,
-            'start_time': appointment.start_time.strftime('%Y-%m-%d %H:%M'),
-            'end_time': appointment.end_time.strftime('%Y-%m-%d %H:%M'),
-            'reason': appointment.reason,
-            'notes': appointment.notes,
-            'status': appointment.status
-        })
+    appointments_data = [serialize_appointment(appointment) for appointment in page]
     
-    return Response(appointments_data, status=status.HTTP_200_OK)
+    response = Response(appointments_data, status=status.HTTP_200_OK)
+    if next_cursor:
+        response[NEXT_CURSOR_HEADER] = next_cursor
+    return response
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -677,41 +734,36 @@ def get_calendar_appointments(request):
     user = request.user
     
     # Filter appointments based on user role
-    if user.role == 'doctor':
-        # Doctors see their own appointments
-        appointments = Appointment.objects.filter(doctor=user)
-    elif user.role == 'patient':
-        # Patients see their own appointments
-        appointments = Appointment.objects.filter(patient=user)
-    elif user.role == 'secretary':
-        # Secretaries see all appointments
-        appointments = Appointment.objects.all()
-    else:
+    appointments = appointments_for_user(user)
+    if appointments is None:
         return Response({
             'error': _('Invalid user role')
         }, status=status.HTTP_403_FORBIDDEN)
     
+    # Only return appointments overlapping the requested window
+    start_str = request.query_params.get('start')
+    end_str = request.query_params.get('end')
+    if not start_str or not end_str:
+        return Response({
+            'error': _('Please provide start and end parameters')
+        }, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        window_start, window_end = parse_calendar_window(start_str, end_str)
+    except ValueError as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    # The lower bound on start_time keeps the index range scan to the window;
+    # end_time then picks the appointments actually overlapping it
+    appointments = appointments.filter(
+        start_time__gt=window_start - MAX_APPOINTMENT_DURATION,
+        start_time__lt=window_end,
+        end_time__gt=window_start
+    ).order_by('start_time', 'id')
+    
     # Format appointments for calendar
-    calendar_events = []
-    for appointment in appointments:
-        patient_name = f"{appointment.patient.first_name} {appointment.patient.last_name}" if appointment.patient else appointment.patient_name
-        doctor_name = f"{appointment.doctor.first_name} {appointment.doctor.last_name}"
-        
-        calendar_events.append({
-            'id': appointment.id,
-            'title': f"{patient_name} - {appointment.reason}",
-            'start': appointment.start_time.strftime('%Y-%m-%dT%H:%M:%S'),
-            'end': appointment.end_time.strftime('%Y-%m-%dT%H:%M:%S'),
-            'extendedProps': {
-                'doctor_id': appointment.doctor.id,
-                'doctor_name': doctor_name,
-                'patient_id': appointment.patient.id if appointment.patient else None,
-                'patient_name': patient_name,
-                'reason': appointment.reason,
-                'notes': appointment.notes,
-                'status': appointment.status
-            }
-        })
+    calendar_events = [serialize_calendar_event(appointment) for appointment in appointments]
     
     return Response(calendar_events, status=status.HTTP_200_OK)
 
@@ -723,7 +775,7 @@ def appointment_detail(request, appointment_id):
     
     # Get the appointment
     try:
-        appointment = Appointment.objects.get(id=appointment_id)
+        appointment = appointment_queryset().get(id=appointment_id)
     except Appointment.DoesNotExist:
         return Response({
             'error': _('Appointment not found')
@@ -734,25 +786,14 @@ def appointment_detail(request, appointment_id):
         return Response({
             'error': _('You can only access your own appointments')
         }, status=status.HTTP_403_FORBIDDEN)
-    elif user.role == 'patient' and (not appointment.patient or appointment.patient.id != user.id):
+    elif user.role == 'patient' and (not appointment.patient or appointment.patient.user.id != user.id):
         return Response({
             'error': _('You can only access your own appointments')
         }, status=status.HTTP_403_FORBIDDEN)
     
     # GET request - return the appointment details
     if request.method == 'GET':
-        appointment_data = {
-            'id': appointment.id,
-            'doctor_id': appointment.doctor.id,
-            'doctor_name': f"{appointment.doctor.first_name} {appointment.doctor.last_name}",
-            'patient_id': appointment.patient.id if appointment.patient else None,
-            'patient_name': f"{appointment.patient.user.first_name} {appointment.patient.user.last_name}" if appointment.patient else appointment.patient_name,
-            'start_time': appointment.start_time.strftime('%Y-%m-%d %H:%M'),
-            'end_time': appointment.end_time.strftime('%Y-%m-%d %H:%M'),
-            'reason': appointment.reason,
-            'notes': appointment.notes,
-            'status': appointment.status
-        }
+        appointment_data = serialize_appointment(appointment)
         return Response(appointment_data, status=status.HTTP_200_OK)
     
     # PUT request - update the appointment
@@ -767,13 +808,13 @@ def appointment_detail(request, appointment_id):
         status_value = request.data.get('status')
         notes = request.data.get('notes')
         
-        # Update the appointment
-        if status_value:
-            appointment.status = status_value
-        if notes:
-            appointment.notes = notes
-        
-        appointment.save()
+        # Update the appointment; reactivating a cancelled one checks for overlaps
+        try:
+            update_appointment(appointment, status_value, notes)
+        except BookingConflict as e:
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_409_CONFLICT)
         
         return Response({
             'success': _('Appointment updated successfully')
@@ -988,26 +1029,21 @@ def create_appointment(request):
                 'error': _('Either time slot or specific time with date must be provided')
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Create and save the appointment
-        appointment = Appointment(**appointment_data)
-        appointment.save()
-        
-        # Mark time slot as unavailable if we used one from the database
-        if time_slot and not isinstance(time_slot_id, str):
-            time_slot.is_available = False
-            time_slot.save()
-        
-        # Send appointment confirmation
+        # Atomically claim the time slot (if any) and create the appointment
         try:
-            notification_result = send_appointment_confirmation(appointment)
-        except Exception as e:
-            notification_result = {'error': str(e)}
-            print(f"Error sending notification: {str(e)}")
+            appointment = book_appointment(appointment_data, time_slot)
+        except BookingConflict as e:
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_409_CONFLICT)
         
+        # The SMS and email confirmation was queued with the appointment
         return Response({
             'success': _('Appointment scheduled successfully'),
             'id': appointment.id,
-            'notifications': notification_result
+            'notifications': {
+                'queued': True
+            }
         }, status=status.HTTP_201_CREATED)
         
     except ValidationError as e:
@@ -1166,26 +1202,21 @@ def create_appointment_patient(request):
                 'error': _('Either time slot or specific time with date must be provided')
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Create and save the appointment
-        appointment = Appointment(**appointment_data)
-        appointment.save()
-        
-        # Mark time slot as unavailable if we used one from the database
-        if time_slot and not isinstance(time_slot_id, str):
-            time_slot.is_available = False
-            time_slot.save()
-        
-        # Send appointment confirmation
+        # Atomically claim the time slot (if any) and create the appointment
         try:
-            notification_result = send_appointment_confirmation(appointment)
-        except Exception as e:
-            notification_result = {'error': str(e)}
-            print(f"Error sending notification: {str(e)}")
+            appointment = book_appointment(appointment_data, time_slot)
+        except BookingConflict as e:
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_409_CONFLICT)
         
+        # The SMS and email confirmation was queued with the appointment
         return Response({
             'success': _('Appointment scheduled successfully'),
             'id': appointment.id,
-            'notifications': notification_result
+            'notifications': {
+                'queued': True
+            }
         }, status=status.HTTP_201_CREATED)
         
     except ValidationError as e:
@@ -17,15 +17,15 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cabinet.settings')
 django.setup()
 
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
 import notifications.routing
 
+# Sockets authenticate with the JWT in their query string (see
+# NotificationConsumer); session auth middleware would add a thread pool hop
+# to every connection without being used
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
-    "websocket": AuthMiddlewareStack(
-        URLRouter(
-            notifications.routing.websocket_urlpatterns
-        )
+    "websocket": URLRouter(
+        notifications.routing.websocket_urlpatterns
     ),
 })
 
@@ -41,6 +41,11 @@ CLINIC_PHONE = os.getenv('CLINIC_PHONE', '+1234567890')
 TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
 TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER')
+# Maximum number of SMS requests in flight at once (also the HTTP connection pool size)
+TWILIO_MAX_CONCURRENCY = int(os.getenv('TWILIO_MAX_CONCURRENCY', '10'))
+TWILIO_HTTP_TIMEOUT = float(os.getenv('TWILIO_HTTP_TIMEOUT', '10'))
+# 'http' sends through the Twilio API, 'local' only records messages in memory
+TWILIO_TRANSPORT = os.getenv('TWILIO_TRANSPORT', 'http')
 
 # OpenRouter AI configuration
 OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
@@ -56,6 +61,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # Trigram lookups for inventory search
     'rest_framework',
     'rest_framework_simplejwt',
     'rest_framework_simplejwt.token_blacklist',
@@ -112,6 +118,9 @@ CSRF_TRUSTED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True  # For both environments
 
+# Let the frontend read the keyset cursor of paginated feeds
+CORS_EXPOSE_HEADERS = ['X-Next-Cursor']
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -182,15 +191,69 @@ else:
         }
     }
 
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
-        'CONFIG': {
-            'capacity': 1000,  # Default: 100
-            'expiry': 60,      # Default: 60
+# Channel layer: with REDIS_URL set, WebSocket pushes go through Redis and reach
+# sockets connected to any worker process. The in-memory layer only delivers
+# within a single process, so it is for development with one worker.
+REDIS_URL = os.getenv('REDIS_URL')
+# Pub/sub publishes a group message once, however many sockets are in the group;
+# use channels_redis.core.RedisChannelLayer for per-channel queues with capacity limits
+CHANNEL_LAYER_BACKEND = os.getenv('CHANNEL_LAYER_BACKEND', 'channels_redis.pubsub.RedisPubSubChannelLayer')
+
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': CHANNEL_LAYER_BACKEND,
+            'CONFIG': {
+                'hosts': [REDIS_URL],
+            },
         },
-    },
-}
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+            'CONFIG': {
+                'capacity': 1000,  # Default: 100
+                'expiry': 60,      # Default: 60
+            },
+        },
+    }
+
+# WebSocket authentication: 'claims' trusts the user id and role signed into the
+# access token, so connecting needs no database query; 'database' also checks
+# that the user still exists and is active
+WEBSOCKET_AUTH_MODE = os.getenv('WEBSOCKET_AUTH_MODE', 'claims')
+# Seconds a user checked in the database for a WebSocket connection is
+# remembered by the worker process (0 disables)
+WEBSOCKET_USER_CACHE_TTL = int(os.getenv('WEBSOCKET_USER_CACHE_TTL', '30'))
+
+# Each worker sends its notification sockets a heartbeat every
+# WEBSOCKET_HEARTBEAT_INTERVAL seconds (0 disables) and closes those the client
+# sent nothing on (it pings every 30s) for WEBSOCKET_IDLE_TIMEOUT seconds
+WEBSOCKET_HEARTBEAT_INTERVAL = int(os.getenv('WEBSOCKET_HEARTBEAT_INTERVAL', '30'))
+WEBSOCKET_IDLE_TIMEOUT = int(os.getenv('WEBSOCKET_IDLE_TIMEOUT', '90'))
+
+# The inventory scan (manage.py scan_inventory) alerts staff about items
+# expiring within INVENTORY_EXPIRY_ALERT_DAYS and, when enabled, writes off
+# expired stock
+INVENTORY_EXPIRY_ALERT_DAYS = int(os.getenv('INVENTORY_EXPIRY_ALERT_DAYS', '30'))
+INVENTORY_WRITE_OFF_EXPIRED = os.getenv('INVENTORY_WRITE_OFF_EXPIRED', 'False') == 'True'
+
+# Cache: per-user counters (e.g. unread notifications) must be shared by all
+# worker processes, so use Redis when it is available
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -269,6 +332,13 @@ AUTH_USER_MODEL = 'accounts.User'  # This should already be set
 # Email configuration
 EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'noreply@cabinetmedicale.com')
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', '587'))
+EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'True') == 'True'
+# Number of emails sent over one SMTP connection by bulk sends
+EMAIL_BATCH_SIZE = int(os.getenv('EMAIL_BATCH_SIZE', '100'))
 
 # For AWS SES in production
 if ENVIRONMENT == 'production' and os.getenv('USE_SES', 'False') == 'True':
@@ -23,6 +23,16 @@ class Conversation(models.Model):
     
     def __str__(self):
         return f"{self.title} - {self.user.get_full_name()}"
+    
+    def mark_messages_read(self, up_to_id=None):
+        """
+        Mark the unread messages of the conversation as read in a single
+        UPDATE, only up to up_to_id when given. Returns the number of messages marked.
+        """
+        messages = self.messages.filter(is_read=False)
+        if up_to_id is not None:
+            messages = messages.filter(id__lte=up_to_id)
+        return messages.update(is_read=True)
 
 class Message(models.Model):
     """Model to store individual chat messages"""
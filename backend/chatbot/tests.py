@@ -1,3 +1,38 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from accounts.models import User
+from rest_framework.test import APIClient
+from .models import Conversation, Message
 
-# Create your tests here.
+
+class ConversationMessagesTests(TestCase):
+    """Reading a conversation marks its messages read in bulk"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='patient@example.com', password='pass', role='patient')
+        cls.conversation = Conversation.objects.create(user=cls.user, title='Questions')
+        Message.objects.bulk_create([
+            Message(conversation=cls.conversation, message_type='bot', content=f'Answer {i}') for i in range(20)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_messages_are_marked_read_in_one_update(self):
+        url = reverse('chatbot:message-list', args=[self.conversation.id])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(len(response.data), 20)
+        self.assertTrue(all(not message['is_read'] for message in response.data))
+        updates = [query for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertFalse(self.conversation.messages.filter(is_read=False).exists())
+
+    def test_mark_messages_read_stops_at_up_to_id(self):
+        messages = list(self.conversation.messages.all())
+        self.assertEqual(self.conversation.mark_messages_read(up_to_id=messages[9].id), 10)
+        self.assertEqual(self.conversation.messages.filter(is_read=False).count(), 10)
@@ -78,11 +78,9 @@ def get_conversation_messages(request, conversation_id):
         'is_read': message.is_read
     } for message in messages]
     
-    # Mark all unread messages as read
-    unread_messages = conversation.messages.filter(is_read=False)
-    for message in unread_messages:
-        message.is_read = True
-        message.save(update_fields=['is_read'])
+    # Mark the returned messages as read; messages that arrived since are left unread
+    if data:
+        conversation.mark_messages_read(up_to_id=max(message['id'] for message in data))
     
     return Response(data, status=status.HTTP_200_OK)
 
@@ -0,0 +1,166 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from accounts.models import User
+from notifications.models import Notification
+from notifications.services import create_notifications
+from .ledger import record_stock_changes
+from .models import InventoryItem
+
+DEFAULT_BATCH_SIZE = 500
+
+# Items named in an alert; the others are only counted
+ALERT_ITEM_LIMIT = 10
+
+# Statuses that raise a stock alert
+SHORTAGE_STATUSES = ['low_stock', 'out_of_stock']
+
+
+def expiring_items(today, days):
+    """Stocked items expiring within days (or already expired) that staff were not alerted about"""
+    return InventoryItem.objects.filter(
+        quantity__gt=0,
+        expiry_date__lte=today + timedelta(days=days),
+        expiry_alert_sent_at__isnull=True
+    ).order_by('expiry_date', 'id')
+
+
+def short_items():
+    """Low or out of stock items that staff were not alerted about"""
+    return InventoryItem.objects.filter(
+        status__in=SHORTAGE_STATUSES,
+        stock_alert_sent_at__isnull=True
+    ).order_by('id')
+
+
+def claim_items(queryset, field, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Claim up to batch_size items of a queryset by stamping field, as
+    notifications.reminders.claim_reminders does: the unclaimed candidates
+    are locked with SELECT ... FOR UPDATE SKIP LOCKED and exactly those are
+    stamped, so overlapping scans never alert about the same item twice.
+    """
+    candidates = list(queryset.only('id', 'name', 'quantity', 'unit', 'expiry_date')[:batch_size])
+    if not candidates:
+        return []
+    with transaction.atomic():
+        claimed = set(InventoryItem.objects.select_for_update(skip_locked=True).filter(
+            id__in=[item.id for item in candidates], **{f'{field}__isnull': True}
+        ).values_list('id', flat=True))
+        InventoryItem.objects.filter(id__in=claimed).update(**{field: timezone.now()})
+    return [item for item in candidates if item.id in claimed]
+
+
+def write_off_expired(today, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Take up to batch_size expired items out of stock, recording an 'expired'
+    transaction for each with one bulk insert. The items are stamped as
+    alerted about their stock, since the write-off alert already names them.
+
+    Returns:
+        list: The InventoryTransaction entries written
+    """
+    with transaction.atomic():
+        # Locked so the quantity written off is the quantity left
+        items = list(InventoryItem.objects.select_for_update().filter(
+            quantity__gt=0, expiry_date__lt=today
+        ).order_by('expiry_date', 'id').only('id', 'quantity')[:batch_size])
+        if not items:
+            return []
+        entries = record_stock_changes(
+            {item.id: -item.quantity for item in items},
+            'expired',
+            reference_type='ExpiryScan',
+            notes=f'Expired before {today.isoformat()}'
+        )
+        InventoryItem.objects.filter(
+            id__in=[item.id for item in items], stock_alert_sent_at__isnull=True
+        ).update(stock_alert_sent_at=timezone.now())
+        return entries
+
+
+def summarize(heading, lines):
+    if len(lines) > ALERT_ITEM_LIMIT:
+        lines = lines[:ALERT_ITEM_LIMIT] + [f'... and {len(lines) - ALERT_ITEM_LIMIT} more']
+    return '\n'.join([heading] + [f'- {line}' for line in lines])
+
+
+def alert_message(today, days, expiring, short, written_off):
+    sections = []
+    if written_off:
+        sections.append(summarize(f'{len(written_off)} expired items written off:', [
+            f'{entry.item.name}: {-entry.quantity} {entry.item.unit}' for entry in written_off
+        ]))
+    if expiring:
+        sections.append(summarize(f"{len(expiring)} items expire by {(today + timedelta(days=days)).isoformat()}:", [
+            f'{item.name}: {item.quantity} {item.unit}, expires {item.expiry_date.isoformat()}' for item in expiring
+        ]))
+    if short:
+        sections.append(summarize(f'{len(short)} items are low or out of stock:', [
+            f'{item.name}: {item.quantity} {item.unit} left' for item in short
+        ]))
+    return '\n\n'.join(sections)
+
+
+def scan_inventory(today=None, days=None, write_off=None, batch_size=None):
+    """
+    Find items expiring within days or short of stock, optionally write off
+    expired stock, and alert active staff with one notification each.
+
+    Every query reads the partial indexes on expiry_date (stocked items) and
+    status (items not alerted yet) in batches, so a scan costs in proportion
+    to the items it reports rather than to the catalog. Items are stamped
+    when reported and reported again only once their expiry date changes or
+    they were back in stock.
+
+    Args:
+        days (int): Alert horizon, INVENTORY_EXPIRY_ALERT_DAYS by default
+        write_off (bool): Write off expired stock, INVENTORY_WRITE_OFF_EXPIRED by default
+
+    Returns:
+        dict: Number of items written off, expiring and short, and of notifications sent
+    """
+    today = today or timezone.localdate()
+    days = settings.INVENTORY_EXPIRY_ALERT_DAYS if days is None else days
+    write_off = settings.INVENTORY_WRITE_OFF_EXPIRED if write_off is None else write_off
+    batch_size = batch_size or DEFAULT_BATCH_SIZE
+
+    written_off = []
+    while write_off:
+        batch = write_off_expired(today, batch_size)
+        written_off += batch
+        if len(batch) < batch_size:
+            break
+
+    expiring, short = [], []
+    for found, queryset, field in [
+        (expiring, expiring_items(today, days), 'expiry_alert_sent_at'),
+        (short, short_items(), 'stock_alert_sent_at'),
+    ]:
+        while True:
+            batch = claim_items(queryset, field, batch_size)
+            found += batch
+            if len(batch) < batch_size:
+                break
+
+    notified = []
+    if written_off or expiring or short:
+        message = alert_message(today, days, expiring, short, written_off)
+        notified = create_notifications([
+            Notification(
+                user_id=user_id,
+                title='Inventory alert',
+                message=message,
+                notification_type='system',
+                related_object_type='InventoryAlert'
+            )
+            for user_id in User.objects.filter(is_staff=True, is_active=True).values_list('id', flat=True)
+        ])
+
+    return {
+        'written_off': len(written_off),
+        'expiring': len(expiring),
+        'short': len(short),
+        'notified': len(notified),
+    }
@@ -0,0 +1,76 @@
+from decimal import Decimal
+from django.db.models import Count, DecimalField, F, Sum
+from .models import InventoryCategory
+
+CENTS = Decimal('0.01')
+
+
+def category_tree(root_id=None):
+    """
+    The category hierarchy as nested dicts, loaded in one query.
+
+    Item counts and stock values (quantity x purchase price) are aggregated
+    per category by the database, then rolled up the tree in Python:
+    item_count and stock_value cover the category's own items,
+    total_item_count and total_stock_value include its subcategories.
+
+    Args:
+        root_id (int): Return only this category's subtree
+
+    Returns:
+        list: Root categories (or the requested one), each with its children
+
+    Raises:
+        InventoryCategory.DoesNotExist: When root_id is not a category
+    """
+    rows = InventoryCategory.objects.annotate(
+        item_count=Count('items'),
+        stock_value=Sum(
+            F('items__quantity') * F('items__purchase_price'),
+            output_field=DecimalField(max_digits=14, decimal_places=2)
+        )
+    ).values('id', 'name', 'description', 'parent_id', 'item_count', 'stock_value').order_by('name')
+
+    nodes = {}
+    for row in rows:
+        # SQLite does not keep the decimal places of the product
+        row['stock_value'] = Decimal(row['stock_value'] or 0).quantize(CENTS)
+        row['children'] = []
+        nodes[row['id']] = row
+    if root_id is not None and root_id not in nodes:
+        raise InventoryCategory.DoesNotExist(f'No category {root_id}')
+
+    roots = [node for node in nodes.values() if node['parent_id'] not in nodes]
+    for node in nodes.values():
+        if node['parent_id'] in nodes:
+            nodes[node['parent_id']]['children'].append(node)
+
+    # Walk down from the roots; categories never reached are in a parent
+    # cycle, which is broken at its first category so it still shows up
+    order = []
+    visited = set()
+    root_ids = {node['id'] for node in roots}
+    for start in roots + sorted(nodes.values(), key=lambda node: node['id']):
+        if start['id'] in visited:
+            continue
+        if start['id'] not in root_ids:
+            parent = nodes[start['parent_id']]
+            parent['children'] = [child for child in parent['children'] if child['id'] != start['id']]
+            roots.append(start)
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            visited.add(node['id'])
+            order.append(node)
+            stack.extend(child for child in node['children'] if child['id'] not in visited)
+
+    # Children come after their parent in the walk, so totals are complete in reverse
+    for node in reversed(order):
+        node['total_item_count'] = node['item_count'] + sum(child['total_item_count'] for child in node['children'])
+        node['total_stock_value'] = node['stock_value'] + sum(
+            (child['total_stock_value'] for child in node['children']), Decimal(0)
+        )
+
+    if root_id is not None:
+        return [nodes[root_id]]
+    return sorted(roots, key=lambda node: node['name'])
@@ -0,0 +1,216 @@
+import math
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+import numpy as np
+from django.db import transaction
+from django.db.models import F, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import ConsumptionForecast, InventoryTransaction, PurchaseOrderItem
+from .purchasing import create_purchase_orders
+
+# Weight of a day's usage in the smoothed rate; the rest carries the history
+SMOOTHING_FACTOR = 0.2
+
+# Days of ledger folded in per query and per usage matrix
+WINDOW_DAYS = 90
+
+# Days a reorder takes to arrive, and days of usage it should cover after that
+DEFAULT_LEAD_DAYS = 14
+DEFAULT_COVER_DAYS = 30
+
+# Rates below this (units per day) are treated as no consumption
+MIN_DAILY_RATE = 0.01
+
+# Orders whose outstanding quantities count as stock on the way
+OPEN_ORDER_STATUSES = ['draft', 'pending', 'ordered', 'partially_received']
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def smooth_window(first_day, last_day, item_ids, days, used, state):
+    """
+    Fold a window of daily usage into the smoothed rates, for all items at once.
+
+    Exponential smoothing, rate = a * usage + (1 - a) * rate, applied day by
+    day over the window is a dot product with the weights a * (1 - a)^k, so
+    the window's usage is laid out as an items x days matrix and reduced with
+    one matrix-vector product. A known rate decays by (1 - a) for every day
+    since its as_of; a new item starts from its mean daily usage since its
+    first day of use.
+
+    Args:
+        first_day, last_day (date): Days the window covers
+        item_ids, days, used (tuple): Usage per item and day, one entry per pair
+        state (dict): (daily_rate, as_of) per item id already forecast
+
+    Returns:
+        dict: Smoothed daily rate per item id, as of last_day
+    """
+    width = (last_day - first_day).days + 1
+    ids = np.unique(np.array(item_ids))
+    rows = np.searchsorted(ids, item_ids)
+    columns = (np.array(days, dtype='datetime64[D]') - np.datetime64(first_day, 'D')).astype(int)
+    usage = np.zeros((len(ids), width))
+    np.add.at(usage, (rows, columns), np.array(used, dtype=float))
+
+    decay = 1 - SMOOTHING_FACTOR
+    weights = SMOOTHING_FACTOR * decay ** np.arange(width - 1, -1, -1)
+
+    # Rate each item starts from, and days it is carried over to last_day
+    days_in_use = width - np.argmax(usage > 0, axis=1)
+    mean_usage = usage.sum(axis=1) / days_in_use
+    start_rate = np.empty(len(ids))
+    carried = np.empty(len(ids))
+    for row, item_id in enumerate(ids.tolist()):
+        if item_id in state:
+            start_rate[row] = state[item_id][0]
+            carried[row] = (last_day - state[item_id][1]).days
+        else:
+            start_rate[row] = mean_usage[row]
+            carried[row] = days_in_use[row]
+
+    rates = start_rate * decay ** carried + usage @ weights
+    return dict(zip(ids.tolist(), rates.tolist()))
+
+
+def update_consumption_rates(until=None):
+    """
+    Fold the usage recorded since the last run into each item's smoothed
+    daily rate.
+
+    The ledger is read incrementally: from the day after the latest as_of
+    (the watermark) to until, yesterday by default so only complete days
+    count, WINDOW_DAYS at a time, each window as one GROUP BY query over the
+    (transaction_type, timestamp) index. Only items used in a window are
+    written; the rate of the others decays when it is read (see
+    current_rate). Forecast rows are locked and items already past a window
+    skipped, so overlapping runs do not fold a day in twice.
+
+    Returns:
+        dict: Number of days and items processed
+    """
+    until = until or timezone.localdate() - timedelta(days=1)
+    watermark = ConsumptionForecast.objects.aggregate(day=Max('as_of'))['day']
+    usage = InventoryTransaction.objects.filter(transaction_type='usage')
+    if watermark is not None:
+        start = watermark + timedelta(days=1)
+    else:
+        first = usage.aggregate(first=Min('timestamp'))['first']
+        if first is None:
+            return {'days': 0, 'items': 0}
+        start = timezone.localtime(first).date()
+
+    items = set()
+    window_start = start
+    while window_start <= until:
+        window_end = min(window_start + timedelta(days=WINDOW_DAYS - 1), until)
+        with transaction.atomic():
+            rows = list(usage.filter(
+                timestamp__gte=day_start(window_start), timestamp__lt=day_start(window_end + timedelta(days=1))
+            ).annotate(day=TruncDate('timestamp')).values('item_id', 'day').annotate(
+                used=-Sum('quantity')
+            ).values_list('item_id', 'day', 'used'))
+            state = {
+                forecast.item_id: (forecast.daily_rate, forecast.as_of)
+                for forecast in ConsumptionForecast.objects.select_for_update().filter(
+                    item_id__in={item_id for item_id, _, _ in rows}
+                )
+            }
+            rows = [row for row in rows if row[0] not in state or state[row[0]][1] < window_start]
+            if rows:
+                rates = smooth_window(window_start, window_end, *zip(*rows), state)
+                ConsumptionForecast.objects.bulk_create(
+                    [ConsumptionForecast(item_id=item_id, daily_rate=rate, as_of=window_end)
+                     for item_id, rate in rates.items()],
+                    update_conflicts=True,
+                    unique_fields=['item'],
+                    update_fields=['daily_rate', 'as_of', 'updated_at']
+                )
+                items.update(rates)
+        window_start = window_end + timedelta(days=1)
+
+    return {'days': max((until - start).days + 1, 0), 'items': len(items)}
+
+
+def current_rate(forecast, today):
+    """The smoothed rate, decayed over the days without usage since it was computed"""
+    idle_days = max((today - forecast.as_of).days - 1, 0)
+    return forecast.daily_rate * (1 - SMOOTHING_FACTOR) ** idle_days
+
+
+def project_stockouts(today=None):
+    """
+    Projected stock-out date of every item with a consumption rate.
+
+    Returns:
+        list: Dicts with the item, its daily rate, days of stock left and
+            stock-out date, soonest stock-out first
+    """
+    today = today or timezone.localdate()
+    forecasts = list(ConsumptionForecast.objects.select_related('item'))
+    if not forecasts:
+        return []
+    rates = np.array([current_rate(forecast, today) for forecast in forecasts])
+    quantities = np.array([forecast.item.quantity for forecast in forecasts], dtype=float)
+    days_left = np.divide(quantities, rates, out=np.full(len(forecasts), np.inf), where=rates >= MIN_DAILY_RATE)
+
+    projections = [
+        {
+            'item': forecast.item,
+            'daily_rate': rate,
+            'days_left': days,
+            'stockout_date': today + timedelta(days=math.floor(days)),
+        }
+        for forecast, rate, days in zip(forecasts, rates.tolist(), days_left.tolist())
+        if math.isfinite(days)
+    ]
+    return sorted(projections, key=lambda projection: (projection['days_left'], projection['item'].id))
+
+
+def draft_reorders(today=None, lead_days=None, cover_days=None, created_by=None):
+    """
+    Draft purchase orders, one per supplier, for the items projected to run
+    out before a reorder placed today would arrive.
+
+    Each item is ordered from the supplier of its latest purchase order, at
+    that order's unit price, enough to cover lead_days + cover_days of usage
+    net of its stock and of quantities still outstanding on open orders.
+    Items never ordered before have no known supplier and are skipped.
+
+    Returns:
+        list: The drafted PurchaseOrder objects
+    """
+    lead_days = DEFAULT_LEAD_DAYS if lead_days is None else lead_days
+    cover_days = DEFAULT_COVER_DAYS if cover_days is None else cover_days
+    due = [projection for projection in project_stockouts(today) if projection['days_left'] <= lead_days]
+    if not due:
+        return []
+    item_ids = [projection['item'].id for projection in due]
+
+    on_order = dict(PurchaseOrderItem.objects.filter(
+        item_id__in=item_ids, purchase_order__status__in=OPEN_ORDER_STATUSES
+    ).values('item_id').annotate(
+        outstanding=Sum(F('quantity_ordered') - F('quantity_received'))
+    ).values_list('item_id', 'outstanding'))
+    last_lines = {}
+    for item_id, supplier_id, unit_price in PurchaseOrderItem.objects.filter(item_id__in=item_ids).order_by(
+        'item_id', '-purchase_order__order_date', '-id'
+    ).values_list('item_id', 'purchase_order__supplier_id', 'unit_price'):
+        last_lines.setdefault(item_id, (supplier_id, unit_price))
+
+    lines = defaultdict(list)
+    for projection in due:
+        item = projection['item']
+        needed = math.ceil(projection['daily_rate'] * (lead_days + cover_days))
+        quantity = needed - item.quantity - on_order.get(item.id, 0)
+        if quantity > 0 and item.id in last_lines:
+            supplier_id, unit_price = last_lines[item.id]
+            lines[supplier_id].append({'item_id': item.id, 'quantity': quantity, 'unit_price': unit_price})
+
+    return create_purchase_orders([
+        {'supplier_id': supplier_id, 'lines': supplier_lines, 'notes': 'Drafted from consumption forecast'}
+        for supplier_id, supplier_lines in sorted(lines.items())
+    ], created_by=created_by) if lines else []
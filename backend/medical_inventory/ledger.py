@@ -0,0 +1,116 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from .models import InventoryItem, InventoryTransaction
+
+
+class InsufficientStock(Exception):
+    """Raised when a stock change would take an item's quantity below zero"""
+
+
+def record_stock_change(item_id, quantity, transaction_type, performed_by=None,
+                        reference_id=None, reference_type=None, notes=''):
+    """
+    Apply a stock change to an item and record it in the ledger, atomically.
+
+    The item row is locked for the rest of the transaction, so concurrent
+    changes to the same item are applied one after the other and none is
+    lost. The quantity and the matching status are written in a single
+    UPDATE (quantity = quantity + delta), and the InventoryTransaction
+    carries the quantities before and after.
+
+    Args:
+        item_id (int): Inventory item to change
+        quantity (int): Signed change, negative for stock leaving
+        transaction_type (str): One of InventoryTransaction.TRANSACTION_TYPES
+
+    Returns:
+        InventoryTransaction: The ledger entry; its item holds the new quantity and status
+
+    Raises:
+        InventoryItem.DoesNotExist: When the item does not exist
+        InsufficientStock: When the change would make the quantity negative
+    """
+    with transaction.atomic():
+        item = InventoryItem.objects.select_for_update().get(id=item_id)
+        quantity_before = item.quantity
+        if quantity_before + quantity < 0:
+            raise InsufficientStock(_('Not enough stock for this adjustment'))
+
+        item.quantity = quantity_before + quantity
+        item.status = item.stock_status()
+        item.updated_at = timezone.now()
+        # Back in stock: the next shortage raises a new alert
+        if item.status == 'in_stock':
+            item.stock_alert_sent_at = None
+        InventoryItem.objects.filter(id=item_id).update(
+            quantity=F('quantity') + quantity,
+            status=item.status,
+            stock_alert_sent_at=item.stock_alert_sent_at,
+            updated_at=item.updated_at
+        )
+
+        return InventoryTransaction.objects.create(
+            item=item,
+            transaction_type=transaction_type,
+            quantity=quantity,
+            quantity_before=quantity_before,
+            quantity_after=item.quantity,
+            performed_by=performed_by,
+            reference_id=reference_id,
+            reference_type=reference_type,
+            notes=notes
+        )
+
+
+def record_stock_changes(changes, transaction_type, performed_by=None,
+                         reference_id=None, reference_type=None, notes=''):
+    """
+    Apply stock changes to many items and record them in the ledger in a
+    constant number of queries: the items are locked with one SELECT ... FOR
+    UPDATE (in id order, so concurrent bulk changes cannot deadlock), then
+    written with one bulk UPDATE and recorded with one bulk INSERT.
+
+    Args:
+        changes (dict): Signed quantity change per inventory item id
+        transaction_type (str): One of InventoryTransaction.TRANSACTION_TYPES
+
+    Returns:
+        list: The created InventoryTransaction entries, in item id order
+
+    Raises:
+        InventoryItem.DoesNotExist: When an item does not exist
+        InsufficientStock: When a change would make a quantity negative
+    """
+    with transaction.atomic():
+        items = list(InventoryItem.objects.select_for_update().filter(id__in=changes).order_by('id'))
+        if len(items) != len(changes):
+            missing = set(changes) - {item.id for item in items}
+            raise InventoryItem.DoesNotExist(f'Inventory items not found: {sorted(missing)}')
+
+        now = timezone.now()
+        entries = []
+        for item in items:
+            quantity_before = item.quantity
+            if quantity_before + changes[item.id] < 0:
+                raise InsufficientStock(_('Not enough stock for this adjustment'))
+            item.quantity = quantity_before + changes[item.id]
+            item.status = item.stock_status()
+            item.updated_at = now
+            if item.status == 'in_stock':
+                item.stock_alert_sent_at = None
+            entries.append(InventoryTransaction(
+                item=item,
+                transaction_type=transaction_type,
+                quantity=changes[item.id],
+                quantity_before=quantity_before,
+                quantity_after=item.quantity,
+                performed_by=performed_by,
+                reference_id=reference_id,
+                reference_type=reference_type,
+                notes=notes
+            ))
+
+        InventoryItem.objects.bulk_update(items, ['quantity', 'status', 'stock_alert_sent_at', 'updated_at'])
+        return InventoryTransaction.objects.bulk_create(entries)
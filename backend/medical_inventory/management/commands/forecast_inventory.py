@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from medical_inventory.forecasting import (
+    DEFAULT_COVER_DAYS, DEFAULT_LEAD_DAYS, draft_reorders, project_stockouts, update_consumption_rates
+)
+
+
+class Command(BaseCommand):
+    help = ('Folds the inventory usage recorded since the last run into consumption rates, projects stock-out '
+            'dates and optionally drafts purchase orders for items that will run out')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--draft-orders', action='store_true',
+                            help='Draft a purchase order per supplier for items running out within --lead-days')
+        parser.add_argument('--lead-days', type=int, default=DEFAULT_LEAD_DAYS,
+                            help='Days a reorder takes to arrive')
+        parser.add_argument('--cover-days', type=int, default=DEFAULT_COVER_DAYS,
+                            help='Days of usage a reorder covers after it arrives')
+
+    def handle(self, *args, **options):
+        if min(options['lead_days'], options['cover_days']) < 0:
+            raise CommandError('--lead-days and --cover-days cannot be negative')
+
+        result = update_consumption_rates()
+        self.stdout.write(f"Folded {result['days']} days of usage into the rates of {result['items']} items")
+
+        projections = project_stockouts()
+        running_out = [projection for projection in projections if projection['days_left'] <= options['lead_days']]
+        self.stdout.write(f"{len(running_out)} of {len(projections)} items run out within {options['lead_days']} days")
+        for projection in running_out:
+            self.stdout.write(
+                f"  {projection['item'].name}: {projection['item'].quantity} left, "
+                f"{projection['daily_rate']:.2f}/day, out by {projection['stockout_date']}"
+            )
+
+        if options['draft_orders']:
+            orders = draft_reorders(lead_days=options['lead_days'], cover_days=options['cover_days'])
+            for po in orders:
+                self.stdout.write(f"Drafted {po.order_number} for {po.supplier.name}")
+            self.stdout.write(self.style.SUCCESS(f'Drafted {len(orders)} purchase orders'))
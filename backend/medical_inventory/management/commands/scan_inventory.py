@@ -0,0 +1,39 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from medical_inventory.alerts import DEFAULT_BATCH_SIZE, scan_inventory
+
+
+class Command(BaseCommand):
+    help = 'Alerts staff about inventory items that expire soon or run short, optionally writing off expired stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='Alert about items expiring within this many days (default: INVENTORY_EXPIRY_ALERT_DAYS)')
+        parser.add_argument('--write-off-expired', action='store_true', default=None,
+                            help='Write off expired stock (default: INVENTORY_WRITE_OFF_EXPIRED)')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Number of items read and updated per query')
+        parser.add_argument('--loop', action='store_true', help='Keep scanning instead of exiting')
+        parser.add_argument('--interval', type=float, default=3600.0,
+                            help='Seconds to wait between scans (with --loop)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size must be positive')
+        if options['days'] is not None and options['days'] < 0:
+            raise CommandError('--days cannot be negative')
+
+        while True:
+            result = scan_inventory(
+                days=options['days'], write_off=options['write_off_expired'], batch_size=options['batch_size']
+            )
+            self.stdout.write(
+                f"Wrote off {result['written_off']} expired items, found {result['expiring']} expiring "
+                f"and {result['short']} short items, sent {result['notified']} notifications"
+            )
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('Inventory scanned'))
@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-17 06:34
+
+import datetime
+import re
+from django.db import migrations, models
+
+
+def seed_sequences(apps, schema_editor):
+    """Continue each day's numbering after the order numbers already issued"""
+    PurchaseOrder = apps.get_model('medical_inventory', 'PurchaseOrder')
+    PurchaseOrderSequence = apps.get_model('medical_inventory', 'PurchaseOrderSequence')
+    last_values = {}
+    for order_number in PurchaseOrder.objects.values_list('order_number', flat=True).iterator():
+        match = re.fullmatch(r'PO-(\d{8})-(\d+)', order_number)
+        if match:
+            day = datetime.datetime.strptime(match[1], '%Y%m%d').date()
+            last_values[day] = max(last_values.get(day, 0), int(match[2]))
+    PurchaseOrderSequence.objects.bulk_create([
+        PurchaseOrderSequence(day=day, last_value=last_value) for day, last_value in last_values.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurchaseOrderSequence',
+            fields=[
+                ('day', models.DateField(primary_key=True, serialize=False, verbose_name='Day')),
+                ('last_value', models.PositiveIntegerField(default=0, verbose_name='Last Value')),
+            ],
+            options={
+                'verbose_name': 'Purchase Order Sequence',
+                'verbose_name_plural': 'Purchase Order Sequences',
+            },
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
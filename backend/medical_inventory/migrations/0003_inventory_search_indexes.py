@@ -0,0 +1,50 @@
+from django.db import migrations
+
+BARCODE_HASH_INDEX = 'inv_item_barcode_hash'
+
+# Trigram indexes on the expressions Django's icontains/istartswith compare,
+# UPPER(column::text), so ILIKE-style searches and the % operator use them
+TRIGRAM_INDEXES = {
+    'inv_item_name_trgm': 'name',
+    'inv_item_sku_trgm': 'sku',
+    'inv_item_barcode_trgm': 'barcode',
+}
+
+
+def add_search_indexes(apps, schema_editor):
+    # Hash and GIN indexes are PostgreSQL only; other backends search
+    # through medical_inventory.search's Python fallback
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {BARCODE_HASH_INDEX} ON medical_inventory_inventoryitem USING hash (barcode)'
+    )
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, column in TRIGRAM_INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON medical_inventory_inventoryitem '
+            f'USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+        )
+
+
+def remove_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in [BARCODE_HASH_INDEX, *TRIGRAM_INDEXES]:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_inventory', '0002_purchaseordersequence'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_indexes, remove_search_indexes),
+    ]
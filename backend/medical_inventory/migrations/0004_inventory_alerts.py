@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-17 06:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_inventory', '0003_inventory_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventoryitem',
+            name='expiry_alert_sent_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Expiry Alert Sent At'),
+        ),
+        migrations.AddField(
+            model_name='inventoryitem',
+            name='stock_alert_sent_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Stock Alert Sent At'),
+        ),
+        migrations.AddIndex(
+            model_name='inventoryitem',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['expiry_date'], name='inv_item_stocked_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventoryitem',
+            index=models.Index(condition=models.Q(('stock_alert_sent_at__isnull', True)), fields=['status'], name='inv_item_unalerted_status_idx'),
+        ),
+    ]
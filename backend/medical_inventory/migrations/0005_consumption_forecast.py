@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-17 06:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_inventory', '0004_inventory_alerts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsumptionForecast',
+            fields=[
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='consumption_forecast', serialize=False, to='medical_inventory.inventoryitem', verbose_name='Item')),
+                ('daily_rate', models.FloatField(default=0, verbose_name='Daily Usage Rate')),
+                ('as_of', models.DateField(db_index=True, verbose_name='As Of')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Consumption Forecast',
+                'verbose_name_plural': 'Consumption Forecasts',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='inventorytransaction',
+            index=models.Index(fields=['transaction_type', 'timestamp'], name='inv_txn_type_time_idx'),
+        ),
+    ]
@@ -83,23 +83,44 @@ class InventoryItem(models.Model):
     # Location
     storage_location = models.CharField(max_length=100, blank=True, null=True, verbose_name=_('Storage Location'))
     
+    # When staff were last alerted, see medical_inventory.alerts; cleared once
+    # the expiry date changes or the item is back in stock
+    expiry_alert_sent_at = models.DateTimeField(blank=True, null=True, verbose_name=_('Expiry Alert Sent At'))
+    stock_alert_sent_at = models.DateTimeField(blank=True, null=True, verbose_name=_('Stock Alert Sent At'))
+    
     class Meta:
         verbose_name = _('Inventory Item')
         verbose_name_plural = _('Inventory Items')
         ordering = ['name']
+        # Partial indexes holding only the items the alert scanner can pick,
+        # so a scan reads the affected items rather than the whole catalog
+        indexes = [
+            models.Index(
+                fields=['expiry_date'], condition=models.Q(quantity__gt=0), name='inv_item_stocked_expiry_idx'
+            ),
+            models.Index(
+                fields=['status'], condition=models.Q(stock_alert_sent_at__isnull=True), name='inv_item_unalerted_status_idx'
+            ),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.sku})"
     
+    def stock_status(self, quantity=None):
+        """Status matching a quantity, the current one by default"""
+        quantity = self.quantity if quantity is None else quantity
+        if quantity <= 0:
+            return 'out_of_stock'
+        elif quantity < self.minimum_stock:
+            return 'low_stock'
+        return 'in_stock'
+    
     def update_status(self):
         """Update the status based on current quantity"""
-        if self.quantity <= 0:
-            self.status = 'out_of_stock'
-        elif self.quantity < self.minimum_stock:
-            self.status = 'low_stock'
-        else:
-            self.status = 'in_stock'
-        self.save(update_fields=['status'])
+        self.status = self.stock_status()
+        if self.status == 'in_stock':
+            self.stock_alert_sent_at = None
+        self.save(update_fields=['status', 'stock_alert_sent_at'])
         return self.status
 
 class InventoryTransaction(models.Model):
@@ -152,6 +173,10 @@ class InventoryTransaction(models.Model):
         verbose_name = _('Inventory Transaction')
         verbose_name_plural = _('Inventory Transactions')
         ordering = ['-timestamp']
+        indexes = [
+            # Days of usage read by medical_inventory.forecasting
+            models.Index(fields=['transaction_type', 'timestamp'], name='inv_txn_type_time_idx'),
+        ]
     
     def __str__(self):
         return f"{self.transaction_type}: {self.item.name} ({self.quantity})"
@@ -320,3 +345,38 @@ class PurchaseOrderItem(models.Model):
         self.is_fully_received = self.quantity_received >= self.quantity_ordered
         self.save(update_fields=['is_fully_received'])
         return self.is_fully_received
+
+
+class PurchaseOrderSequence(models.Model):
+    """Last purchase order number allocated on a day, see purchasing.allocate_order_numbers()"""
+    day = models.DateField(primary_key=True, verbose_name=_('Day'))
+    last_value = models.PositiveIntegerField(default=0, verbose_name=_('Last Value'))
+
+    class Meta:
+        verbose_name = _('Purchase Order Sequence')
+        verbose_name_plural = _('Purchase Order Sequences')
+
+    def __str__(self):
+        return f"{self.day}: {self.last_value}"
+
+
+class ConsumptionForecast(models.Model):
+    """Smoothed daily usage of an item, see medical_inventory.forecasting"""
+    item = models.OneToOneField(
+        InventoryItem,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='consumption_forecast',
+        verbose_name=_('Item')
+    )
+    daily_rate = models.FloatField(default=0, verbose_name=_('Daily Usage Rate'))
+    # Last day of the ledger folded into daily_rate
+    as_of = models.DateField(db_index=True, verbose_name=_('As Of'))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('Consumption Forecast')
+        verbose_name_plural = _('Consumption Forecasts')
+
+    def __str__(self):
+        return f"{self.item_id}: {self.daily_rate:.2f}/day as of {self.as_of}"
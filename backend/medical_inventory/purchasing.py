@@ -0,0 +1,165 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from .ledger import record_stock_changes
+from .models import InventoryItem, PurchaseOrder, PurchaseOrderItem, PurchaseOrderSequence, Supplier
+
+
+class PurchaseOrderError(Exception):
+    """Raised when a purchase order operation is not valid for the order or its lines"""
+
+
+def allocate_order_numbers(count=1, day=None):
+    """
+    Reserve the next count purchase order numbers of a day, PO-YYYYMMDD-NNN.
+
+    The day's counter row is created if missing (INSERT ... ON CONFLICT DO
+    NOTHING) and incremented in one UPDATE, which locks it until the
+    surrounding transaction ends: concurrent creations get distinct numbers
+    without counting the day's orders, and a rolled back creation releases
+    its numbers instead of leaving a gap.
+    """
+    day = day or timezone.localdate()
+    with transaction.atomic():
+        PurchaseOrderSequence.objects.bulk_create([PurchaseOrderSequence(day=day)], ignore_conflicts=True)
+        PurchaseOrderSequence.objects.filter(day=day).update(last_value=F('last_value') + count)
+        last_value = PurchaseOrderSequence.objects.filter(day=day).values_list('last_value', flat=True).get()
+    return [f"PO-{day.strftime('%Y%m%d')}-{number:03d}" for number in range(last_value - count + 1, last_value + 1)]
+
+
+def create_purchase_orders(orders, created_by=None):
+    """
+    Create draft purchase orders with their lines in a constant number of
+    queries: suppliers and items are each loaded with one in_bulk, the order
+    numbers reserved with allocate_order_numbers() and the orders and all
+    their lines inserted with one bulk INSERT each.
+
+    Args:
+        orders (list): One dict per order with supplier_id, lines (dicts of
+            item_id, quantity and unit_price) and optionally
+            expected_delivery_date, shipping_cost, tax_amount and notes
+
+    Returns:
+        list: The created PurchaseOrder objects, in the order given
+
+    Raises:
+        Supplier.DoesNotExist: When a supplier does not exist
+        InventoryItem.DoesNotExist: When an item does not exist
+        PurchaseOrderError: When an order has no lines, repeats an item or has an invalid quantity or price
+    """
+    for order in orders:
+        if not order['lines']:
+            raise PurchaseOrderError(_('At least one item is required'))
+        item_ids = [line['item_id'] for line in order['lines']]
+        if len(set(item_ids)) != len(item_ids):
+            raise PurchaseOrderError(_('An item can only appear once in a purchase order'))
+        for line in order['lines']:
+            if line['quantity'] <= 0 or line['unit_price'] < 0:
+                raise PurchaseOrderError(_('Invalid quantity or unit price for item: ') + str(line['item_id']))
+
+    with transaction.atomic():
+        suppliers = Supplier.objects.in_bulk({order['supplier_id'] for order in orders})
+        missing = {order['supplier_id'] for order in orders} - set(suppliers)
+        if missing:
+            raise Supplier.DoesNotExist(_('Supplier not found: ') + str(min(missing)))
+        item_ids = {line['item_id'] for order in orders for line in order['lines']}
+        items = InventoryItem.objects.only('id').in_bulk(item_ids)
+        missing = item_ids - set(items)
+        if missing:
+            raise InventoryItem.DoesNotExist(_('Item not found: ') + str(min(missing)))
+
+        day = timezone.localdate()
+        purchase_orders = PurchaseOrder.objects.bulk_create([
+            PurchaseOrder(
+                order_number=order_number,
+                supplier=suppliers[order['supplier_id']],
+                order_date=day,
+                expected_delivery_date=order.get('expected_delivery_date'),
+                shipping_cost=order.get('shipping_cost', 0),
+                tax_amount=order.get('tax_amount', 0),
+                total_amount=sum(line['quantity'] * line['unit_price'] for line in order['lines']),
+                notes=order.get('notes', ''),
+                created_by=created_by,
+                status='draft'
+            )
+            for order, order_number in zip(orders, allocate_order_numbers(len(orders), day))
+        ])
+        PurchaseOrderItem.objects.bulk_create([
+            PurchaseOrderItem(
+                purchase_order=po,
+                item=items[line['item_id']],
+                quantity_ordered=line['quantity'],
+                unit_price=line['unit_price']
+            )
+            for po, order in zip(purchase_orders, orders)
+            for line in order['lines']
+        ])
+    return purchase_orders
+
+
+def receive_purchase_order(po_id, received, performed_by=None, notes=''):
+    """
+    Receive delivered quantities of purchase order lines in one transaction
+    and a constant number of queries, however many lines the delivery has:
+    the order is locked, its lines loaded with their items in one query,
+    stock changed through record_stock_changes() and the lines written with
+    one bulk UPDATE. Any invalid line rolls back the whole receipt.
+
+    Args:
+        po_id (int): Purchase order being received
+        received (dict): Quantity received per purchase order item id
+
+    Returns:
+        tuple: The updated PurchaseOrder and, per received line, a dict with
+            the line, its item and the new stock level
+
+    Raises:
+        PurchaseOrder.DoesNotExist: When the order does not exist
+        PurchaseOrderItem.DoesNotExist: When a line is not part of the order
+        PurchaseOrderError: When the order cannot be received or a quantity is invalid
+    """
+    with transaction.atomic():
+        # Serializes receipts of the same order
+        po = PurchaseOrder.objects.select_for_update().get(id=po_id)
+        if po.status in ['draft', 'cancelled']:
+            raise PurchaseOrderError(_('Cannot receive items for a draft or cancelled purchase order'))
+
+        lines = PurchaseOrderItem.objects.filter(purchase_order=po).select_related('item').in_bulk(list(received))
+        missing = set(received) - set(lines)
+        if missing:
+            raise PurchaseOrderItem.DoesNotExist(_('Purchase order item not found: ') + str(min(missing)))
+
+        for line_id, quantity in received.items():
+            line = lines[line_id]
+            if quantity <= 0 or quantity > line.quantity_ordered - line.quantity_received:
+                raise PurchaseOrderError(_('Invalid received quantity for item: ') + line.item.name)
+            line.quantity_received += quantity
+            line.is_fully_received = line.quantity_received >= line.quantity_ordered
+
+        entries = record_stock_changes(
+            {lines[line_id].item_id: quantity for line_id, quantity in received.items()},
+            'purchase',
+            performed_by=performed_by,
+            reference_id=po.id,
+            reference_type='PurchaseOrder',
+            notes=f"Received from PO #{po.order_number}"
+        )
+        PurchaseOrderItem.objects.bulk_update(list(lines.values()), ['quantity_received', 'is_fully_received'])
+
+        # Lines not in this delivery may still be outstanding
+        outstanding = PurchaseOrderItem.objects.filter(purchase_order=po, is_fully_received=False).exists()
+        if outstanding:
+            po.status = 'partially_received'
+        else:
+            po.status = 'received'
+            po.delivery_date = timezone.now().date()
+        if notes:
+            po.notes = (po.notes + '\n' if po.notes else '') + f"[{timezone.now().strftime('%Y-%m-%d %H:%M')}] Items received: {notes}"
+        po.save(update_fields=['status', 'delivery_date', 'notes', 'updated_at'])
+
+    stock_levels = {entry.item_id: entry.quantity_after for entry in entries}
+    return po, [
+        {'line': lines[line_id], 'item': lines[line_id].item, 'new_stock_level': stock_levels[lines[line_id].item_id]}
+        for line_id in received
+    ]
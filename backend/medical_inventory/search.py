@@ -0,0 +1,111 @@
+import re
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+from django.db.models import Case, Q, TextField, Value, When
+from django.db.models.functions import Cast, Greatest, Upper
+
+# Minimum trigram similarity of a fuzzy match, pg_trgm's default similarity_threshold
+SIMILARITY_THRESHOLD = 0.3
+
+# Search ranks, best first: a name or SKU starting with the query, then the
+# query anywhere in the name, SKU or barcode, then fuzzy name matches
+PREFIX_MATCH = 2
+SUBSTRING_MATCH = 1
+FUZZY_MATCH = 0
+
+# Whether pg_trgm is installed, per database alias
+trigram_support = {}
+
+
+def trigram_search_available(using='default'):
+    """Whether the database has pg_trgm, which migration 0003 installs where it can"""
+    if using not in trigram_support:
+        connection = connections[using]
+        available = False
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                available = cursor.fetchone() is not None
+        trigram_support[using] = available
+    return trigram_support[using]
+
+
+def trigrams(text):
+    """The trigrams of a string as pg_trgm extracts them: per lowercased word, padded with blanks"""
+    result = set()
+    for word in re.findall(r'[^\W_]+', text.lower()):
+        padded = f'  {word} '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def similarity(a, b):
+    """pg_trgm's similarity(): shared trigrams over all trigrams of both strings"""
+    a, b = trigrams(a), trigrams(b)
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def match_rank(query, name, sku, barcode):
+    """The (rank, similarity) of an item for a query, or None when it does not match"""
+    query = query.lower()
+    name, sku, barcode = name.lower(), sku.lower(), (barcode or '').lower()
+    score = max(similarity(query, name), similarity(query, sku))
+    if name.startswith(query) or sku.startswith(query):
+        return PREFIX_MATCH, score
+    if query in name or query in sku or query in barcode:
+        return SUBSTRING_MATCH, score
+    if similarity(query, name) >= SIMILARITY_THRESHOLD:
+        return FUZZY_MATCH, score
+    return None
+
+
+def search_items(queryset, query):
+    """
+    Inventory items of a queryset matching a search box query, best first.
+
+    A query equal to a barcode, as scanner input is, returns the items with
+    that barcode from the hash index on barcode. Otherwise items match on a
+    name or SKU prefix, on a substring of the name, SKU or barcode, or on a
+    name similar enough to the query to survive typos. On PostgreSQL with
+    pg_trgm, the GIN trigram indexes on UPPER(name), UPPER(sku) and
+    UPPER(barcode) serve both the substring (ILIKE) and the similarity (%)
+    conditions. Elsewhere, as in the SQLite test database, the items are
+    ranked in Python with the same rules.
+
+    Returns:
+        list: The matching InventoryItem objects
+    """
+    query = query.strip()
+    if not query:
+        return list(queryset)
+
+    scanned = list(queryset.filter(barcode=query))
+    if scanned:
+        return scanned
+
+    if trigram_search_available(queryset.db):
+        substring = Q(name__icontains=query) | Q(sku__icontains=query) | Q(barcode__icontains=query)
+        return list(queryset.alias(
+            # Matches the GIN index expression, so the % operator can use it
+            search_name=Upper(Cast('name', TextField()))
+        ).filter(
+            substring | Q(search_name__trigram_similar=query)
+        ).annotate(
+            search_rank=Case(
+                When(Q(name__istartswith=query) | Q(sku__istartswith=query), then=Value(PREFIX_MATCH)),
+                When(substring, then=Value(SUBSTRING_MATCH)),
+                default=Value(FUZZY_MATCH)
+            ),
+            search_similarity=Greatest(TrigramSimilarity('name', query), TrigramSimilarity('sku', query))
+        ).order_by('-search_rank', '-search_similarity', 'name'))
+
+    ranked = []
+    for item_id, name, sku, barcode in queryset.values_list('id', 'name', 'sku', 'barcode').iterator():
+        rank = match_rank(query, name, sku, barcode)
+        if rank is not None:
+            ranked.append((-rank[0], -rank[1], name, item_id))
+    ranked.sort()
+    items = queryset.in_bulk([item_id for *_, item_id in ranked])
+    return [items[item_id] for *_, item_id in ranked]
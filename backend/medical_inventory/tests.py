@@ -1,3 +1,612 @@
-from django.test import TestCase
+import math
+import threading
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from unittest import mock
+from django.urls import reverse
+from django.utils import timezone
+from accounts.models import User
+from notifications.models import Notification
+from rest_framework.test import APIClient
+from .alerts import claim_items, scan_inventory, short_items
+from .forecasting import (
+    SMOOTHING_FACTOR, day_start, draft_reorders, project_stockouts, update_consumption_rates
+)
+from .ledger import InsufficientStock, record_stock_change
+from .models import (
+    ConsumptionForecast, InventoryCategory, InventoryItem, InventoryTransaction, PurchaseOrder, PurchaseOrderItem, PurchaseOrderSequence, Supplier
+)
+from .purchasing import allocate_order_numbers
+from .search import similarity
 
-# Create your tests here.
+
+def create_item(sku='GLV-001', quantity=20, **fields):
+    return InventoryItem.objects.create(
+        name=fields.pop('name', f'Item {sku}'), sku=sku, quantity=quantity,
+        minimum_stock=fields.pop('minimum_stock', 5), purchase_price=fields.pop('purchase_price', 2), **fields
+    )
+
+
+class CategoryTreeTests(TestCase):
+    """The category tree loads in one query with counts and stock values rolled up"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='staff@example.com', password='pass', role='doctor')
+        cls.consumables = InventoryCategory.objects.create(name='Consumables')
+        cls.gloves = InventoryCategory.objects.create(name='Gloves', parent=cls.consumables)
+        cls.nitrile = InventoryCategory.objects.create(name='Nitrile', parent=cls.gloves)
+        cls.drugs = InventoryCategory.objects.create(name='Drugs')
+        create_item('CON-1', quantity=10, category=cls.consumables, purchase_price='1.50')
+        create_item('GLV-1', quantity=4, category=cls.gloves, purchase_price='2.00')
+        create_item('NIT-1', quantity=3, category=cls.nitrile, purchase_price='0.50')
+        create_item('NIT-2', quantity=0, category=cls.nitrile, purchase_price='9.99')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def get_tree(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('medical_inventory:category-tree'), params)
+        return response, len(queries)
+
+    def test_tree_rolls_up_counts_and_values(self):
+        response, queries = self.get_tree()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([node['name'] for node in response.data], ['Consumables', 'Drugs'])
+        consumables, drugs = response.data
+        self.assertEqual(
+            (consumables['item_count'], consumables['stock_value']), (1, '15.00')
+        )
+        self.assertEqual(
+            (consumables['total_item_count'], consumables['total_stock_value']), (4, '24.50')
+        )
+        gloves = consumables['children'][0]
+        self.assertEqual((gloves['total_item_count'], gloves['total_stock_value']), (3, '9.50'))
+        self.assertEqual(gloves['children'][0]['stock_value'], '1.50')
+        self.assertEqual((drugs['total_item_count'], drugs['total_stock_value'], drugs['children']), (0, '0.00', []))
+
+        # A larger tree still takes the same number of queries
+        parent = self.nitrile
+        for i in range(20):
+            parent = InventoryCategory.objects.create(name=f'Level {i}', parent=parent)
+            create_item(f'LVL-{i}', quantity=1, category=parent, purchase_price=1)
+        response, more_queries = self.get_tree()
+        self.assertEqual(more_queries, queries)
+        self.assertEqual(response.data[0]['total_item_count'], 24)
+
+    def test_subtree_and_parent_cycle(self):
+        response, _ = self.get_tree(root=self.gloves.id)
+        self.assertEqual([node['name'] for node in response.data], ['Gloves'])
+        self.assertEqual(response.data[0]['children'][0]['name'], 'Nitrile')
+        self.assertEqual(self.get_tree(root=0)[0].status_code, 404)
+
+        InventoryCategory.objects.filter(id=self.consumables.id).update(parent=self.nitrile)
+        response, _ = self.get_tree()
+        self.assertEqual([node['name'] for node in response.data], ['Consumables', 'Drugs'])
+        self.assertEqual(response.data[0]['total_item_count'], 4)
+
+    def test_category_lists_count_items_in_the_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('medical_inventory:category-list'))
+        self.assertEqual({category['name']: category['item_count'] for category in response.data}, {
+            'Consumables': 1, 'Gloves': 1, 'Nitrile': 2, 'Drugs': 0
+        })
+        response = self.client.get(reverse('medical_inventory:category-detail', args=[self.gloves.id]))
+        self.assertEqual(response.data['subcategories'], [{'id': self.nitrile.id, 'name': 'Nitrile', 'item_count': 2}])
+
+
+class ItemSearchTests(TestCase):
+    """Search ranks prefix matches first, tolerates typos and resolves scanned barcodes exactly"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='staff@example.com', password='pass', role='doctor')
+        cls.gloves = create_item('GLV-001', name='Nitrile gloves', barcode='4006381333931')
+        cls.syringe = create_item('SYR-010', name='Syringe 10ml', barcode='5012345678900')
+        cls.box = create_item('BOX-001', name='Glove box holder')
+        cls.gauze = create_item('GZE-001', name='Sterile gauze', barcode='40063813339')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('medical_inventory:item-list'), {'search': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.data]
+
+    def test_similarity_matches_pg_trgm(self):
+        # The example of PostgreSQL's pg_trgm documentation
+        self.assertAlmostEqual(similarity('word', 'two words'), 4 / 11)
+        self.assertEqual(similarity('', 'gloves'), 0)
+
+    def test_prefix_matches_rank_first(self):
+        self.assertEqual(self.search('glove'), ['Glove box holder', 'Nitrile gloves'])
+        self.assertEqual(self.search('syr'), ['Syringe 10ml'])
+        self.assertEqual(self.search('gloves', status='out_of_stock'), [])
+
+    def test_fuzzy_match_survives_typos(self):
+        self.assertEqual(self.search('syrnge'), ['Syringe 10ml'])
+        self.assertEqual(self.search('xyz'), [])
+
+    def test_scanned_barcode_is_an_exact_lookup(self):
+        self.assertEqual(self.search('4006381333931'), ['Nitrile gloves'])
+        # Part of a barcode still matches as a substring
+        self.assertEqual(self.search('4006381333'), ['Nitrile gloves', 'Sterile gauze'])
+
+
+class StockLedgerTests(TestCase):
+    """Stock changes update the item in one statement and are recorded in the ledger"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(email='staff@example.com', password='pass', role='doctor', is_staff=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.staff)
+        self.item = create_item(quantity=20)
+
+    def test_adjustment_writes_item_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('medical_inventory:item-adjust', args=[self.item.id]), {
+                'quantity': 16, 'transaction_type': 'usage'
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['item'], {
+            'id': self.item.id, 'name': self.item.name, 'quantity': 4, 'status': 'low_stock'
+        })
+        item_updates = [
+            query for query in queries if query['sql'].startswith('UPDATE "medical_inventory_inventoryitem"')
+        ]
+        self.assertEqual(len(item_updates), 1)
+
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.quantity, self.item.status), (4, 'low_stock'))
+        entry = InventoryTransaction.objects.get()
+        self.assertEqual((entry.quantity, entry.quantity_before, entry.quantity_after), (-16, 20, 4))
+
+    def test_overdraw_is_rejected(self):
+        response = self.client.post(reverse('medical_inventory:item-adjust', args=[self.item.id]), {
+            'quantity': 21, 'transaction_type': 'usage'
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        with self.assertRaises(InsufficientStock):
+            record_stock_change(self.item.id, -21, 'usage')
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity, 20)
+        self.assertFalse(InventoryTransaction.objects.exists())
+
+    def test_receiving_is_all_or_nothing(self):
+        supplier = Supplier.objects.create(name='MedSupply')
+        po = PurchaseOrder.objects.create(
+            order_number='PO-1', supplier=supplier, order_date=timezone.localdate(), status='ordered'
+        )
+        other = create_item(sku='SYR-001', quantity=0)
+        lines = [
+            PurchaseOrderItem.objects.create(purchase_order=po, item=item, quantity_ordered=10, unit_price=1)
+            for item in (self.item, other)
+        ]
+        url = reverse('medical_inventory:purchase-order-receive-items', args=[po.id])
+
+        response = self.client.post(url, {'items': [
+            {'po_item_id': lines[0].id, 'received_quantity': 10},
+            {'po_item_id': lines[1].id, 'received_quantity': 11},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity, 20)
+        self.assertFalse(InventoryTransaction.objects.exists())
+
+        response = self.client.post(url, {'items': [
+            {'po_item_id': lines[0].id, 'received_quantity': 10},
+            {'po_item_id': lines[1].id, 'received_quantity': 4},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['purchase_order']['status'], 'partially_received')
+        self.assertEqual([line['new_stock_level'] for line in response.data['received_items']], [30, 4])
+        other.refresh_from_db()
+        self.assertEqual((other.quantity, other.status), (4, 'low_stock'))
+        self.assertEqual(InventoryTransaction.objects.filter(transaction_type='purchase').count(), 2)
+
+
+class BulkReceivingTests(TestCase):
+    """Receiving a delivery takes the same number of queries however many lines it has"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(email='staff@example.com', password='pass', role='doctor', is_staff=True)
+        cls.supplier = Supplier.objects.create(name='MedSupply')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.staff)
+
+    def create_order(self, lines):
+        po = PurchaseOrder.objects.create(
+            order_number=f'PO-{lines}', supplier=self.supplier, order_date=timezone.localdate(), status='ordered'
+        )
+        items = InventoryItem.objects.bulk_create([
+            InventoryItem(name=f'Item {lines}-{i}', sku=f'SKU-{lines}-{i}', quantity=1, purchase_price=1)
+            for i in range(lines)
+        ])
+        return po, PurchaseOrderItem.objects.bulk_create([
+            PurchaseOrderItem(purchase_order=po, item=item, quantity_ordered=10, unit_price=1) for item in items
+        ])
+
+    def receive(self, po, lines, quantity=10):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('medical_inventory:purchase-order-receive-items', args=[po.id]), {
+                'items': [{'po_item_id': line.id, 'received_quantity': quantity} for line in lines]
+            }, format='json')
+        return response, len(queries)
+
+    def test_query_count_does_not_grow_with_lines(self):
+        small_po, small_lines = self.create_order(3)
+        large_po, large_lines = self.create_order(500)
+
+        response, small_queries = self.receive(small_po, small_lines)
+        self.assertEqual(response.status_code, 200)
+        response, large_queries = self.receive(large_po, large_lines)
+        self.assertEqual(response.status_code, 200)
+        if connection.features.max_query_params is None:
+            self.assertEqual(large_queries, small_queries)
+        self.assertLess(large_queries, 30)
+
+        self.assertEqual(response.data['purchase_order']['status'], 'received')
+        self.assertEqual({line['new_stock_level'] for line in response.data['received_items']}, {11})
+        self.assertFalse(PurchaseOrderItem.objects.filter(purchase_order=large_po, is_fully_received=False).exists())
+        self.assertEqual(InventoryTransaction.objects.filter(reference_id=large_po.id).count(), 500)
+        self.assertFalse(InventoryItem.objects.exclude(status='in_stock').exists())
+
+    def test_unknown_line_receives_nothing(self):
+        po, lines = self.create_order(2)
+        other_po, other_lines = self.create_order(1)
+        response, _ = self.receive(po, [lines[0], other_lines[0]], quantity=5)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(InventoryItem.objects.get(id=lines[0].item_id).quantity, 1)
+        self.assertFalse(InventoryTransaction.objects.exists())
+
+        response = self.client.post(reverse('medical_inventory:purchase-order-receive-items', args=[po.id]), {
+            'items': [{'po_item_id': lines[0].id, 'received_quantity': 'all'}]
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class PurchaseOrderCreationTests(TestCase):
+    """Order numbers come from a per-day counter and lines are inserted in bulk"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(email='staff@example.com', password='pass', role='doctor', is_staff=True)
+        cls.suppliers = Supplier.objects.bulk_create([Supplier(name=f'Supplier {i}') for i in range(3)])
+        cls.items = InventoryItem.objects.bulk_create([
+            InventoryItem(name=f'Item {i}', sku=f'SKU-{i}', quantity=0, purchase_price=1) for i in range(150)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.staff)
+        self.prefix = f"PO-{timezone.localdate().strftime('%Y%m%d')}-"
+
+    def order(self, supplier, items):
+        return {
+            'supplier_id': supplier.id,
+            'shipping_cost': '5.00',
+            'items': [{'item_id': item.id, 'quantity': 2, 'unit_price': '1.50'} for item in items]
+        }
+
+    def bulk_create(self, orders):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('medical_inventory:purchase-order-bulk-create'), {'orders': orders}, format='json'
+            )
+        return response, len(queries)
+
+    def test_create_numbers_orders_per_day(self):
+        url = reverse('medical_inventory:purchase-order-create')
+        response = self.client.post(url, self.order(self.suppliers[0], self.items[:2]), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['order_number'], self.prefix + '001')
+        self.assertEqual(response.data['total_amount'], '6.00')
+        po = PurchaseOrder.objects.get(id=response.data['id'])
+        self.assertEqual((po.status, po.order_date, po.grand_total), ('draft', timezone.localdate(), 11))
+        self.assertEqual(po.items.count(), 2)
+
+        response = self.client.post(url, self.order(self.suppliers[1], self.items[:1]), format='json')
+        self.assertEqual(response.data['order_number'], self.prefix + '002')
+        self.assertEqual(allocate_order_numbers(2), [self.prefix + '003', self.prefix + '004'])
+
+    def test_bulk_create_query_count_does_not_grow(self):
+        response, small_queries = self.bulk_create([self.order(self.suppliers[0], self.items[:2])])
+        self.assertEqual(response.status_code, 201)
+        response, large_queries = self.bulk_create([
+            self.order(supplier, self.items[i * 50:(i + 1) * 50]) for i, supplier in enumerate(self.suppliers)
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(large_queries, small_queries)
+
+        self.assertEqual(
+            [order['order_number'] for order in response.data['purchase_orders']],
+            [self.prefix + '002', self.prefix + '003', self.prefix + '004']
+        )
+        self.assertEqual(PurchaseOrderItem.objects.count(), 152)
+        self.assertEqual(PurchaseOrder.objects.get(order_number=self.prefix + '004').items.count(), 50)
+
+    def test_invalid_order_creates_nothing(self):
+        orders = [self.order(self.suppliers[0], self.items[:2]), self.order(self.suppliers[1], self.items[:1])]
+        orders[1]['items'].append({'item_id': 0, 'quantity': 1})
+        response, _ = self.bulk_create(orders)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(PurchaseOrder.objects.exists())
+        # The reserved numbers were rolled back with the orders
+        self.assertFalse(PurchaseOrderSequence.objects.filter(last_value__gt=0).exists())
+
+        orders[1]['items'] = [{'item_id': self.items[0].id, 'quantity': 1}] * 2
+        self.assertEqual(self.bulk_create(orders)[0].status_code, 400)
+        orders[1]['items'] = [{'item_id': self.items[0].id, 'quantity': 'two'}]
+        self.assertEqual(self.bulk_create(orders)[0].status_code, 400)
+        self.assertFalse(PurchaseOrder.objects.exists())
+
+
+class InventoryAlertTests(TestCase):
+    """The scanner alerts staff once per expiring or short item, reading only affected items"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(email='staff@example.com', password='pass', role='doctor', is_staff=True)
+        User.objects.create_user(email='former@example.com', password='pass', role='secretary', is_staff=True,
+                                 is_active=False)
+        User.objects.create_user(email='patient@example.com', password='pass', role='patient')
+        cls.today = timezone.localdate()
+
+    def setUp(self):
+        self.expiring = create_item('EXP-1', quantity=10, name='Saline', expiry_date=self.today + timedelta(days=5))
+        self.expired = create_item('EXP-2', quantity=7, name='Insulin', expiry_date=self.today - timedelta(days=1))
+        create_item('EXP-3', quantity=10, name='Bandages', expiry_date=self.today + timedelta(days=60))
+        create_item('EXP-4', quantity=0, name='Old vaccine', expiry_date=self.today - timedelta(days=400),
+                    status='out_of_stock')
+        self.short = create_item('LOW-1', quantity=2, name='Syringes', status='low_stock')
+
+    def test_scan_alerts_once(self):
+        result = scan_inventory(days=30, write_off=False)
+        self.assertEqual(result, {'written_off': 0, 'expiring': 2, 'short': 2, 'notified': 1})
+        notification = Notification.objects.get()
+        self.assertEqual(notification.user, self.staff)
+        self.assertIn('2 items expire by', notification.message)
+        self.assertIn('Insulin: 7 unit', notification.message)
+        self.assertIn('Syringes: 2 unit left', notification.message)
+
+        self.assertEqual(scan_inventory(days=30, write_off=False)['notified'], 0)
+        self.assertEqual(Notification.objects.count(), 1)
+
+    def test_overlapping_scans_do_not_share_items(self):
+        # Both scans see the same candidates and stamp at the same instant
+        candidates = InventoryItem.objects.filter(id__in=list(short_items().values_list('id', flat=True))).order_by('id')
+        self.assertEqual(candidates.count(), 2)
+        with mock.patch('medical_inventory.alerts.timezone.now', return_value=timezone.now()):
+            first = claim_items(candidates, 'stock_alert_sent_at')
+            second = claim_items(candidates.all(), 'stock_alert_sent_at')
+        self.assertEqual(len(first), 2)
+        self.assertEqual(second, [])
+
+    def test_alerts_again_after_restock_or_new_expiry_date(self):
+        scan_inventory(days=30, write_off=False)
+        record_stock_change(self.short.id, 10, 'purchase')
+        record_stock_change(self.short.id, -10, 'usage')
+        InventoryItem.objects.filter(id=self.expiring.id).update(
+            expiry_date=self.today + timedelta(days=10), expiry_alert_sent_at=None
+        )
+        self.assertEqual(scan_inventory(days=30, write_off=False), {
+            'written_off': 0, 'expiring': 1, 'short': 1, 'notified': 1
+        })
+
+    def test_write_off_expired_stock(self):
+        out = StringIO()
+        call_command('scan_inventory', '--write-off-expired', '--batch-size', '1', stdout=out)
+        self.assertIn('Wrote off 1 expired items, found 1 expiring and 2 short items', out.getvalue())
+        self.expired.refresh_from_db()
+        self.assertEqual((self.expired.quantity, self.expired.status), (0, 'out_of_stock'))
+        # Listed as written off only, not also as out of stock
+        self.assertIsNotNone(self.expired.stock_alert_sent_at)
+        self.assertEqual(Notification.objects.get().message.count(self.expired.name), 1)
+        entry = InventoryTransaction.objects.get(transaction_type='expired')
+        self.assertEqual((entry.item_id, entry.quantity, entry.quantity_after), (self.expired.id, -7, 0))
+        self.assertIn('1 expired items written off', Notification.objects.get().message)
+
+    def test_query_count_does_not_grow_with_catalog(self):
+        with CaptureQueriesContext(connection) as queries:
+            scan_inventory(days=30, write_off=True)
+        Notification.objects.all().delete()
+        InventoryItem.objects.update(expiry_alert_sent_at=None, stock_alert_sent_at=None)
+        InventoryItem.objects.filter(id=self.expired.id).update(quantity=7)
+        InventoryItem.objects.bulk_create([
+            InventoryItem(name=f'Healthy {i}', sku=f'OK-{i}', quantity=50, purchase_price=1,
+                          expiry_date=self.today + timedelta(days=365)) for i in range(300)
+        ])
+        with CaptureQueriesContext(connection) as more_queries:
+            scan_inventory(days=30, write_off=True)
+        self.assertEqual(len(more_queries), len(queries))
+
+
+def smoothed(daily_usage, rate):
+    """Exponential smoothing one day at a time, the definition forecasting vectorizes"""
+    for used in daily_usage:
+        rate = SMOOTHING_FACTOR * used + (1 - SMOOTHING_FACTOR) * rate
+    return rate
+
+
+class ConsumptionForecastTests(TestCase):
+    """Usage rates are smoothed from the ledger incrementally and drive reorder drafts"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(email='staff@example.com', password='pass', role='doctor', is_staff=True)
+        cls.today = timezone.localdate()
+        cls.start = cls.today - timedelta(days=20)
+
+    def setUp(self):
+        self.gloves = create_item('GLV-001', quantity=500, name='Gloves')
+        self.masks = create_item('MSK-001', quantity=500, name='Masks')
+
+    def use(self, item, usage, first_day=None):
+        """Record a day of usage per entry of usage, from first_day on"""
+        first_day = first_day or self.start
+        for offset, quantity in enumerate(usage):
+            if quantity:
+                entry = record_stock_change(item.id, -quantity, 'usage')
+                InventoryTransaction.objects.filter(id=entry.id).update(
+                    timestamp=day_start(first_day + timedelta(days=offset)) + timedelta(hours=offset % 12)
+                )
+
+    def rate(self, item):
+        return ConsumptionForecast.objects.get(item=item).daily_rate
+
+    def test_rates_match_daily_smoothing(self):
+        gloves = [4, 6, 5, 0, 8, 3, 5, 7, 2, 6]
+        masks = [0, 0, 0, 3, 0, 0, 0, 9, 0, 0]
+        self.use(self.gloves, gloves)
+        self.use(self.masks, masks)
+
+        result = update_consumption_rates(until=self.start + timedelta(days=9))
+        self.assertEqual(result, {'days': 10, 'items': 2})
+        self.assertAlmostEqual(self.rate(self.gloves), smoothed(gloves, sum(gloves) / 10))
+        # A new item starts from its mean usage since its first day of use
+        self.assertAlmostEqual(self.rate(self.masks), smoothed(masks[3:], sum(masks) / 7))
+
+    @mock.patch('medical_inventory.forecasting.WINDOW_DAYS', 2)
+    def test_later_runs_only_fold_in_new_days(self):
+        self.use(self.gloves, [4, 6, 5])
+        self.use(self.masks, [2, 2, 2])
+        update_consumption_rates(until=self.start + timedelta(days=2))
+        gloves_rate, masks_rate = self.rate(self.gloves), self.rate(self.masks)
+
+        later = [3, 0, 9, 1, 4]
+        self.use(self.gloves, later, first_day=self.start + timedelta(days=3))
+        with CaptureQueriesContext(connection) as queries:
+            result = update_consumption_rates(until=self.start + timedelta(days=7))
+        self.assertEqual(result, {'days': 5, 'items': 1})
+        self.assertAlmostEqual(self.rate(self.gloves), smoothed(later, gloves_rate))
+        # Masks were not used since: their rate is untouched and decays when read
+        self.assertEqual(self.rate(self.masks), masks_rate)
+        projection = next(p for p in project_stockouts(self.start + timedelta(days=8)) if p['item'] == self.masks)
+        self.assertAlmostEqual(projection['daily_rate'], smoothed([0] * 5, masks_rate))
+        usage_reads = [query for query in queries if 'GROUP BY' in query['sql']]
+        self.assertEqual(len(usage_reads), 3)
+
+        self.assertEqual(update_consumption_rates(until=self.start + timedelta(days=7))['items'], 0)
+        self.assertAlmostEqual(self.rate(self.gloves), smoothed(later, gloves_rate))
+
+    def test_draft_orders_per_supplier(self):
+        yesterday = self.today - timedelta(days=1)
+        cheap, pricey = Supplier.objects.bulk_create([Supplier(name='Cheap'), Supplier(name='Pricey')])
+        syringes = create_item('SYR-001', quantity=10, name='Syringes')
+        gauze = create_item('GZE-001', quantity=30, name='Gauze')
+        unknown = create_item('UNK-001', quantity=1, name='Never ordered')
+        covered = create_item('COV-001', quantity=5, name='Already ordered')
+        old_po, open_po, other_po = [
+            PurchaseOrder.objects.create(order_number=f'PO-{i}', supplier=supplier, status=status,
+                                         order_date=self.today - timedelta(days=days))
+            for i, (supplier, status, days) in enumerate([
+                (pricey, 'received', 90), (cheap, 'ordered', 3), (pricey, 'received', 30)
+            ])
+        ]
+        PurchaseOrderItem.objects.bulk_create([
+            PurchaseOrderItem(purchase_order=old_po, item=syringes, quantity_ordered=100, unit_price='0.90'),
+            PurchaseOrderItem(purchase_order=open_po, item=syringes, quantity_ordered=20, unit_price='0.40'),
+            PurchaseOrderItem(purchase_order=other_po, item=gauze, quantity_ordered=50, unit_price='2.00'),
+            PurchaseOrderItem(purchase_order=open_po, item=covered, quantity_ordered=500, unit_price='1.00'),
+        ])
+        ConsumptionForecast.objects.bulk_create([
+            ConsumptionForecast(item=item, daily_rate=rate, as_of=yesterday)
+            for item, rate in [(syringes, 5.0), (gauze, 2.5), (unknown, 1.0), (covered, 5.0), (self.gloves, 1.0)]
+        ])
+
+        response = self.client.get(reverse('medical_inventory:item-forecast'))
+        self.assertEqual(
+            [(row['name'], row['days_left']) for row in response.data][:3],
+            [('Never ordered', 1.0), ('Already ordered', 1.0), ('Syringes', 2.0)]
+        )
+        self.assertEqual(response.data[2]['stockout_date'], self.today + timedelta(days=2))
+
+        orders = draft_reorders(lead_days=14, cover_days=30, created_by=self.staff)
+        self.assertEqual([po.supplier for po in orders], [cheap, pricey])
+        self.assertTrue(all(po.status == 'draft' for po in orders))
+        lines = {line.item: line for line in PurchaseOrderItem.objects.filter(purchase_order__in=orders)}
+        self.assertEqual(set(lines), {syringes, gauze})
+        # 44 days of usage, less stock and what is still on order
+        self.assertEqual(lines[syringes].quantity_ordered, 5 * 44 - 10 - 20)
+        self.assertEqual(str(lines[syringes].unit_price), '0.40')
+        self.assertEqual(lines[gauze].quantity_ordered, math.ceil(2.5 * 44) - 30)
+
+        out = StringIO()
+        call_command('forecast_inventory', '--draft-orders', stdout=out)
+        self.assertIn('Drafted 0 purchase orders', out.getvalue())
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentStockTests(TransactionTestCase):
+    """Simultaneous dispensing of one item must not lose updates"""
+
+    # Threads hold one connection each; stay below PostgreSQL's default max_connections
+    THREADS = 20
+    CHANGES_PER_THREAD = 5
+
+    def test_no_lost_updates(self):
+        item = create_item(quantity=self.THREADS * self.CHANGES_PER_THREAD + 3)
+        barrier = threading.Barrier(self.THREADS)
+        errors = []
+
+        def dispense():
+            barrier.wait()
+            try:
+                for _ in range(self.CHANGES_PER_THREAD):
+                    record_stock_change(item.id, -1, 'usage')
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=dispense) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        item.refresh_from_db()
+        self.assertEqual((item.quantity, item.status), (3, 'low_stock'))
+        # Every change saw the result of the previous one
+        after = sorted(InventoryTransaction.objects.values_list('quantity_after', flat=True))
+        self.assertEqual(after, list(range(3, 3 + self.THREADS * self.CHANGES_PER_THREAD)))
+
+    def test_concurrent_order_numbers_are_distinct(self):
+        barrier = threading.Barrier(self.THREADS)
+        numbers = []
+        errors = []
+
+        def allocate():
+            barrier.wait()
+            try:
+                for _ in range(self.CHANGES_PER_THREAD):
+                    numbers.extend(allocate_order_numbers())
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=allocate) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(set(numbers)), self.THREADS * self.CHANGES_PER_THREAD)
+        self.assertEqual(PurchaseOrderSequence.objects.get().last_value, self.THREADS * self.CHANGES_PER_THREAD)
@@ -6,6 +6,7 @@ app_name = 'medical_inventory'
 urlpatterns = [
     # Category endpoints
     path('categories/', views.get_inventory_categories, name='category-list'),
+    path('categories/tree/', views.get_category_tree, name='category-tree'),
     path('categories/<int:category_id>/', views.get_category_detail, name='category-detail'),
     path('categories/create/', views.create_category, name='category-create'),
     path('categories/<int:category_id>/update/', views.update_category, name='category-update'),
@@ -13,6 +14,7 @@ urlpatterns = [
     
     # Inventory item endpoints
     path('items/', views.get_inventory_items, name='item-list'),
+    path('items/forecast/', views.get_stock_forecast, name='item-forecast'),
     path('items/<int:item_id>/', views.get_item_detail, name='item-detail'),
     path('items/create/', views.create_item, name='item-create'),
     path('items/<int:item_id>/update/', views.update_item, name='item-update'),
@@ -30,6 +32,7 @@ urlpatterns = [
     path('purchase-orders/', views.get_purchase_orders, name='purchase-order-list'),
     path('purchase-orders/<int:po_id>/', views.get_purchase_order_detail, name='purchase-order-detail'),
     path('purchase-orders/create/', views.create_purchase_order, name='purchase-order-create'),
+    path('purchase-orders/bulk-create/', views.bulk_create_purchase_orders, name='purchase-order-bulk-create'),
     path('purchase-orders/<int:po_id>/update-status/', views.update_purchase_order_status, name='purchase-order-update-status'),
     path('purchase-orders/<int:po_id>/receive-items/', views.receive_purchase_order_items, name='purchase-order-receive-items'),
 ]
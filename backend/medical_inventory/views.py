@@ -1,6 +1,8 @@
+from decimal import Decimal
 from django.shortcuts import render, get_object_or_404
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.db.models import Q, Sum, F, Count
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import api_view, permission_classes, action
@@ -10,6 +12,11 @@ from .models import (
     InventoryCategory, InventoryItem, InventoryTransaction,
     Supplier, PurchaseOrder, PurchaseOrderItem
 )
+from .categories import category_tree
+from .forecasting import project_stockouts
+from .ledger import InsufficientStock, record_stock_change
+from .purchasing import PurchaseOrderError, create_purchase_orders, receive_purchase_order
+from .search import search_items
 
 # Custom permission classes
 class IsStaffOrReadOnly(permissions.BasePermission):
@@ -26,26 +33,56 @@ class IsStaffOrReadOnly(permissions.BasePermission):
 @api_view(['GET'])
 def get_inventory_categories(request):
     """Get all inventory categories"""
-    categories = InventoryCategory.objects.all()
+    categories = InventoryCategory.objects.annotate(item_count=Count('items'))
     
     # Format response data
     data = [{
         'id': category.id,
         'name': category.name,
         'description': category.description,
-        'parent_id': category.parent.id if category.parent else None,
-        'item_count': category.items.count()
+        'parent_id': category.parent_id,
+        'item_count': category.item_count
     } for category in categories]
     
     return Response(data, status=status.HTTP_200_OK)
 
+def category_node_data(node):
+    return {
+        'id': node['id'],
+        'name': node['name'],
+        'description': node['description'],
+        'parent_id': node['parent_id'],
+        'item_count': node['item_count'],
+        'stock_value': str(node['stock_value']),
+        'total_item_count': node['total_item_count'],
+        'total_stock_value': str(node['total_stock_value']),
+        'children': [category_node_data(child) for child in node['children']]
+    }
+
+@api_view(['GET'])
+def get_category_tree(request):
+    """Get the category hierarchy with item counts and stock values rolled up to each category"""
+    root_id = request.query_params.get('root')
+    try:
+        tree = category_tree(int(root_id) if root_id else None)
+    except ValueError:
+        return Response({
+            'error': _('Invalid root category')
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except InventoryCategory.DoesNotExist:
+        return Response({
+            'error': _('Category not found')
+        }, status=status.HTTP_404_NOT_FOUND)
+    
+    return Response([category_node_data(node) for node in tree], status=status.HTTP_200_OK)
+
 @api_view(['GET'])
 def get_category_detail(request, category_id):
     """Get details of a specific category"""
     category = get_object_or_404(InventoryCategory, id=category_id)
     
     # Get subcategories
-    subcategories = category.subcategories.all()
+    subcategories = category.subcategories.annotate(item_count=Count('items'))
     
     # Get items in this category
     items = category.items.all()
@@ -54,13 +91,13 @@ def get_category_detail(request, category_id):
         'id': category.id,
         'name': category.name,
         'description': category.description,
-        'parent_id': category.parent.id if category.parent else None,
+        'parent_id': category.parent_id,
         'created_at': category.created_at,
         'updated_at': category.updated_at,
         'subcategories': [{
             'id': subcat.id,
             'name': subcat.name,
-            'item_count': subcat.items.count()
+            'item_count': subcat.item_count
         } for subcat in subcategories],
         'items': [{
             'id': item.id,
@@ -202,7 +239,7 @@ def get_inventory_items(request):
     low_stock_only = request.query_params.get('low_stock') == 'true'
     
     # Base query
-    queryset = InventoryItem.objects.all()
+    queryset = InventoryItem.objects.select_related('category')
     
     # Apply filters
     if category_id:
@@ -215,11 +252,8 @@ def get_inventory_items(request):
         queryset = queryset.filter(quantity__lt=F('minimum_stock'))
     
     if search_query:
-        queryset = queryset.filter(
-            Q(name__icontains=search_query) | 
-            Q(sku__icontains=search_query) | 
-            Q(barcode__icontains=search_query)
-        )
+        # Ranked best match first
+        queryset = search_items(queryset, search_query)
     
     # Format response data
     data = [{
@@ -240,6 +274,23 @@ def get_inventory_items(request):
     
     return Response(data, status=status.HTTP_200_OK)
 
+@api_view(['GET'])
+def get_stock_forecast(request):
+    """Get projected stock-out dates from each item's consumption rate"""
+    projections = project_stockouts()
+    
+    data = [{
+        'id': projection['item'].id,
+        'name': projection['item'].name,
+        'sku': projection['item'].sku,
+        'quantity': projection['item'].quantity,
+        'daily_usage': round(projection['daily_rate'], 2),
+        'days_left': round(projection['days_left'], 1),
+        'stockout_date': projection['stockout_date']
+    } for projection in projections]
+    
+    return Response(data, status=status.HTTP_200_OK)
+
 @api_view(['GET'])
 def get_item_detail(request, item_id):
     """Get details of a specific inventory item"""
@@ -420,6 +471,7 @@ def update_item(request, item_id):
     
     if 'expiry_date' in request.data:
         item.expiry_date = request.data['expiry_date']
+        item.expiry_alert_sent_at = None
     
     if 'storage_location' in request.data:
         item.storage_location = request.data['storage_location']
@@ -473,34 +525,15 @@ def adjust_inventory(request, item_id):
     if transaction_type in ['usage', 'expired'] and quantity > 0:
         quantity = -quantity
     
-    # Check if we have enough stock for negative adjustments
-    if quantity < 0 and abs(quantity) > item.quantity:
-        return Response({
-            'error': _('Not enough stock for this adjustment')
-        }, status=status.HTTP_400_BAD_REQUEST)
-    
-    # Create the transaction
+    # Apply the change and record the transaction; the stock check happens
+    # under the item's row lock so concurrent adjustments cannot oversell
     try:
-        # Record quantity before
-        quantity_before = item.quantity
-        
-        # Update item quantity
-        item.quantity += quantity
-        item.save()
-        
-        # Update status
-        item.update_status()
-        
-        # Create transaction record
-        transaction = InventoryTransaction.objects.create(
-            item=item,
-            transaction_type=transaction_type,
-            quantity=quantity,
-            quantity_before=quantity_before,
-            quantity_after=item.quantity,
+        transaction = record_stock_change(
+            item.id, quantity, transaction_type,
             performed_by=request.user,
             notes=notes
         )
+        item = transaction.item
         
         return Response({
             'success': _('Inventory adjusted successfully'),
@@ -518,6 +551,10 @@ def adjust_inventory(request, item_id):
             }
         }, status=status.HTTP_200_OK)
         
+    except InsufficientStock as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({
             'error': str(e)
@@ -833,113 +870,106 @@ def get_purchase_order_detail(request, po_id):
     
     return Response(data, status=status.HTTP_200_OK)
 
+def parse_purchase_order(data):
+    """
+    Read a purchase order from request data, as create_purchase_orders() expects it.
+
+    Raises:
+        ValueError: When a field is missing or malformed
+    """
+    lines = data.get('items') or []
+    if not isinstance(lines, list):
+        raise ValueError
+    expected_delivery_date = data.get('expected_delivery_date')
+    if expected_delivery_date:
+        expected_delivery_date = parse_date(expected_delivery_date)
+        if expected_delivery_date is None:
+            raise ValueError
+    return {
+        'supplier_id': int(data['supplier_id']),
+        'expected_delivery_date': expected_delivery_date or None,
+        'shipping_cost': Decimal(str(data.get('shipping_cost', 0))),
+        'tax_amount': Decimal(str(data.get('tax_amount', 0))),
+        'notes': data.get('notes', ''),
+        'lines': [{
+            'item_id': int(line['item_id']),
+            'quantity': int(line.get('quantity', 1)),
+            'unit_price': Decimal(str(line.get('unit_price', 0)))
+        } for line in lines]
+    }
+
+
+def purchase_order_data(po):
+    return {
+        'id': po.id,
+        'order_number': po.order_number,
+        'supplier': {
+            'id': po.supplier.id,
+            'name': po.supplier.name
+        },
+        'status': po.status,
+        'total_amount': str(po.total_amount),
+        'created_at': po.created_at
+    }
+
+
+def create_purchase_orders_response(request, orders_data, many=False):
+    """Create purchase orders from request data and respond with them"""
+    try:
+        orders = [parse_purchase_order(order_data) for order_data in orders_data]
+    except (AttributeError, KeyError, TypeError, ValueError, ArithmeticError):
+        return Response({
+            'error': _('Each purchase order needs a supplier_id and items with an item_id, an integer quantity and a unit_price')
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        purchase_orders = create_purchase_orders(orders, created_by=request.user)
+    except (Supplier.DoesNotExist, InventoryItem.DoesNotExist) as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_404_NOT_FOUND)
+    except PurchaseOrderError as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    if many:
+        data = {'purchase_orders': [purchase_order_data(po) for po in purchase_orders]}
+    else:
+        data = purchase_order_data(purchase_orders[0])
+    return Response(data, status=status.HTTP_201_CREATED)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated, IsStaffOrReadOnly])
 def create_purchase_order(request):
     """Create a new purchase order"""
-    # Get data from request
-    supplier_id = request.data.get('supplier_id')
-    reference_number = request.data.get('reference_number', '')
-    expected_delivery_date = request.data.get('expected_delivery_date')
-    shipping_cost = request.data.get('shipping_cost', 0)
-    tax_amount = request.data.get('tax_amount', 0)
-    discount_amount = request.data.get('discount_amount', 0)
-    notes = request.data.get('notes', '')
-    items_data = request.data.get('items', [])
-    
-    # Validate required fields
-    if not supplier_id:
+    if not request.data.get('supplier_id'):
         return Response({
             'error': _('Supplier is required')
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    if not items_data:
+    if not request.data.get('items'):
         return Response({
             'error': _('At least one item is required')
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    # Get supplier
-    try:
-        supplier = Supplier.objects.get(id=supplier_id)
-    except Supplier.DoesNotExist:
+    return create_purchase_orders_response(request, [request.data])
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsStaffOrReadOnly])
+def bulk_create_purchase_orders(request):
+    """Create several purchase orders at once, in one transaction"""
+    orders_data = request.data.get('orders')
+    if not orders_data or not isinstance(orders_data, list):
         return Response({
-            'error': _('Supplier not found')
-        }, status=status.HTTP_404_NOT_FOUND)
+            'error': _('At least one purchase order is required')
+        }, status=status.HTTP_400_BAD_REQUEST)
     
-    # Create the purchase order
-    try:
-        # Generate order number
-        today = timezone.now().date()
-        order_count = PurchaseOrder.objects.filter(
-            created_at__date=today
-        ).count() + 1
-        order_number = f"PO-{today.strftime('%Y%m%d')}-{order_count:03d}"
-        
-        # Create purchase order
-        po = PurchaseOrder.objects.create(
-            order_number=order_number,
-            reference_number=reference_number,
-            supplier=supplier,
-            expected_delivery_date=expected_delivery_date,
-            shipping_cost=shipping_cost,
-            tax_amount=tax_amount,
-            discount_amount=discount_amount,
-            notes=notes,
-            created_by=request.user,
-            status='draft'
-        )
-        
-        # Add items to purchase order
-        total_amount = float(shipping_cost) + float(tax_amount) - float(discount_amount)
-        
-        for item_data in items_data:
-            item_id = item_data.get('item_id')
-            quantity = int(item_data.get('quantity', 1))
-            unit_price = float(item_data.get('unit_price', 0))
-            
-            # Get inventory item
-            try:
-                inventory_item = InventoryItem.objects.get(id=item_id)
-            except InventoryItem.DoesNotExist:
-                # Delete the purchase order if item not found
-                po.delete()
-                return Response({
-                    'error': _('Item not found: ') + str(item_id)
-                }, status=status.HTTP_404_NOT_FOUND)
-            
-            # Calculate total price
-            total_price = quantity * unit_price
-            total_amount += total_price
-            
-            # Create purchase order item
-            PurchaseOrderItem.objects.create(
-                purchase_order=po,
-                item=inventory_item,
-                quantity=quantity,
-                unit_price=unit_price,
-                total_price=total_price
-            )
-        
-        # Update total amount
-        po.total_amount = total_amount
-        po.save()
-        
-        return Response({
-            'id': po.id,
-            'order_number': po.order_number,
-            'supplier': {
-                'id': po.supplier.id,
-                'name': po.supplier.name
-            },
-            'status': po.status,
-            'total_amount': str(po.total_amount),
-            'created_at': po.created_at
-        }, status=status.HTTP_201_CREATED)
-        
-    except Exception as e:
-        return Response({
-            'error': str(e)
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return create_purchase_orders_response(request, orders_data, many=True)
 
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated, IsStaffOrReadOnly])
@@ -994,15 +1024,9 @@ def update_purchase_order_status(request, po_id):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated, IsStaffOrReadOnly])
 def receive_purchase_order_items(request, po_id):
-    """Receive items for a purchase order"""
+    """Receive items for a purchase order, all lines in one transaction"""
     po = get_object_or_404(PurchaseOrder, id=po_id)
     
-    # Check if purchase order can be received
-    if po.status in ['draft', 'cancelled']:
-        return Response({
-            'error': _('Cannot receive items for a draft or cancelled purchase order')
-        }, status=status.HTTP_400_BAD_REQUEST)
-    
     # Get data from request
     items_data = request.data.get('items', [])
     notes = request.data.get('notes', '')
@@ -1012,95 +1036,44 @@ def receive_purchase_order_items(request, po_id):
             'error': _('At least one item must be specified')
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    # Process received items
+    # Quantity received per purchase order line
     try:
-        all_received = True
-        received_items = []
-        
+        received = {}
         for item_data in items_data:
-            po_item_id = item_data.get('po_item_id')
-            received_quantity = int(item_data.get('received_quantity', 0))
-            
-            # Get purchase order item
-            try:
-                po_item = PurchaseOrderItem.objects.get(id=po_item_id, purchase_order=po)
-            except PurchaseOrderItem.DoesNotExist:
-                return Response({
-                    'error': _('Purchase order item not found: ') + str(po_item_id)
-                }, status=status.HTTP_404_NOT_FOUND)
-            
-            # Validate received quantity
-            remaining_quantity = po_item.quantity - po_item.received_quantity
-            if received_quantity <= 0 or received_quantity > remaining_quantity:
-                return Response({
-                    'error': _('Invalid received quantity for item: ') + po_item.item.name
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Update received quantity
-            po_item.received_quantity += received_quantity
-            
-            # Check if fully received
-            if po_item.received_quantity >= po_item.quantity:
-                po_item.is_received = True
-            else:
-                all_received = False
-            
-            # Save changes
-            po_item.save()
-            
-            # Update inventory
-            inventory_item = po_item.item
-            quantity_before = inventory_item.quantity
-            inventory_item.quantity += received_quantity
-            inventory_item.save()
-            
-            # Update item status
-            inventory_item.update_status()
-            
-            # Create inventory transaction
-            transaction = InventoryTransaction.objects.create(
-                item=inventory_item,
-                transaction_type='purchase',
-                quantity=received_quantity,
-                quantity_before=quantity_before,
-                quantity_after=inventory_item.quantity,
-                performed_by=request.user,
-                reference_id=po.id,
-                reference_type='PurchaseOrder',
-                notes=f"Received from PO #{po.order_number}"
-            )
-            
-            received_items.append({
-                'item_name': inventory_item.name,
-                'received_quantity': received_quantity,
-                'new_stock_level': inventory_item.quantity
-            })
-        
-        # Update purchase order status
-        if all_received:
-            po.status = 'received'
-            po.delivery_date = timezone.now().date()
-        else:
-            po.status = 'partial'
-        
-        # Add notes if provided
-        if notes:
-            po.notes = (po.notes + '\n' if po.notes else '') + f"[{timezone.now().strftime('%Y-%m-%d %H:%M')}] Items received: {notes}"
-        
-        # Save changes
-        po.save()
-        
+            po_item_id = int(item_data.get('po_item_id'))
+            if po_item_id in received:
+                raise ValueError
+            received[po_item_id] = int(item_data.get('received_quantity', 0))
+    except (AttributeError, TypeError, ValueError):
         return Response({
-            'success': _('Items received successfully'),
-            'purchase_order': {
-                'id': po.id,
-                'order_number': po.order_number,
-                'status': po.status
-            },
-            'received_items': received_items
-        }, status=status.HTTP_200_OK)
-        
+            'error': _('Each item needs a distinct po_item_id and an integer received_quantity')
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        po, received_lines = receive_purchase_order(po.id, received, performed_by=request.user, notes=notes)
+    except PurchaseOrderItem.DoesNotExist as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_404_NOT_FOUND)
+    except PurchaseOrderError as e:
+        return Response({
+            'error': str(e)
+        }, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    return Response({
+        'success': _('Items received successfully'),
+        'purchase_order': {
+            'id': po.id,
+            'order_number': po.order_number,
+            'status': po.status
+        },
+        'received_items': [{
+            'item_name': line['item'].name,
+            'received_quantity': received[line['line'].id],
+            'new_stock_level': line['new_stock_level']
+        } for line in received_lines]
+    }, status=status.HTTP_200_OK)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class NotificationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'notifications'
+
+    def ready(self):
+        # Keep the cached unread counts in step with row-by-row changes
+        import notifications.signals  # noqa: F401
+        # Warn at startup when outgoing mail would not be delivered
+        import notifications.checks  # noqa: F401
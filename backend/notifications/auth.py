@@ -0,0 +1,113 @@
+import asyncio
+import time
+from collections import namedtuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from accounts.models import User
+
+# Identity of a WebSocket connection; consumers only need the id and role
+SocketUser = namedtuple('SocketUser', ['id', 'role'])
+
+# Entries kept by the user cache before expired ones are dropped
+USER_CACHE_MAX_SIZE = 10000
+
+
+class SocketAuthenticationError(Exception):
+    """Raised when a WebSocket token does not identify an active user"""
+
+
+class UserCache:
+    """
+    Short-lived, per-process memory of looked up users. It lives in the
+    event loop's process so a hit costs no thread pool hop, unlike Django's
+    cache API whose async methods run the sync backend in a thread.
+    """
+
+    def __init__(self, max_size=USER_CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self.entries = {}
+        # Lookups in flight, shared by connections of the same user
+        self.pending = {}
+
+    def get(self, user_id):
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        expires, user = entry
+        if expires < time.monotonic():
+            del self.entries[user_id]
+            return None
+        return user
+
+    def set(self, user, ttl):
+        now = time.monotonic()
+        if len(self.entries) >= self.max_size:
+            self.entries = {key: entry for key, entry in self.entries.items() if entry[0] >= now}
+            if len(self.entries) >= self.max_size:
+                self.entries.clear()
+        self.entries[user.id] = (now + ttl, user)
+
+    async def fetch(self, user_id, ttl):
+        """
+        The cached user, or the result of looking it up. Concurrent misses
+        for the same user, as in a reconnect storm, share one lookup.
+        """
+        user = self.get(user_id)
+        if user is not None:
+            return user
+        lookup = self.pending.get(user_id)
+        if lookup is None or lookup.get_loop() is not asyncio.get_running_loop():
+            lookup = asyncio.ensure_future(sync_to_async(lookup_user)(user_id))
+            self.pending[user_id] = lookup
+            lookup.add_done_callback(lambda _: self.pending.pop(user_id, None))
+        # A cancelled connection does not cancel the lookup others wait for
+        user = await asyncio.shield(lookup)
+        if user is not None:
+            self.set(user, ttl)
+        return user
+
+    def clear(self):
+        self.entries.clear()
+        self.pending.clear()
+
+
+user_cache = UserCache()
+
+
+def lookup_user(user_id):
+    user = User.objects.filter(id=user_id, is_active=True).values_list('id', 'role').first()
+    return SocketUser(*user) if user else None
+
+
+async def authenticate_token(token):
+    """
+    Identify the user of a WebSocket connection from an access token.
+
+    The signature and expiry are checked in the event loop: it is CPU work
+    and needs no thread. With WEBSOCKET_AUTH_MODE 'claims' the user id and
+    role signed into the token are trusted as they are, so connecting costs
+    no database query. In 'database' mode, and for tokens issued without a
+    role claim, the user row is checked and remembered for
+    WEBSOCKET_USER_CACHE_TTL seconds, so reconnects skip the query.
+
+    Raises:
+        TokenError: When the token is invalid or expired
+        SocketAuthenticationError: When the user does not exist or is inactive
+    """
+    validated_token = AccessToken(token)
+    user_id = validated_token[api_settings.USER_ID_CLAIM]
+    role = validated_token.get('role')
+    if settings.WEBSOCKET_AUTH_MODE == 'claims' and role:
+        return SocketUser(user_id, role)
+
+    ttl = settings.WEBSOCKET_USER_CACHE_TTL
+    if ttl:
+        user = await user_cache.fetch(user_id, ttl)
+    else:
+        user = await sync_to_async(lookup_user)(user_id)
+    if user is None:
+        raise SocketAuthenticationError(f'No active user {user_id}')
+    return user
+
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import statistics
+import time
+from asgiref.testing import ApplicationCommunicator
+from channels import DEFAULT_CHANNEL_LAYER
+from channels.layers import channel_layers, get_channel_layer
+from rest_framework_simplejwt.tokens import AccessToken
+from .consumers import NotificationConsumer
+
+# Sockets connected concurrently while setting up a benchmark; each pending
+# group_add holds a Redis connection and redis-py pools default to 100
+CONNECT_CHUNK_SIZE = 50
+
+
+class SocketClient:
+    """
+    In-process WebSocket client driving one NotificationConsumer instance
+    through the ASGI interface, the way a browser connection would.
+    """
+
+    def __init__(self, application, token):
+        self.communicator = ApplicationCommunicator(application, {
+            'type': 'websocket',
+            'path': '/ws/notifications/',
+            'query_string': f'token={token}'.encode(),
+            'headers': [],
+            'subprotocols': [],
+        })
+
+    async def connect(self, timeout=10):
+        """Open the socket and consume the connection confirmation"""
+        await self.communicator.send_input({'type': 'websocket.connect'})
+        response = await self.receive(timeout)
+        if response['type'] != 'websocket.accept':
+            raise ConnectionError(f'WebSocket rejected: {response}')
+        return await self.receive_json(timeout)
+
+    async def receive(self, timeout=10):
+        # Read the queue directly: on timeout the consumer keeps running
+        return await asyncio.wait_for(self.communicator.output_queue.get(), timeout)
+
+    async def receive_json(self, timeout=10):
+        message = await self.receive(timeout)
+        if 'text' not in message:
+            raise ConnectionError(f'Unexpected WebSocket message: {message}')
+        return json.loads(message['text'])
+
+    async def close(self, timeout=5):
+        await self.communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await self.communicator.wait(timeout)
+
+
+def access_token(user):
+    """
+    Access token with the claims of one issued at login (see
+    accounts.tokens.RoleRefreshToken), minted without recording a refresh token
+    """
+    token = AccessToken.for_user(user)
+    token['role'] = user.role
+    return str(token)
+
+
+def percentile(values, fraction):
+    """Value below which the given fraction of the sorted values fall"""
+    if not values:
+        return None
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+async def run_fanout_benchmark(users, sockets, rounds=5, timeout=10, sender_layer=None):
+    """
+    Connect `sockets` NotificationConsumer sockets spread over `users`, then
+    push `rounds` notifications to every user's group and measure how long
+    each socket takes to receive them.
+
+    The notifications are sent from sender_layer, by default a separate
+    instance of the configured channel layer, standing in for another worker
+    process. The consumers use the process-wide layer as usual.
+
+    Returns a dict with connection time, delivery counts, latency
+    percentiles (milliseconds) and deliveries per second.
+    """
+    application = NotificationConsumer.as_asgi()
+    tokens = {user.id: access_token(user) for user in users}
+    user_ids = [users[i % len(users)].id for i in range(sockets)]
+    clients = [SocketClient(application, tokens[user_id]) for user_id in user_ids]
+    sender = sender_layer or channel_layers.make_backend(DEFAULT_CHANNEL_LAYER)
+
+    started = time.perf_counter()
+    for offset in range(0, len(clients), CONNECT_CHUNK_SIZE):
+        await asyncio.gather(*(client.connect(timeout) for client in clients[offset:offset + CONNECT_CHUNK_SIZE]))
+    connect_seconds = time.perf_counter() - started
+
+    async def deliver(client):
+        try:
+            message = await client.receive_json(timeout)
+        except asyncio.TimeoutError:
+            return None
+        return time.perf_counter() - message['sent_at']
+
+    latencies = []
+    elapsed = 0
+    try:
+        for round_number in range(rounds):
+            receivers = [asyncio.ensure_future(deliver(client)) for client in clients]
+            sent_at = time.perf_counter()
+            for user in users:
+                await sender.group_send(f'notifications_{user.id}', {
+                    'type': 'send_notification',
+                    'data': {'type': 'benchmark', 'round': round_number, 'sent_at': sent_at},
+                })
+            results = await asyncio.gather(*receivers)
+            elapsed += time.perf_counter() - sent_at
+            latencies.extend(latency for latency in results if latency is not None)
+    finally:
+        await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+        for layer in {id(sender): sender, id(get_channel_layer()): get_channel_layer()}.values():
+            if hasattr(layer, 'flush'):
+                await layer.flush()
+
+    latencies.sort()
+    milliseconds = [latency * 1000 for latency in latencies]
+    return {
+        'backend': type(sender).__name__,
+        'sockets': sockets,
+        'users': len(users),
+        'rounds': rounds,
+        'connect_seconds': connect_seconds,
+        'expected': sockets * rounds,
+        'delivered': len(latencies),
+        'p50_ms': percentile(milliseconds, 0.5),
+        'p95_ms': percentile(milliseconds, 0.95),
+        'max_ms': milliseconds[-1] if milliseconds else None,
+        'mean_ms': statistics.mean(milliseconds) if milliseconds else None,
+        'deliveries_per_second': len(latencies) / elapsed if elapsed else 0,
+    }
+
+
+async def run_connect_benchmark(users, sockets, concurrency=None, timeout=30, application=None):
+    """
+    Open `sockets` sockets spread over `users` against the ASGI application,
+    up to `concurrency` handshakes at a time (all at once by default), the
+    way clients reconnect after a deploy, and measure how long each takes to
+    be authenticated and accepted.
+
+    Returns a dict with the number of sockets opened, handshake latency
+    percentiles (milliseconds) and connections per second.
+    """
+    if application is None:
+        from cabinet.asgi import application
+    tokens = {user.id: access_token(user) for user in users}
+    clients = [SocketClient(application, tokens[users[i % len(users)].id]) for i in range(sockets)]
+    limit = asyncio.Semaphore(concurrency or sockets)
+
+    async def open_socket(client):
+        async with limit:
+            started = time.perf_counter()
+            try:
+                await client.connect(timeout)
+            except (ConnectionError, asyncio.TimeoutError):
+                return None
+            return time.perf_counter() - started
+
+    started = time.perf_counter()
+    try:
+        results = await asyncio.gather(*(open_socket(client) for client in clients))
+        elapsed = time.perf_counter() - started
+    finally:
+        await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+        layer = get_channel_layer()
+        if hasattr(layer, 'flush'):
+            await layer.flush()
+
+    milliseconds = sorted(latency * 1000 for latency in results if latency is not None)
+    return {
+        'sockets': sockets,
+        'users': len(users),
+        'connected': len(milliseconds),
+        'seconds': elapsed,
+        'p50_ms': percentile(milliseconds, 0.5),
+        'p95_ms': percentile(milliseconds, 0.95),
+        'max_ms': milliseconds[-1] if milliseconds else None,
+        'connections_per_second': len(milliseconds) / elapsed if elapsed else 0,
+    }
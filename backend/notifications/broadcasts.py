@@ -0,0 +1,187 @@
+import logging
+from datetime import datetime, time, timedelta
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from accounts.models import User
+from appointments.models import Appointment
+from .models import Broadcast, Notification
+from .outbox import enqueue, outbox_handler
+from .services import create_notifications
+
+logger = logging.getLogger(__name__)
+
+# Recipients notified per transaction: one bulk insert and one push per chunk
+BROADCAST_CHUNK_SIZE = 500
+
+# Appointments in these states make a patient part of an appointment cohort
+COHORT_APPOINTMENT_STATUSES = ['scheduled', 'confirmed']
+
+# Cohort filters, all of which narrow the audience to patients
+COHORT_FILTERS = {'blood_types', 'doctor_id', 'appointment_from', 'appointment_to'}
+
+
+def _day_start(value):
+    day = parse_date(value) if isinstance(value, str) else None
+    if day is None:
+        raise ValueError(f'Invalid date: {value}')
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def clean_audience(roles, filters):
+    """
+    Validate the audience of a broadcast.
+
+    Args:
+        roles (list): Targeted user roles; defaults to patients when filters are given
+        filters (dict): Optional cohort filters narrowing the patients:
+            blood_types (list), doctor_id (patients with an appointment with
+            this doctor), appointment_from / appointment_to (ISO dates,
+            patients with an upcoming appointment in this range)
+
+    Returns:
+        tuple: The roles and filters to store
+
+    Raises:
+        ValueError: When the audience is malformed
+    """
+    filters = filters or {}
+    if not isinstance(filters, dict) or set(filters) - COHORT_FILTERS:
+        raise ValueError(f'Filters must be an object with keys among {", ".join(sorted(COHORT_FILTERS))}')
+    if roles is None and filters:
+        roles = [User.Role.PATIENT]
+    if not isinstance(roles, list) or not roles or set(roles) - set(User.Role.values):
+        raise ValueError(f'Roles must be a non-empty list among {", ".join(User.Role.values)}')
+    if filters and roles != [User.Role.PATIENT]:
+        raise ValueError('Cohort filters only apply to patients')
+
+    if 'blood_types' in filters and not isinstance(filters['blood_types'], list):
+        raise ValueError('blood_types must be a list')
+    if 'doctor_id' in filters:
+        try:
+            filters['doctor_id'] = int(filters['doctor_id'])
+        except (TypeError, ValueError):
+            raise ValueError('doctor_id must be a user id')
+    for key in ('appointment_from', 'appointment_to'):
+        if key in filters:
+            _day_start(filters[key])
+    return list(roles), filters
+
+
+def recipients(roles, filters):
+    """Active users targeted by a broadcast audience, see clean_audience()"""
+    users = User.objects.filter(is_active=True, role__in=roles)
+    if 'blood_types' in filters:
+        users = users.filter(patient_profile__blood_type__in=filters['blood_types'])
+
+    appointment_filters = {}
+    if 'doctor_id' in filters:
+        appointment_filters['doctor_id'] = filters['doctor_id']
+    if 'appointment_from' in filters or 'appointment_to' in filters:
+        appointment_filters['status__in'] = COHORT_APPOINTMENT_STATUSES
+    if 'appointment_from' in filters:
+        appointment_filters['start_time__gte'] = _day_start(filters['appointment_from'])
+    if 'appointment_to' in filters:
+        appointment_filters['start_time__lt'] = _day_start(filters['appointment_to']) + timedelta(days=1)
+    if appointment_filters:
+        # EXISTS keeps one row per patient however many appointments match
+        users = users.filter(Exists(
+            Appointment.objects.filter(patient__user=OuterRef('pk'), **appointment_filters)
+        ))
+    return users
+
+
+def start_broadcast(sender, title, message, notification_type='system', roles=None, filters=None):
+    """
+    Record a broadcast and queue it for the outbox worker, which notifies
+    the recipients in chunks. Returns the Broadcast; its progress is
+    reported by broadcast_progress().
+
+    Raises:
+        ValueError: When the audience is malformed
+    """
+    roles, filters = clean_audience(roles, filters)
+    with transaction.atomic():
+        broadcast = Broadcast.objects.create(
+            sender=sender,
+            title=title,
+            message=message,
+            notification_type=notification_type,
+            roles=roles,
+            filters=filters,
+            total_recipients=recipients(roles, filters).count()
+        )
+        enqueue('notification_broadcast', {'broadcast_id': broadcast.id})
+    return broadcast
+
+
+def broadcast_progress(broadcast):
+    """Status of a broadcast as returned by the API"""
+    total = broadcast.total_recipients
+    return {
+        'id': broadcast.id,
+        'title': broadcast.title,
+        'status': broadcast.status,
+        'total_recipients': total,
+        'sent_count': broadcast.sent_count,
+        'progress': min(broadcast.sent_count / total, 1.0) if total else 1.0,
+        'created_at': broadcast.created_at,
+        'completed_at': broadcast.completed_at,
+    }
+
+
+def send_broadcast_chunk(broadcast_id, chunk_size=None):
+    """
+    Notify the next chunk of recipients of a broadcast in one transaction.
+    The broadcast row is locked and its cursor advanced in the same
+    transaction, so a retried or concurrent delivery resumes where the last
+    committed chunk stopped and nobody is notified twice.
+
+    Returns:
+        bool: Whether recipients remain
+    """
+    chunk_size = chunk_size or BROADCAST_CHUNK_SIZE
+    with transaction.atomic():
+        broadcast = Broadcast.objects.select_for_update().filter(id=broadcast_id).first()
+        if broadcast is None or broadcast.status == 'completed':
+            return False
+
+        user_ids = list(
+            recipients(broadcast.roles, broadcast.filters)
+            .filter(id__gt=broadcast.last_user_id)
+            .order_by('id')
+            .values_list('id', flat=True)[:chunk_size]
+        )
+        create_notifications([
+            Notification(
+                user_id=user_id,
+                title=broadcast.title,
+                message=broadcast.message,
+                notification_type=broadcast.notification_type,
+                related_object_id=broadcast.id,
+                related_object_type='broadcast',
+                is_sent=True
+            )
+            for user_id in user_ids
+        ])
+
+        broadcast.sent_count += len(user_ids)
+        if user_ids:
+            broadcast.last_user_id = user_ids[-1]
+        if len(user_ids) < chunk_size:
+            broadcast.status = 'completed'
+            broadcast.completed_at = timezone.now()
+        else:
+            broadcast.status = 'running'
+        broadcast.save(update_fields=['sent_count', 'last_user_id', 'status', 'completed_at'])
+
+    logger.info(f"Broadcast {broadcast.id}: {broadcast.sent_count}/{broadcast.total_recipients} notified")
+    return broadcast.status != 'completed'
+
+
+@outbox_handler('notification_broadcast')
+def deliver_broadcast(payload):
+    """Outbox handler notifying every recipient of a queued broadcast"""
+    while send_broadcast_chunk(payload['broadcast_id']):
+        pass
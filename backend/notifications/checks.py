@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Email backends that never deliver a message (locmem is left to the test runner)
+UNDELIVERED_EMAIL_BACKENDS = [
+    'django.core.mail.backends.console.EmailBackend',
+    'django.core.mail.backends.dummy.EmailBackend',
+    'django.core.mail.backends.filebased.EmailBackend',
+]
+
+
+@register(Tags.compatibility)
+def check_email_delivery(app_configs, **kwargs):
+    """
+    Outside DEBUG, warn when EMAIL_BACKEND does not deliver mail: password
+    resets, confirmations and reminders all go through it, and the default
+    console backend only prints them.
+    """
+    if settings.DEBUG or settings.EMAIL_BACKEND not in UNDELIVERED_EMAIL_BACKENDS:
+        return []
+    return [Warning(
+        f'EMAIL_BACKEND is {settings.EMAIL_BACKEND}, so password reset, confirmation and reminder '
+        f'emails are not delivered.',
+        hint='Set EMAIL_BACKEND=django.core.mail.backends.smtp.EmailBackend with EMAIL_HOST, EMAIL_PORT, '
+             'EMAIL_HOST_USER, EMAIL_HOST_PASSWORD and EMAIL_USE_TLS, or USE_SES=True in production.',
+        id='notifications.W001',
+    )]
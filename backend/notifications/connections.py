@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Identifies this worker process in the published metrics
+WORKER_ID = f'{socket.gethostname()}:{os.getpid()}'
+
+# Cache key listing the workers that published metrics, and prefix of their metrics
+METRICS_KEY = 'notifications:websocket:workers'
+
+
+def publish_metrics(stats, timeout):
+    """Store a worker's connection metrics where any process can read them"""
+    cache.set(f"{METRICS_KEY}:{stats['worker']}", stats, timeout)
+    workers = cache.get(METRICS_KEY) or []
+    published = cache.get_many([f'{METRICS_KEY}:{worker}' for worker in workers])
+    # Forget workers whose metrics expired (stopped processes)
+    alive = [worker for worker in workers if f'{METRICS_KEY}:{worker}' in published]
+    if stats['worker'] not in alive:
+        alive.append(stats['worker'])
+    if alive != workers:
+        # Concurrent updates may drop a worker; it registers again on its next tick
+        cache.set(METRICS_KEY, alive, None)
+
+
+def worker_metrics():
+    """Latest connection metrics of every worker that published recently"""
+    workers = cache.get(METRICS_KEY) or []
+    metrics = cache.get_many([f'{METRICS_KEY}:{worker}' for worker in workers])
+    return sorted(metrics.values(), key=lambda stats: stats['worker'])
+
+
+class ConnectionRegistry:
+    """
+    The notification sockets open in this worker process. While any are
+    open, a single task sends them a heartbeat every
+    WEBSOCKET_HEARTBEAT_INTERVAL seconds and closes those the client has not
+    sent anything on for WEBSOCKET_IDLE_TIMEOUT seconds, so dead sockets
+    leave their groups instead of waiting for the channel layer to expire them.
+    """
+
+    def __init__(self):
+        self.connections = {}
+        self.opened = 0
+        self.closed = 0
+        self.reaped = 0
+        self.task = None
+
+    def add(self, consumer):
+        consumer.last_seen = time.monotonic()
+        self.connections[consumer.channel_name] = consumer
+        self.opened += 1
+        self.ensure_running()
+
+    def touch(self, consumer):
+        """Record activity from the client"""
+        consumer.last_seen = time.monotonic()
+
+    def remove(self, consumer):
+        if self.connections.pop(getattr(consumer, 'channel_name', None), None) is None:
+            return
+        self.closed += 1
+        # Stop the heartbeat task with the last socket, unless it is the one reaping it
+        if not self.connections and self.task is not None and self.task is not asyncio.current_task():
+            self.task.cancel()
+            self.task = None
+
+    def stats(self):
+        return {
+            'worker': WORKER_ID,
+            'open_connections': len(self.connections),
+            'users': len({consumer.user.id for consumer in self.connections.values()}),
+            'opened_total': self.opened,
+            'closed_total': self.closed,
+            'reaped_total': self.reaped,
+            'updated_at': timezone.now().isoformat(),
+        }
+
+    def ensure_running(self):
+        if not settings.WEBSOCKET_HEARTBEAT_INTERVAL:
+            return
+        loop = asyncio.get_running_loop()
+        if self.task is None or self.task.done() or self.task.get_loop() is not loop:
+            self.task = loop.create_task(self.run())
+
+    async def run(self):
+        interval = settings.WEBSOCKET_HEARTBEAT_INTERVAL
+        while self.connections:
+            await asyncio.sleep(interval)
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.error(f"WebSocket heartbeat failed: {str(e)}")
+
+    async def tick(self, now=None):
+        """Reap idle sockets, send a heartbeat to the others and publish metrics"""
+        now = now if now is not None else time.monotonic()
+        idle_before = now - settings.WEBSOCKET_IDLE_TIMEOUT
+        idle = [consumer for consumer in self.connections.values() if consumer.last_seen < idle_before]
+        for consumer in idle:
+            self.remove(consumer)
+            self.reaped += 1
+        alive = list(self.connections.values())
+
+        results = await asyncio.gather(
+            *(consumer.reap() for consumer in idle),
+            *(consumer.send_heartbeat({}) for consumer in alive),
+            return_exceptions=True
+        )
+        for error in results:
+            if isinstance(error, Exception):
+                logger.warning(f"WebSocket heartbeat could not be sent: {str(error)}")
+
+        stats = self.stats()
+        if idle:
+            logger.info(f"Reaped {len(idle)} idle WebSocket connections, {stats['open_connections']} open")
+        await sync_to_async(publish_metrics)(stats, settings.WEBSOCKET_HEARTBEAT_INTERVAL * 3)
+        return stats
+
+
+connections = ConnectionRegistry()
@@ -1,15 +1,15 @@
 import json
-from channels.generic.websocket import AsyncWebsocketConsumer
-from rest_framework_simplejwt.tokens import AccessToken, TokenError
-from django.contrib.auth import get_user_model
 from asgiref.sync import sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from rest_framework_simplejwt.tokens import TokenError
 import logging
 from urllib.parse import parse_qs
+from .auth import SocketAuthenticationError, authenticate_token
+from .connections import connections
+from .events import frame, replay_events
 
 logger = logging.getLogger(__name__)
 
-User = get_user_model()
-
 class NotificationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         try:
@@ -24,13 +24,10 @@ class NotificationConsumer(AsyncWebsocketConsumer):
                 
             logger.info(f"Token received: {token[:10]}...")
             
-            # Validate token
+            # Validate token; see authenticate_token for when the database is queried
             try:
-                validated_token = await sync_to_async(AccessToken)(token)
-                user_id = validated_token['user_id']
-                
-                # Get user
-                self.user = await sync_to_async(User.objects.get)(id=user_id)
+                self.user = await authenticate_token(token)
+                user_id = self.user.id
                 logger.info(f"Authenticated user: {self.user.id}")
                 
                 # Accept connection
@@ -42,6 +39,9 @@ class NotificationConsumer(AsyncWebsocketConsumer):
                     self.channel_name
                 )
                 
+                # Heartbeats and idle reaping, see ConnectionRegistry
+                connections.add(self)
+                
                 # Send connection confirmation
                 await self.send(text_data=json.dumps({
                     'type': 'connection',
@@ -49,7 +49,14 @@ class NotificationConsumer(AsyncWebsocketConsumer):
                     'user_id': user_id
                 }))
                 
-            except TokenError as e:
+                # Catch up on what was missed since the client's last seen notification
+                last_id = query_string.get('last_id', [None])[0]
+                if last_id and last_id.isdigit():
+                    await self.send(text_data=json.dumps(
+                        await sync_to_async(lambda: frame(replay_events(user_id, int(last_id))))()
+                    ))
+                
+            except (TokenError, SocketAuthenticationError) as e:
                 logger.error(f"Token validation failed: {str(e)}")
                 await self.close(code=4001)
                 
@@ -58,6 +65,7 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             await self.close(code=4000)
 
     async def receive(self, text_data):
+        connections.touch(self)
         if text_data == 'ping':
             await self.send('pong')
         else:
@@ -72,7 +80,16 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             'message': 'connection_active'
         }))
 
+    async def reap(self):
+        """Drop a socket the client stopped answering on"""
+        await self.channel_layer.group_discard(
+            f'notifications_{self.user.id}',
+            self.channel_name
+        )
+        await self.close(code=4002)
+
     async def disconnect(self, close_code):
+        connections.remove(self)
         if hasattr(self, 'user') and self.user:
             await self.channel_layer.group_discard(
                 f'notifications_{self.user.id}',
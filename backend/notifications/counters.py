@@ -0,0 +1,53 @@
+from django.core.cache import cache
+from django.db import transaction
+from .models import Notification
+
+# Cached counts expire after this many seconds, bounding any drift
+UNREAD_COUNT_TIMEOUT = 60 * 60
+
+
+def unread_count_key(user_id):
+    return f'notifications:unread:{user_id}'
+
+
+def get_unread_count(user_id):
+    """Number of unread notifications of a user, counted in the database only on a cache miss"""
+    key = unread_count_key(user_id)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(user_id=user_id, is_read=False).count()
+        # add() does not overwrite a value a concurrent change just stored
+        cache.add(key, count, UNREAD_COUNT_TIMEOUT)
+    return count
+
+
+def change_unread_count(user_id, delta):
+    """
+    Adjust a user's cached unread count once the current transaction
+    commits. Nothing is cached yet when the key is missing, and the next
+    read recounts; a count that would go negative has drifted and is
+    dropped for the same reason.
+    """
+    if not delta:
+        return
+
+    def apply():
+        key = unread_count_key(user_id)
+        try:
+            count = cache.incr(key, delta)
+        except ValueError:
+            return
+        if count < 0:
+            cache.delete(key)
+
+    transaction.on_commit(apply)
+
+
+
+def invalidate_unread_count(user_id):
+    """
+    Drop a user's cached unread count once the current transaction commits,
+    for changes made row by row (admin edits, deletes) rather than through
+    change_unread_count; the next read recounts.
+    """
+    transaction.on_commit(lambda: cache.delete(unread_count_key(user_id)))
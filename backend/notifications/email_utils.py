@@ -1,26 +1,11 @@
-import smtplib
-from email.mime.text import MIMEText
-import os
-from django.conf import settings
-
 def send_email(to, subject, body):
-    msg = MIMEText(body)
-    msg['Subject'] = subject
-    msg['From'] = 'cheddadyasse2002@gmail.com'
-    msg['To'] = to
+    """
+    Send a single email through the configured Django email backend
     
-    # Get email credentials from settings
-    email = 'cheddadyasse2002@gmail.com'
-    password = 'qnhp vejy qjmk ipwa'  # App password for Gmail
-    smtp_host = 'smtp.gmail.com'
-    smtp_port = 587
+    SMTP host and credentials come from the EMAIL_* settings. Use
+    notifications.services.send_bulk_email for many recipients, which
+    reuses one connection per batch.
+    """
+    from .services import send_email_notification
     
-    try:
-        with smtplib.SMTP(smtp_host, smtp_port) as server:
-            server.starttls()
-            server.login(email, password)
-            server.send_message(msg)
-            return True
-    except Exception as e:
-        print(f"Error sending email: {str(e)}")
-        return False
\ No newline at end of file
+    return send_email_notification(to, subject, body)
@@ -0,0 +1,123 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import transaction
+from .counters import get_unread_count
+from .models import Notification
+from .utils import send_notifications
+
+# Events of each user collected by the innermost active coalesce_events() block
+_pending = ContextVar('pending_notification_events', default=None)
+
+# Missed notifications replayed to a reconnecting socket; past this many the
+# client is told to reload its list instead
+REPLAY_LIMIT = 100
+
+
+def notification_event(notification):
+    """Event announcing a new notification, carrying what the client displays"""
+    return {
+        'type': 'notification',
+        'id': notification.id,
+        'title': notification.title,
+        'message': notification.message,
+        'notification_type': notification.notification_type,
+        'is_read': notification.is_read,
+        'created_at': notification.created_at.isoformat(),
+        'related_object_id': notification.related_object_id,
+        'related_object_type': notification.related_object_type,
+    }
+
+
+def read_event(notification_ids=None, up_to_id=None):
+    """
+    Event announcing that notifications were marked as read: the given ids,
+    or all of them (up to up_to_id when given)
+    """
+    event = {'type': 'notifications_read'}
+    if notification_ids is not None:
+        event['ids'] = list(notification_ids)
+    if up_to_id is not None:
+        event['up_to_id'] = up_to_id
+    if len(event) == 1:
+        event['all'] = True
+    return event
+
+
+def unread_count_event(user_id):
+    """
+    Event carrying the user's unread count. It is built when the frame is
+    sent, after the transaction's counter changes have been applied.
+    """
+    return lambda: {'type': 'unread_count', 'count': get_unread_count(user_id)}
+
+
+def replay_events(user_id, last_id, limit=None):
+    """
+    Events bringing a reconnecting socket up to date: the user's
+    notifications newer than last_id, oldest first, read with one query on
+    the (user, id) index, then the unread count and a 'replay' marker. When
+    more than limit were missed none are sent and the marker is 'truncated'.
+    """
+    limit = limit or REPLAY_LIMIT
+    missed = list(
+        Notification.objects.filter(user_id=user_id, id__gt=last_id).order_by('id')[:limit + 1]
+    )
+    truncated = len(missed) > limit
+    events = [] if truncated else [notification_event(notification) for notification in missed]
+    events.append({'type': 'replay', 'count': len(events), 'truncated': truncated})
+    events.append(unread_count_event(user_id))
+    return events
+
+
+def frame(events):
+    """A single WebSocket frame for one or more events"""
+    # Deferred events are unread counts, of which only the latest matters
+    deferred = [event for event in events if callable(event)]
+    events = [event for event in events if not callable(event)] + [event() for event in deferred[-1:]]
+    if len(events) == 1:
+        return events[0]
+    return {'type': 'batch', 'events': events}
+
+
+def push_events(user_id, events):
+    """Send events to a user's sockets as one frame once the current transaction commits"""
+    events = list(events)
+    if events:
+        transaction.on_commit(lambda: send_notifications({user_id: frame(events)}))
+
+
+def push_event(user_id, event):
+    """
+    Push a state change to a user's sockets. Inside coalesce_events() the
+    event is held back and sent with the user's other events in one frame.
+    """
+    pending = _pending.get()
+    if pending is not None:
+        pending[user_id].append(event)
+    else:
+        push_events(user_id, [event])
+
+
+@contextmanager
+def coalesce_events():
+    """
+    Collect the events pushed inside the block and send each user a single
+    frame when it exits, so bursts (bulk creation, mark-all-read) cost one
+    channel layer round trip per user, all sent from one event loop.
+    Nested blocks join the outer one.
+    """
+    if _pending.get() is not None:
+        yield
+        return
+
+    pending = defaultdict(list)
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+    if pending:
+        transaction.on_commit(lambda: send_notifications({
+            user_id: frame(events) for user_id, events in pending.items()
+        }))
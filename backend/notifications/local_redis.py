@@ -0,0 +1,75 @@
+import socket
+import threading
+from django.core.exceptions import ImproperlyConfigured
+
+PUBSUB_LAYER = 'channels_redis.pubsub.RedisPubSubChannelLayer'
+CORE_LAYER = 'channels_redis.core.RedisChannelLayer'
+
+
+class LocalRedisServer:
+    """
+    In-process Redis stand-in (fakeredis) listening on a local TCP port.
+
+    The real channels_redis layers connect to it like to any Redis server,
+    so separate layer instances behave like separate worker processes
+    sharing one Redis. Meant for tests and benchmarks; requires fakeredis
+    (and lupa for the core layer's Lua scripts), installed with
+    requirements-dev.txt.
+
+        with LocalRedisServer() as redis_server:
+            with override_settings(CHANNEL_LAYERS=redis_server.channel_layers()):
+                ...
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port or self._free_port(host)
+        self.server = None
+        self.thread = None
+
+    @staticmethod
+    def _free_port(host):
+        with socket.socket() as sock:
+            sock.bind((host, 0))
+            return sock.getsockname()[1]
+
+    @property
+    def url(self):
+        return f'redis://{self.host}:{self.port}'
+
+    def channel_layers(self, backend=PUBSUB_LAYER):
+        """A CHANNEL_LAYERS setting pointing the default layer at this server"""
+        return {
+            'default': {
+                'BACKEND': backend,
+                'CONFIG': {
+                    'hosts': [self.url],
+                },
+            },
+        }
+
+    def start(self):
+        try:
+            from fakeredis import TcpFakeServer
+        except ImportError as e:
+            raise ImproperlyConfigured(
+                'The local Redis server requires fakeredis; install it with pip install -r requirements-dev.txt'
+            ) from e
+
+        self.server = TcpFakeServer((self.host, self.port), server_type='redis')
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,71 @@
+from contextlib import ExitStack
+from asgiref.sync import async_to_sync
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from accounts.models import User
+from notifications.benchmarks import run_fanout_benchmark
+from notifications.local_redis import CORE_LAYER, PUBSUB_LAYER, LocalRedisServer
+
+LOCAL_REDIS_LAYERS = {
+    'pubsub': PUBSUB_LAYER,
+    'core': CORE_LAYER,
+}
+
+
+class Command(BaseCommand):
+    help = ('Measures notification fan-out latency and throughput to many connected NotificationConsumer '
+            'sockets, sending from a separate channel layer instance as another worker process would')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sockets', type=int, default=2000, help='Number of connected sockets')
+        parser.add_argument('--users', type=int, default=500, help='Number of users the sockets are spread over')
+        parser.add_argument('--rounds', type=int, default=5, help='Notifications pushed to every user')
+        parser.add_argument('--timeout', type=float, default=10.0, help='Seconds to wait for each delivery')
+        parser.add_argument('--local-redis', choices=sorted(LOCAL_REDIS_LAYERS),
+                            help='Run against an in-process Redis stand-in with the given channels_redis layer '
+                                 'instead of the configured CHANNEL_LAYERS')
+
+    def handle(self, *args, **options):
+        if min(options['sockets'], options['users'], options['rounds']) <= 0:
+            raise CommandError('--sockets, --users and --rounds must be positive')
+
+        with ExitStack() as stack:
+            if options['local_redis']:
+                try:
+                    server = stack.enter_context(LocalRedisServer())
+                except ImproperlyConfigured as e:
+                    raise CommandError(str(e))
+                stack.enter_context(override_settings(
+                    CHANNEL_LAYERS=server.channel_layers(LOCAL_REDIS_LAYERS[options['local_redis']])
+                ))
+            result = self.run_benchmark(options)
+
+        self.stdout.write(
+            f"{result['backend']}: {result['sockets']} sockets over {result['users']} users, "
+            f"connected in {result['connect_seconds']:.2f}s"
+        )
+        self.stdout.write(f"Delivered {result['delivered']} of {result['expected']} notifications")
+        if result['delivered']:
+            self.stdout.write(
+                f"Latency p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, max {result['max_ms']:.1f} ms; "
+                f"{result['deliveries_per_second']:.0f} deliveries/s"
+            )
+        if result['delivered'] < result['expected']:
+            raise CommandError('Some notifications were not delivered within --timeout')
+        self.stdout.write(self.style.SUCCESS('Every socket received every notification'))
+
+    def run_benchmark(self, options):
+        # Benchmark users only live inside this transaction, which is rolled back
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(email=f'benchmark-{i}@example.invalid', role='patient', password='!')
+                for i in range(options['users'])
+            ])
+            try:
+                return async_to_sync(run_fanout_benchmark)(
+                    users, options['sockets'], options['rounds'], options['timeout']
+                )
+            finally:
+                transaction.set_rollback(True)
@@ -0,0 +1,67 @@
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from accounts.models import User
+from notifications.auth import user_cache
+from notifications.benchmarks import run_connect_benchmark
+
+AUTH_MODES = ['claims', 'database']
+
+
+class Command(BaseCommand):
+    help = ('Opens many WebSocket connections at once against the ASGI application, as clients do when '
+            'reconnecting after a deploy, and compares handshake latency across authentication modes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sockets', type=int, default=2000, help='Number of sockets opened at once')
+        parser.add_argument('--users', type=int, default=500, help='Number of users the sockets are spread over')
+        parser.add_argument('--concurrency', type=int, help='Handshakes in flight at a time (default: all)')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Seconds to wait for each handshake')
+        parser.add_argument('--mode', choices=AUTH_MODES, action='append',
+                            help='WEBSOCKET_AUTH_MODE to measure; repeat for several (default: all)')
+        parser.add_argument('--cache-ttl', type=int, default=0,
+                            help='WEBSOCKET_USER_CACHE_TTL in database mode (default: 0, no cache)')
+
+    def handle(self, *args, **options):
+        if min(options['sockets'], options['users']) <= 0:
+            raise CommandError('--sockets and --users must be positive')
+
+        failed = False
+        for mode in options['mode'] or AUTH_MODES:
+            user_cache.clear()
+            with override_settings(WEBSOCKET_AUTH_MODE=mode, WEBSOCKET_USER_CACHE_TTL=options['cache_ttl']):
+                result, queries = self.run_benchmark(options)
+            self.stdout.write(
+                f"{mode}: {result['connected']} of {result['sockets']} sockets over {result['users']} users "
+                f"connected in {result['seconds']:.2f}s ({result['connections_per_second']:.0f}/s), "
+                f"{queries} database queries"
+            )
+            if result['connected']:
+                self.stdout.write(
+                    f"  Handshake p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, "
+                    f"max {result['max_ms']:.1f} ms"
+                )
+            failed = failed or result['connected'] < result['sockets']
+
+        if failed:
+            raise CommandError('Some sockets were not accepted within --timeout')
+        self.stdout.write(self.style.SUCCESS('Every socket was accepted'))
+
+    def run_benchmark(self, options):
+        # Benchmark users only live inside this transaction, which is rolled back.
+        # The consumers' lookups run on this thread (thread-sensitive
+        # sync_to_async), so they see the users and are counted here.
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(email=f'benchmark-{i}@example.invalid', role='patient', password='!')
+                for i in range(options['users'])
+            ])
+            try:
+                with CaptureQueriesContext(connection) as queries:
+                    result = async_to_sync(run_connect_benchmark)(
+                        users, options['sockets'], options['concurrency'], options['timeout']
+                    )
+                return result, len(queries)
+            finally:
+                transaction.set_rollback(True)
@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from notifications.outbox import DEFAULT_BATCH_SIZE, DEFAULT_MAX_ATTEMPTS, process_outbox
+
+
+class Command(BaseCommand):
+    help = 'Delivers queued outbox messages (appointment confirmations, emails, SMS) with retries and backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Number of messages claimed per batch')
+        parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                            help='Attempts before a message is marked as failed')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new messages instead of exiting')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds to wait between polls when the outbox is empty (with --loop)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0 or options['max_attempts'] <= 0:
+            raise CommandError('--batch-size and --max-attempts must be positive')
+
+        while True:
+            # Drain every due message, one batch at a time, including the
+            # messages the handlers queue (a confirmation's email and SMS)
+            while True:
+                result = process_outbox(options['batch_size'], options['max_attempts'])
+                if result['processed']:
+                    self.stdout.write(
+                        f"Processed {result['processed']} messages: {result['sent']} sent, {result['failed']} failed"
+                    )
+                if not result['processed']:
+                    break
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('Outbox drained'))
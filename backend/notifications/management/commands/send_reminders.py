@@ -0,0 +1,37 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from notifications.reminders import DEFAULT_BATCH_SIZE, send_due_reminders
+
+
+class Command(BaseCommand):
+    help = "Sends appointment reminders that are due according to each patient's reminder time preference"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Number of reminders claimed and dispatched per batch')
+        parser.add_argument('--loop', action='store_true', help='Keep checking for due reminders instead of exiting')
+        parser.add_argument('--interval', type=float, default=60.0,
+                            help='Seconds to wait between checks (with --loop)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size must be positive')
+
+        while True:
+            # Send every due reminder, one batch at a time
+            while True:
+                result = send_due_reminders(batch_size=options['batch_size'])
+                if result['claimed']:
+                    self.stdout.write(
+                        f"Sent reminders for {result['claimed']} appointments: "
+                        f"{result['emails_sent']} emails ({result['emails_failed']} failed), "
+                        f"{result['sms_sent']} SMS ({result['sms_failed']} failed)"
+                    )
+                if result['claimed'] < options['batch_size']:
+                    break
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('No reminders due'))
@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-17 06:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0003_outboxmessage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboxmessage',
+            name='event_type',
+            field=models.CharField(choices=[('appointment_confirmation', 'Appointment Confirmation'), ('notification_broadcast', 'Notification Broadcast')], max_length=50, verbose_name='Event Type'),
+        ),
+        migrations.CreateModel(
+            name='Broadcast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255, verbose_name='Title')),
+                ('message', models.TextField(verbose_name='Message')),
+                ('notification_type', models.CharField(choices=[('appointment', 'Appointment'), ('prescription', 'Prescription'), ('message', 'Message'), ('system', 'System')], default='system', max_length=20, verbose_name='Notification Type')),
+                ('roles', models.JSONField(default=list, verbose_name='Roles')),
+                ('filters', models.JSONField(blank=True, default=dict, verbose_name='Filters')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed')], default='pending', max_length=10, verbose_name='Status')),
+                ('total_recipients', models.PositiveIntegerField(default=0, verbose_name='Total Recipients')),
+                ('sent_count', models.PositiveIntegerField(default=0, verbose_name='Sent')),
+                ('last_user_id', models.PositiveBigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True, verbose_name='Completed At')),
+                ('sender', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='broadcasts', to=settings.AUTH_USER_MODEL, verbose_name='Sender')),
+            ],
+            options={
+                'verbose_name': 'Broadcast',
+                'verbose_name_plural': 'Broadcasts',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
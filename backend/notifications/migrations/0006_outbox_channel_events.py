@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 06:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0005_notification_user_id_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboxmessage',
+            name='event_type',
+            field=models.CharField(choices=[('appointment_confirmation', 'Appointment Confirmation'), ('notification_broadcast', 'Notification Broadcast'), ('send_email', 'Email'), ('send_sms', 'SMS')], max_length=50, verbose_name='Event Type'),
+        ),
+    ]
@@ -45,14 +45,23 @@ class Notification(models.Model):
         verbose_name = _('Notification')
         verbose_name_plural = _('Notifications')
         ordering = ['-created_at']
+        indexes = [
+            # Newest notifications of a user, optionally filtered by read state
+            models.Index(fields=['user', 'is_read', '-created_at'], name='notif_user_read_created_idx'),
+            models.Index(fields=['user', '-created_at'], name='notif_user_created_idx'),
+            # Notifications a reconnecting socket missed, after its last seen id
+            models.Index(fields=['user', 'id'], name='notif_user_id_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.get_full_name()} - {self.title} ({self.created_at})"
     
     def mark_as_read(self):
-        """Mark notification as read"""
+        """Mark notification as read, keeping the unread counter in step"""
+        from .services import mark_notifications_read
+        
+        mark_notifications_read(self.user, [self.id])
         self.is_read = True
-        self.save(update_fields=['is_read', 'updated_at'])
     
     def mark_as_sent(self):
         """Mark notification as sent"""
@@ -97,3 +106,92 @@ class NotificationSetting(models.Model):
     
     def __str__(self):
         return f"Notification Settings for {self.user.get_full_name()}"
+
+class OutboxMessage(models.Model):
+    """Outgoing email/SMS work recorded in the same transaction as the change that caused it"""
+    STATUS_CHOICES = [
+        ('pending', _('Pending')),
+        ('sent', _('Sent')),
+        ('failed', _('Failed')),
+    ]
+    
+    EVENT_CHOICES = [
+        ('appointment_confirmation', _('Appointment Confirmation')),
+        ('notification_broadcast', _('Notification Broadcast')),
+        ('send_email', _('Email')),
+        ('send_sms', _('SMS')),
+    ]
+    
+    event_type = models.CharField(max_length=50, choices=EVENT_CHOICES, verbose_name=_('Event Type'))
+    payload = models.JSONField(default=dict, verbose_name=_('Payload'))
+    
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name=_('Status'))
+    attempts = models.PositiveIntegerField(default=0, verbose_name=_('Attempts'))
+    last_error = models.TextField(blank=True, verbose_name=_('Last Error'))
+    
+    # The message is not picked up again before this time (retry backoff)
+    available_at = models.DateTimeField(default=timezone.now, verbose_name=_('Available At'))
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Sent At'))
+    
+    class Meta:
+        verbose_name = _('Outbox Message')
+        verbose_name_plural = _('Outbox Messages')
+        ordering = ['id']
+        indexes = [
+            # Worker polling: due pending messages in insertion order
+            models.Index(
+                fields=['available_at', 'id'],
+                condition=models.Q(status='pending'),
+                name='outbox_pending_idx'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_type} #{self.id} ({self.status})"
+
+class Broadcast(models.Model):
+    """A notification sent to every user of some roles, optionally narrowed to a patient cohort"""
+    STATUS_CHOICES = [
+        ('pending', _('Pending')),
+        ('running', _('Running')),
+        ('completed', _('Completed')),
+    ]
+    
+    sender = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='broadcasts',
+        verbose_name=_('Sender')
+    )
+    
+    title = models.CharField(max_length=255, verbose_name=_('Title'))
+    message = models.TextField(verbose_name=_('Message'))
+    notification_type = models.CharField(
+        max_length=20,
+        choices=Notification.TYPE_CHOICES,
+        default='system',
+        verbose_name=_('Notification Type')
+    )
+    
+    # Targeted roles and cohort filters, see notifications.broadcasts
+    roles = models.JSONField(default=list, verbose_name=_('Roles'))
+    filters = models.JSONField(default=dict, blank=True, verbose_name=_('Filters'))
+    
+    # Progress: recipients are notified in id order, everyone up to last_user_id is done
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name=_('Status'))
+    total_recipients = models.PositiveIntegerField(default=0, verbose_name=_('Total Recipients'))
+    sent_count = models.PositiveIntegerField(default=0, verbose_name=_('Sent'))
+    last_user_id = models.PositiveBigIntegerField(default=0)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Completed At'))
+    
+    class Meta:
+        verbose_name = _('Broadcast')
+        verbose_name_plural = _('Broadcasts')
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.title} ({self.sent_count}/{self.total_recipients})"
@@ -0,0 +1,115 @@
+import logging
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MAX_ATTEMPTS = 5
+
+# Retry delays grow as RETRY_BASE_DELAY * 2 ** (attempts - 1), up to RETRY_MAX_DELAY
+RETRY_BASE_DELAY = timedelta(seconds=30)
+RETRY_MAX_DELAY = timedelta(hours=1)
+
+# A claimed message becomes due again after this long if its worker dies mid-delivery
+CLAIM_LEASE = timedelta(minutes=5)
+
+# Delivery functions, keyed by event type
+HANDLERS = {}
+
+
+class OutboxDeliveryError(Exception):
+    """Raised by a handler when a message could not be delivered and should be retried"""
+
+
+def outbox_handler(event_type):
+    """Register the function delivering messages of the given event type"""
+    def register(func):
+        HANDLERS[event_type] = func
+        return func
+    return register
+
+
+def enqueue(event_type, payload, available_at=None):
+    """
+    Record a message for the outbox worker. Call it inside the transaction of
+    the change it reports on, so the message exists if and only if the change
+    is committed.
+    """
+    return OutboxMessage.objects.create(
+        event_type=event_type,
+        payload=payload,
+        available_at=available_at or timezone.now()
+    )
+
+
+def retry_delay(attempts):
+    """Exponential backoff before the next delivery attempt"""
+    return min(RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0), RETRY_MAX_DELAY)
+
+
+def claim_batch(batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Claim up to batch_size due messages. Rows locked by another worker are
+    skipped, and claimed rows are leased by pushing available_at forward, so
+    concurrent workers never deliver the same message twice.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', available_at__lte=now)
+            .order_by('available_at', 'id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        OutboxMessage.objects.filter(id__in=ids).update(
+            attempts=F('attempts') + 1,
+            available_at=now + CLAIM_LEASE
+        )
+    return list(OutboxMessage.objects.filter(id__in=ids).order_by('id'))
+
+
+def deliver(message, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Run the handler of a claimed message and record the outcome"""
+    handler = HANDLERS.get(message.event_type)
+    try:
+        if handler is None:
+            raise OutboxDeliveryError(f'No handler for event type "{message.event_type}"')
+        handler(message.payload)
+    except Exception as e:
+        message.last_error = str(e)
+        if message.attempts >= max_attempts:
+            message.status = 'failed'
+            logger.error(f"Outbox message {message.id} failed after {message.attempts} attempts: {e}")
+        else:
+            message.available_at = timezone.now() + retry_delay(message.attempts)
+            logger.warning(f"Outbox message {message.id} failed (attempt {message.attempts}), retrying: {e}")
+        message.save(update_fields=['status', 'last_error', 'available_at'])
+        return False
+
+    message.status = 'sent'
+    message.sent_at = timezone.now()
+    message.last_error = ''
+    message.save(update_fields=['status', 'sent_at', 'last_error'])
+    return True
+
+
+def process_outbox(batch_size=DEFAULT_BATCH_SIZE, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    Deliver one batch of due messages.
+
+    Returns a dict with the number of messages processed, sent and failed.
+    """
+    # Make sure the handlers are registered
+    from . import broadcasts, services  # noqa: F401
+
+    batch = claim_batch(batch_size)
+    sent = sum(deliver(message, max_attempts) for message in batch)
+    return {
+        'processed': len(batch),
+        'sent': sent,
+        'failed': len(batch) - sent,
+    }
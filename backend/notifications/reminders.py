@@ -0,0 +1,121 @@
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import DateTimeField, DurationField, ExpressionWrapper, F, Func, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from appointments.models import Appointment
+from .services import build_appointment_reminder, send_bulk_email, send_bulk_sms
+
+DEFAULT_BATCH_SIZE = 200
+
+# Used when a patient has no NotificationSetting row (same as the model defaults)
+DEFAULT_REMINDER_HOURS = 24
+DEFAULT_EMAIL_REMINDERS = True
+DEFAULT_SMS_REMINDERS = False
+
+# Reminders are never sent earlier than this before the appointment; it
+# bounds the index range scanned for due reminders
+MAX_REMINDER_LEAD = timedelta(days=7)
+
+# Appointments in these states still get a reminder
+REMINDER_STATUSES = ['scheduled', 'confirmed']
+
+
+class Hours(Func):
+    """An interval of the given number of hours, computed in the database"""
+    template = 'make_interval(hours => %(expressions)s)'
+    output_field = DurationField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # SQLite stores durations as integer microseconds
+        return self.as_sql(compiler, connection, template='(%(expressions)s * 3600000000)', **extra_context)
+
+
+def due_reminders(now=None):
+    """
+    Upcoming appointments whose reminder is due, in a single query: the
+    reminder of an appointment is due once it starts within the patient's
+    appointment_reminder_time (hours) and has not been sent yet.
+    """
+    now = now or timezone.now()
+    settings_path = 'patient__user__notification_settings'
+    return Appointment.objects.filter(
+        reminder_sent_at__isnull=True,
+        status__in=REMINDER_STATUSES,
+        start_time__gt=now,
+        start_time__lte=now + MAX_REMINDER_LEAD,
+    ).annotate(
+        time_left=ExpressionWrapper(
+            F('start_time') - Value(now, output_field=DateTimeField()),
+            output_field=DurationField()
+        ),
+        reminder_lead=Hours(
+            Coalesce(F(f'{settings_path}__appointment_reminder_time'), DEFAULT_REMINDER_HOURS)
+        ),
+    ).filter(
+        time_left__lte=F('reminder_lead')
+    ).select_related(
+        'doctor', 'patient__user', settings_path
+    ).order_by('start_time', 'id')
+
+
+def claim_reminders(now=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Claim up to batch_size due reminders by stamping reminder_sent_at.
+
+    As in notifications.outbox.claim_batch, the candidates still unclaimed
+    are locked with SELECT ... FOR UPDATE SKIP LOCKED and exactly the locked
+    rows are stamped, so overlapping runs never get the same appointment and
+    a reminder is sent at most once.
+    """
+    now = now or timezone.now()
+    candidates = list(due_reminders(now)[:batch_size])
+    if not candidates:
+        return []
+
+    with transaction.atomic():
+        claimed = set(Appointment.objects.select_for_update(skip_locked=True).filter(
+            id__in=[appointment.id for appointment in candidates],
+            reminder_sent_at__isnull=True
+        ).values_list('id', flat=True))
+        Appointment.objects.filter(id__in=claimed).update(reminder_sent_at=timezone.now())
+    return [appointment for appointment in candidates if appointment.id in claimed]
+
+
+def reminder_channels(appointment):
+    """Whether the patient wants email and SMS reminders, as an (email, sms) pair"""
+    preferences = getattr(appointment.patient.user, 'notification_settings', None)
+    if preferences is None:
+        return DEFAULT_EMAIL_REMINDERS, DEFAULT_SMS_REMINDERS
+    return preferences.email_appointment_reminders, preferences.sms_appointment_reminders
+
+
+def send_due_reminders(now=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Claim one batch of due reminders and send them with one bulk email and
+    one bulk SMS dispatch.
+
+    Returns a dict with the number of reminders claimed and of emails and
+    SMS sent or failed.
+    """
+    appointments = claim_reminders(now, batch_size)
+    emails, sms = [], []
+    for appointment in appointments:
+        reminder = build_appointment_reminder(appointment)
+        use_email, use_sms = reminder_channels(appointment)
+        if use_email and reminder['email']:
+            emails.append((reminder['email'], reminder['subject'], reminder['email_content']))
+        if use_sms and reminder['phone']:
+            sms.append((reminder['phone'], reminder['sms_message']))
+
+    email_results = send_bulk_email(emails)
+    sms_results = send_bulk_sms(sms)
+    emails_sent = sum(result['success'] for result in email_results)
+    sms_sent = sum(result['success'] for result in sms_results)
+    return {
+        'claimed': len(appointments),
+        'emails_sent': emails_sent,
+        'emails_failed': len(email_results) - emails_sent,
+        'sms_sent': sms_sent,
+        'sms_failed': len(sms_results) - sms_sent,
+    }
@@ -1,23 +1,24 @@
 from django.conf import settings
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection, send_mail
 from django.template.loader import render_to_string
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 import logging
 import os
-from twilio.rest import Client
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from twilio.base.exceptions import TwilioRestException
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
 from accounts.models import User
 from .models import Notification
-from .utils import send_notification
+from .twilio_client import get_twilio_client
+from .outbox import OutboxDeliveryError, enqueue, outbox_handler
+from .counters import change_unread_count
+from .events import coalesce_events, notification_event, push_event, read_event, unread_count_event
 
 logger = logging.getLogger(__name__)
 
-# Twilio configuration
-TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
-TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
-TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER')
-
 # Email configuration
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'noreply@cabinetmedicale.com')
 
@@ -33,7 +34,8 @@ def send_sms_notification(to_number, message):
     Returns:
         dict: Status and message ID if successful, error details if failed
     """
-    if not all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER]):
+    local = settings.TWILIO_TRANSPORT == 'local'
+    if not local and not all([settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN, settings.TWILIO_PHONE_NUMBER]):
         logger.error("Twilio credentials not configured")
         return {
             'success': False,
@@ -41,10 +43,10 @@ def send_sms_notification(to_number, message):
         }
     
     try:
-        client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-        message = client.messages.create(
+        # Shared client: connections are pooled and reused across messages
+        message = get_twilio_client().messages.create(
             body=message,
-            from_=TWILIO_PHONE_NUMBER,
+            from_=settings.TWILIO_PHONE_NUMBER or settings.CLINIC_PHONE,
             to=to_number
         )
         logger.info(f"SMS sent successfully to {to_number}, SID: {message.sid}")
@@ -60,6 +62,25 @@ def send_sms_notification(to_number, message):
         }
 
 
+def send_bulk_sms(messages):
+    """
+    Send many SMS concurrently over the shared Twilio client
+    
+    Args:
+        messages (list): (to_number, message) pairs
+        
+    Returns:
+        list: Result of send_sms_notification for each message, in order
+    """
+    messages = list(messages)
+    if not messages:
+        return []
+    # Requests beyond TWILIO_MAX_CONCURRENCY would only wait for a connection
+    workers = min(settings.TWILIO_MAX_CONCURRENCY, len(messages))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda item: send_sms_notification(*item), messages))
+
+
 def send_email_notification(to_email, subject, message_content):
     """
     Send email notification using Django's email backend
@@ -89,15 +110,63 @@ def send_email_notification(to_email, subject, message_content):
         return False
 
 
-def send_appointment_confirmation(appointment):
+def send_bulk_email(messages, batch_size=None):
     """
-    Send appointment confirmation via both email and SMS
+    Send many emails, reusing one mail server connection per batch
+    
+    Args:
+        messages (list): (to_email, subject, message_content) tuples
+        batch_size (int): Emails sent per connection, defaults to settings.EMAIL_BATCH_SIZE
+        
+    Returns:
+        list: One dict per message, in order, with the recipient, success flag and error if any
+    """
+    messages = list(messages)
+    batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+    results = []
+    
+    for offset in range(0, len(messages), batch_size):
+        connection = get_connection(fail_silently=False)
+        try:
+            for to_email, subject, message_content in messages[offset:offset + batch_size]:
+                results.append(_send_over_connection(connection, to_email, subject, message_content))
+        finally:
+            connection.close()
+    
+    logger.info(f"Bulk email: {sum(result['success'] for result in results)} of {len(messages)} sent")
+    return results
+
+
+def _send_over_connection(connection, to_email, subject, message_content):
+    """Send one email over an open (or lazily opened) connection and report the outcome"""
+    email = EmailMessage(
+        subject=subject,
+        body=message_content,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[to_email],
+        connection=connection
+    )
+    try:
+        # Opening an already open connection is a no-op, so the batch shares it
+        connection.open()
+        connection.send_messages([email])
+        return {'to': to_email, 'success': True}
+    except Exception as e:
+        logger.error(f"Failed to send email to {to_email}: {str(e)}")
+        # The server may have dropped the connection; the next message reconnects
+        connection.close()
+        return {'to': to_email, 'success': False, 'error': str(e)}
+
+
+def build_appointment_confirmation(appointment):
+    """
+    Prepare the confirmation email and SMS for an appointment
     
     Args:
         appointment: Appointment instance
         
     Returns:
-        dict: Status of both email and SMS notifications
+        dict: Recipient email and phone (None without a phone number), subject and message texts
     """
     # Check if patient is a Patient model or User model
     if hasattr(appointment.patient, 'user'):
@@ -115,52 +184,69 @@ def send_appointment_confirmation(appointment):
         # It's a User model
         doctor = appointment.doctor
     
-    # Context for email template
-    context = {
-        'patient_name': patient.get_full_name(),
-        'doctor_name': doctor.get_full_name(),
-        'appointment_date': appointment.date,
-        'appointment_time': appointment.time,
-        'appointment_type': appointment.get_appointment_type_display(),
-        'clinic_address': settings.CLINIC_ADDRESS,
-        'clinic_phone': settings.CLINIC_PHONE,
-    }
+    # Appointment date and time in the clinic's time zone
+    start_time = timezone.localtime(appointment.start_time)
+    appointment_date = start_time.strftime('%Y-%m-%d')
+    appointment_time = start_time.strftime('%H:%M')
     
     # Prepare email content
     email_content = _(
         f"Hello {patient.get_full_name()},\n\n"
-        f"Your appointment with Dr. {doctor.get_full_name()} is confirmed for {appointment.date} at {appointment.time}.\n"
-        f"Appointment type: {appointment.get_appointment_type_display()}\n\n"
+        f"Your appointment with Dr. {doctor.get_full_name()} is confirmed for {appointment_date} at {appointment_time}.\n"
+        f"Reason: {appointment.reason}\n\n"
         f"Clinic address: {settings.CLINIC_ADDRESS}\n"
         f"Clinic phone: {settings.CLINIC_PHONE}\n\n"
         f"Thank you for choosing our medical cabinet.\n"
     )
     
-    # Send email notification
-    email_status = send_email_notification(
-        to_email=patient.email,
-        subject=_("Appointment Confirmation"),
-        message_content=email_content
-    )
-    
-    # Send SMS notification if phone number is available
-    sms_status = None
+    phone = None
     if patient.phone_number:
         # Format phone number to E.164 format if not already
         phone = patient.phone_number
         if not phone.startswith('+'):
             # Add country code (adjust as needed)
             phone = f"+212{phone}" if phone.startswith('0') else f"+212{phone}"
+    
+    # SMS message
+    sms_message = _(
+        f"Hello {patient.get_full_name()}, "
+        f"Your appointment with Dr. {doctor.get_full_name()} "
+        f"is confirmed for {appointment_date} at {appointment_time}. "
+        f"Please call {settings.CLINIC_PHONE} if you need to reschedule."
+    )
+    
+    return {
+        'email': patient.email,
+        'phone': phone,
+        'subject': str(_("Appointment Confirmation")),
+        'email_content': str(email_content),
+        'sms_message': str(sms_message),
+    }
+
+
+def send_appointment_confirmation(appointment):
+    """
+    Send appointment confirmation via both email and SMS
+    
+    Args:
+        appointment: Appointment instance
         
-        # SMS message
-        sms_message = _(
-            f"Hello {patient.get_full_name()}, "
-            f"Your appointment with Dr. {doctor.get_full_name()} "
-            f"is confirmed for {appointment.date} at {appointment.time}. "
-            f"Please call {settings.CLINIC_PHONE} if you need to reschedule."
-        )
-        
-        sms_status = send_sms_notification(phone, sms_message)
+    Returns:
+        dict: Status of both email and SMS notifications
+    """
+    confirmation = build_appointment_confirmation(appointment)
+    
+    # Send email notification
+    email_status = send_email_notification(
+        to_email=confirmation['email'],
+        subject=confirmation['subject'],
+        message_content=confirmation['email_content']
+    )
+    
+    # Send SMS notification if phone number is available
+    sms_status = None
+    if confirmation['phone']:
+        sms_status = send_sms_notification(confirmation['phone'], confirmation['sms_message'])
     
     return {
         'email': email_status,
@@ -168,15 +254,68 @@ def send_appointment_confirmation(appointment):
     }
 
 
-def send_appointment_reminder(appointment):
+def enqueue_appointment_confirmation(appointment):
     """
-    Send appointment reminder via both email and SMS
+    Queue the confirmation of an appointment for the outbox worker instead of
+    sending it during the request. Call it in the transaction creating the
+    appointment.
+    """
+    return enqueue('appointment_confirmation', {'appointment_id': appointment.id})
+
+
+@outbox_handler('appointment_confirmation')
+def deliver_appointment_confirmation(payload):
+    """
+    Outbox handler preparing a queued appointment confirmation.
+    
+    The email and the SMS are queued as separate messages, each retried on
+    its own, so a failing channel never sends the other one again.
+    """
+    from appointments.models import Appointment
+    
+    appointment = Appointment.objects.select_related('doctor', 'patient__user').filter(
+        id=payload['appointment_id']
+    ).first()
+    if appointment is None:
+        # The appointment was deleted before the confirmation went out
+        logger.info(f"Skipping confirmation of deleted appointment {payload['appointment_id']}")
+        return
+    
+    confirmation = build_appointment_confirmation(appointment)
+    with transaction.atomic():
+        enqueue('send_email', {
+            'to': confirmation['email'],
+            'subject': confirmation['subject'],
+            'content': confirmation['email_content'],
+        })
+        if confirmation['phone']:
+            enqueue('send_sms', {'to': confirmation['phone'], 'message': confirmation['sms_message']})
+
+
+@outbox_handler('send_email')
+def deliver_email(payload):
+    """Outbox handler sending a queued email"""
+    if not send_email_notification(payload['to'], payload['subject'], payload['content']):
+        raise OutboxDeliveryError(f"Email to {payload['to']} could not be sent")
+
+
+@outbox_handler('send_sms')
+def deliver_sms(payload):
+    """Outbox handler sending a queued SMS"""
+    result = send_sms_notification(payload['to'], payload['message'])
+    if not result['success']:
+        raise OutboxDeliveryError(result.get('error') or f"SMS to {payload['to']} could not be sent")
+
+
+def build_appointment_reminder(appointment):
+    """
+    Prepare the reminder email and SMS for an appointment
     
     Args:
         appointment: Appointment instance
         
     Returns:
-        dict: Status of both email and SMS notifications
+        dict: Recipient email and phone (None without a phone number), subject and message texts
     """
     # Check if patient is a Patient model or User model
     if hasattr(appointment.patient, 'user'):
@@ -194,57 +333,127 @@ def send_appointment_reminder(appointment):
         # It's a User model
         doctor = appointment.doctor
     
-    # Context for email template
-    context = {
-        'patient_name': patient.get_full_name(),
-        'doctor_name': doctor.get_full_name(),
-        'appointment_date': appointment.date,
-        'appointment_time': appointment.time,
-        'appointment_type': appointment.get_appointment_type_display(),
-        'clinic_address': settings.CLINIC_ADDRESS,
-        'clinic_phone': settings.CLINIC_PHONE,
-    }
+    # Appointment date and time in the clinic's time zone
+    start_time = timezone.localtime(appointment.start_time)
+    appointment_date = start_time.strftime('%Y-%m-%d')
+    appointment_time = start_time.strftime('%H:%M')
     
     # Prepare email content
     email_content = _(
         f"Hello {patient.get_full_name()},\n\n"
-        f"This is a reminder for your appointment with Dr. {doctor.get_full_name()} tomorrow at {appointment.time}.\n"
-        f"Appointment type: {appointment.get_appointment_type_display()}\n\n"
+        f"This is a reminder for your appointment with Dr. {doctor.get_full_name()} on {appointment_date} at {appointment_time}.\n"
+        f"Reason: {appointment.reason}\n\n"
         f"Clinic address: {settings.CLINIC_ADDRESS}\n"
         f"Clinic phone: {settings.CLINIC_PHONE}\n\n"
         f"Please call us if you need to reschedule.\n"
     )
     
-    # Send email notification
-    email_status = send_email_notification(
-        to_email=patient.email,
-        subject=_("Appointment Reminder"),
-        message_content=email_content
-    )
-    
-    # Send SMS notification if phone number is available
-    sms_status = None
+    phone = None
     if patient.phone_number:
         # Format phone number to E.164 format if not already
         phone = patient.phone_number
         if not phone.startswith('+'):
             # Add country code (adjust as needed)
             phone = f"+212{phone}" if phone.startswith('0') else f"+212{phone}"
+    
+    # SMS message
+    sms_message = _(
+        f"Reminder: Your appointment with Dr. {doctor.get_full_name()} "
+        f"is on {appointment_date} at {appointment_time}. "
+        f"Please call {settings.CLINIC_PHONE} if you need to reschedule."
+    )
+    
+    return {
+        'email': patient.email,
+        'phone': phone,
+        'subject': str(_("Appointment Reminder")),
+        'email_content': str(email_content),
+        'sms_message': str(sms_message),
+    }
+
+
+def send_appointment_reminder(appointment):
+    """
+    Send appointment reminder via both email and SMS
+    
+    Args:
+        appointment: Appointment instance
         
-        # SMS message
-        sms_message = _(
-            f"Reminder: Your appointment with Dr. {doctor.get_full_name()} "
-            f"is tomorrow at {appointment.time}. "
-            f"Please call {settings.CLINIC_PHONE} if you need to reschedule."
-        )
-        
-        sms_status = send_sms_notification(phone, sms_message)
+    Returns:
+        dict: Status of both email and SMS notifications
+    """
+    reminder = build_appointment_reminder(appointment)
+    
+    # Send email notification
+    email_status = send_email_notification(
+        to_email=reminder['email'],
+        subject=reminder['subject'],
+        message_content=reminder['email_content']
+    )
+    
+    # Send SMS notification if phone number is available
+    sms_status = None
+    if reminder['phone']:
+        sms_status = send_sms_notification(reminder['phone'], reminder['sms_message'])
     
     return {
         'email': email_status,
         'sms': sms_status
     }
 
+def create_notifications(notifications):
+    """
+    Save many in-app notifications with one bulk insert, update the
+    recipients' unread counters and push the notifications to them, one
+    WebSocket frame per recipient.
+    
+    Args:
+        notifications (list): Unsaved Notification instances
+        
+    Returns:
+        list: The created notifications
+    """
+    with transaction.atomic(), coalesce_events():
+        created = Notification.objects.bulk_create(notifications)
+        unread = Counter(notification.user_id for notification in created if not notification.is_read)
+        for user_id, count in unread.items():
+            change_unread_count(user_id, count)
+        for notification in created:
+            push_event(notification.user_id, notification_event(notification))
+        for user_id in unread:
+            push_event(user_id, unread_count_event(user_id))
+    return created
+
+
+def mark_notifications_read(user, notification_ids=None, up_to_id=None):
+    """
+    Mark a user's unread notifications as read with a single UPDATE, keep
+    the unread counter in step and push the change to the user's sockets.
+    
+    Args:
+        user: Owner of the notifications
+        notification_ids (list): Notifications to mark, or None for all of them
+        up_to_id (int): Only mark notifications with an id up to this one, so
+            a retried request does not also mark notifications that arrived since
+        
+    Returns:
+        int: Number of notifications that were unread and are now read
+    """
+    queryset = Notification.objects.filter(user=user, is_read=False)
+    if notification_ids is not None:
+        queryset = queryset.filter(id__in=notification_ids)
+    if up_to_id is not None:
+        queryset = queryset.filter(id__lte=up_to_id)
+    
+    with transaction.atomic(), coalesce_events():
+        updated = queryset.update(is_read=True, updated_at=timezone.now())
+        if updated:
+            change_unread_count(user.id, -updated)
+            push_event(user.id, read_event(notification_ids, up_to_id))
+            push_event(user.id, unread_count_event(user.id))
+    return updated
+
+
 def send_notification_service(recipient_id, message, notification_type):
     """
     Service to handle the creation and sending of a custom notification.
@@ -254,22 +463,12 @@ def send_notification_service(recipient_id, message, notification_type):
     except ObjectDoesNotExist:
         raise ValueError("Recipient not found.")
 
-    # Create the notification instance
-    notification = Notification.objects.create(
+    # Create the notification and push it to the recipient
+    notification = create_notifications([Notification(
         user=recipient,
         title="New Message from Staff",
         message=message,
         notification_type='message' # Or derive from a parameter if needed
-    )
-
-    # Use the existing utility to send the notification
-    send_notification(
-        user_id=recipient.id,
-        title=notification.title,
-        message=notification.message,
-        notification_type=notification.notification_type,
-        # Pass notification_id to be used in WebSocket message
-        extra_data={'notification_id': notification.id}
-    )
+    )])[0]
 
     return notification
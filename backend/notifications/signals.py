@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .counters import invalidate_unread_count
+from .models import Notification
+
+
+@receiver(post_save, sender=Notification)
+def notification_saved(sender, instance, update_fields=None, **kwargs):
+    """A notification saved on its own may have changed its user's unread count"""
+    if update_fields is not None and 'is_read' not in update_fields:
+        return
+    invalidate_unread_count(instance.user_id)
+
+
+@receiver(post_delete, sender=Notification)
+def notification_deleted(sender, instance, **kwargs):
+    invalidate_unread_count(instance.user_id)
@@ -1,3 +1,806 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+from importlib.util import find_spec
+from smtplib import SMTPRecipientsRefused
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync, sync_to_async
+from channels import DEFAULT_CHANNEL_LAYER
+from channels.layers import channel_layers
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail import get_connection
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from accounts.models import User
+from appointments.booking import BookingConflict, book_appointment
+from appointments.models import Appointment
+from patients.models import Patient
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from twilio.http.http_client import TwilioHttpClient
+from .auth import user_cache
+from .benchmarks import SocketClient, access_token, run_connect_benchmark, run_fanout_benchmark
+from .broadcasts import send_broadcast_chunk
+from .checks import check_email_delivery
+from .connections import connections
+from .counters import get_unread_count
+from .events import push_event, read_event
+from .local_redis import LocalRedisServer
+from .models import Broadcast, Notification, NotificationSetting, OutboxMessage
+from .outbox import RETRY_BASE_DELAY, process_outbox
+from .reminders import claim_reminders, due_reminders, send_due_reminders
+from .services import create_notifications, mark_notifications_read, send_bulk_email, send_bulk_sms, send_sms_notification
+from .twilio_client import LocalSMSTransport, PooledTwilioHttpClient, get_twilio_client, reset_twilio_client
+from .utils import send_notification
 
-# Create your tests here.
+
+class OutboxTests(TestCase):
+    """Appointment confirmations go through the transactional outbox"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(
+            email='doctor@example.com', password='pass', role='doctor',
+            first_name='Greg', last_name='House'
+        )
+        cls.patient = Patient.objects.create(user=User.objects.create_user(
+            email='patient@example.com', password='pass', role='patient',
+            first_name='Lisa', last_name='Cuddy'
+        ))
+
+    def book(self, hours=24):
+        start = timezone.now() + timedelta(hours=hours)
+        return book_appointment({
+            'doctor': self.doctor,
+            'patient': self.patient,
+            'reason': 'Checkup',
+            'notes': '',
+            'status': 'scheduled',
+            'start_time': start,
+            'end_time': start + timedelta(minutes=30),
+        })
+
+    def test_booking_queues_confirmation_without_sending(self):
+        appointment = self.book()
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.event_type, 'appointment_confirmation')
+        self.assertEqual(message.payload, {'appointment_id': appointment.id})
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_rejected_booking_queues_nothing(self):
+        self.book()
+        with self.assertRaises(BookingConflict):
+            self.book()
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+    def test_worker_sends_confirmation(self):
+        self.book()
+        self.book(hours=48)
+        call_command('process_outbox', stdout=mock.MagicMock())
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertIn('Greg House', mail.outbox[0].body)
+        # Without a phone number only the email is queued
+        self.assertEqual(OutboxMessage.objects.filter(event_type='send_email').count(), 2)
+        self.assertFalse(OutboxMessage.objects.filter(event_type='send_sms').exists())
+        self.assertFalse(OutboxMessage.objects.exclude(status='sent').exists())
+        # Sent messages are not delivered again
+        self.assertEqual(process_outbox()['processed'], 0)
+
+    def test_failed_delivery_backs_off_then_gives_up(self):
+        self.book()
+        process_outbox(max_attempts=2)
+        with mock.patch('notifications.services.send_email_notification', return_value=False):
+            result = process_outbox(max_attempts=2)
+            self.assertEqual(result, {'processed': 1, 'sent': 0, 'failed': 1})
+            message = OutboxMessage.objects.get(event_type='send_email')
+            self.assertEqual(message.status, 'pending')
+            self.assertGreater(message.available_at, timezone.now() + RETRY_BASE_DELAY / 2)
+
+            # Not due yet
+            self.assertEqual(process_outbox(max_attempts=2)['processed'], 0)
+
+            OutboxMessage.objects.update(available_at=timezone.now())
+            process_outbox(max_attempts=2)
+        message.refresh_from_db()
+        self.assertEqual(message.status, 'failed')
+        self.assertEqual(message.attempts, 2)
+        self.assertTrue(message.last_error)
+
+    def test_failed_email_does_not_resend_sms(self):
+        self.patient.user.phone_number = '0600000000'
+        self.patient.user.save()
+        self.book()
+        sms_result = {'success': True, 'message_id': 'SM1', 'status': 'queued'}
+        email_results = [False, False, True]
+        with mock.patch('notifications.services.send_email_notification', side_effect=email_results) as send_email, \
+                mock.patch('notifications.services.send_sms_notification', return_value=sms_result) as send_sms:
+            process_outbox()
+            for _ in range(3):
+                OutboxMessage.objects.filter(status='pending').update(available_at=timezone.now())
+                process_outbox()
+        self.assertEqual(send_email.call_count, 3)
+        send_sms.assert_called_once()
+        self.assertEqual(send_sms.call_args.args[0], '+2120600000000')
+        self.assertFalse(OutboxMessage.objects.exclude(status='sent').exists())
+
+    def test_deleted_appointment_is_skipped(self):
+        self.book()
+        Appointment.objects.all().delete()
+        self.assertEqual(process_outbox()['sent'], 1)
+        self.assertEqual(len(mail.outbox), 0)
+
+
+@override_settings(TWILIO_TRANSPORT='local', TWILIO_PHONE_NUMBER='+15005550006', TWILIO_MAX_CONCURRENCY=8)
+class TwilioClientTests(SimpleTestCase):
+    """SMS go through one shared, pooled Twilio client"""
+
+    def setUp(self):
+        reset_twilio_client()
+        self.addCleanup(reset_twilio_client)
+
+    def test_client_is_shared(self):
+        self.assertIs(get_twilio_client(), get_twilio_client())
+
+    def test_bulk_sms_reuses_client(self):
+        messages = [(f'+21260000{i:04d}', f'Reminder {i}') for i in range(300)]
+        results = send_bulk_sms(messages)
+        self.assertTrue(all(result['success'] for result in results))
+        self.assertEqual(len({result['message_id'] for result in results}), 300)
+        transport = get_twilio_client().http_client
+        self.assertIsInstance(transport, LocalSMSTransport)
+        self.assertEqual(sorted(sent['To'] for sent in transport.sent), sorted(to for to, _ in messages))
+
+    def test_rejected_sms_reports_error(self):
+        get_twilio_client().http_client.status_code = 400
+        result = send_sms_notification('+212600000000', 'Hello')
+        self.assertFalse(result['success'])
+
+    def test_pooled_client_limits_concurrency(self):
+        client = PooledTwilioHttpClient(max_concurrency=3)
+        self.assertEqual(client.session.get_adapter('https://api.twilio.com')._pool_maxsize, 3)
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def fake_request(*args, **kwargs):
+            with lock:
+                in_flight.append(1)
+                peak.append(len(in_flight))
+            time.sleep(0.01)
+            with lock:
+                in_flight.pop()
+
+        with mock.patch.object(TwilioHttpClient, 'request', fake_request):
+            threads = [threading.Thread(target=client.request, args=('POST', 'https://api.twilio.com'))
+                       for _ in range(12)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(peak), 12)
+        self.assertLessEqual(max(peak), 3)
+
+
+class RejectingEmailBackend(locmem.EmailBackend):
+    """Local mail backend counting connections and rejecting 'bounce' recipients"""
+    opened = 0
+
+    def open(self):
+        RejectingEmailBackend.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        if any('bounce' in recipient for message in messages for recipient in message.to):
+            raise SMTPRecipientsRefused({})
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='notifications.tests.RejectingEmailBackend')
+class BulkEmailTests(SimpleTestCase):
+    """Bulk email reuses one connection per batch and reports failures per message"""
+
+    def setUp(self):
+        RejectingEmailBackend.opened = 0
+
+    def test_one_connection_per_batch(self):
+        with mock.patch('notifications.services.get_connection', wraps=get_connection) as connect:
+            results = send_bulk_email(
+                [(f'patient{i}@example.com', 'Reminder', 'See you tomorrow') for i in range(250)],
+                batch_size=100
+            )
+        self.assertEqual(connect.call_count, 3)
+        self.assertTrue(all(result['success'] for result in results))
+        self.assertEqual(len(mail.outbox), 250)
+
+    def test_rejected_recipient_does_not_stop_batch(self):
+        results = send_bulk_email([
+            ('first@example.com', 'Reminder', 'Hello'),
+            ('bounce@example.com', 'Reminder', 'Hello'),
+            ('last@example.com', 'Reminder', 'Hello'),
+        ])
+        self.assertEqual([result['success'] for result in results], [True, False, True])
+        self.assertIn('error', results[1])
+        self.assertEqual([message.to for message in mail.outbox], [['first@example.com'], ['last@example.com']])
+
+
+@override_settings(TWILIO_TRANSPORT='local')
+class ReminderSchedulerTests(TestCase):
+    """Reminders follow each patient's reminder time and go out once"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user(email='doctor@example.com', password='pass', role='doctor')
+        cls.now = timezone.now()
+
+    def setUp(self):
+        reset_twilio_client()
+        self.addCleanup(reset_twilio_client)
+
+    def appointment(self, email, hours_ahead, reminder_hours=None, sms=False, status='scheduled'):
+        user = User.objects.create_user(email=email, password='pass', role='patient', phone_number='0600000000')
+        if reminder_hours is not None or sms:
+            NotificationSetting.objects.create(
+                user=user, appointment_reminder_time=reminder_hours or 24, sms_appointment_reminders=sms
+            )
+        start = self.now + timedelta(hours=hours_ahead)
+        return Appointment.objects.create(
+            patient=Patient.objects.create(user=user), doctor=self.doctor, status=status,
+            start_time=start, end_time=start + timedelta(minutes=30)
+        )
+
+    def test_due_reminders_honor_preferences(self):
+        soon = self.appointment('soon@example.com', 1, reminder_hours=2)
+        self.appointment('later@example.com', 3, reminder_hours=2)
+        default = self.appointment('default@example.com', 20)
+        self.appointment('default-later@example.com', 30)
+        early = self.appointment('early@example.com', 31, reminder_hours=48)
+        self.appointment('cancelled@example.com', 1, status='cancelled')
+        self.appointment('past@example.com', -1)
+
+        with self.assertNumQueries(1):
+            due = [appointment.id for appointment in due_reminders(self.now)]
+        self.assertEqual(due, [soon.id, default.id, early.id])
+
+    def test_reminders_are_sent_once(self):
+        self.appointment('email@example.com', 2)
+        self.appointment('sms@example.com', 3, sms=True)
+
+        result = send_due_reminders(self.now)
+        self.assertEqual(result['claimed'], 2)
+        self.assertEqual(result['emails_sent'], 2)
+        self.assertEqual(result['sms_sent'], 1)
+        self.assertEqual(len(get_twilio_client().http_client.sent), 1)
+        self.assertEqual(len(mail.outbox), 2)
+
+        call_command('send_reminders', stdout=mock.MagicMock())
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertFalse(Appointment.objects.filter(reminder_sent_at__isnull=True).exists())
+
+    def test_overlapping_runs_do_not_share_reminders(self):
+        for i in range(5):
+            self.appointment(f'patient{i}@example.com', 2 + i)
+        # Both runs see the same due appointments before either claims them
+        candidates = list(due_reminders(self.now))
+        # Even when both stamp at the same instant, as coarse clocks allow
+        with mock.patch('notifications.reminders.due_reminders', return_value=candidates), \
+                mock.patch('notifications.reminders.timezone.now', return_value=self.now):
+            first = claim_reminders(self.now)
+            second = claim_reminders(self.now)
+        self.assertEqual(len(first), 5)
+        self.assertEqual(second, [])
+
+
+class EmailDeliveryCheckTests(SimpleTestCase):
+    """Deployments are warned when outgoing mail would only be printed"""
+
+    @override_settings(DEBUG=False, EMAIL_BACKEND='django.core.mail.backends.console.EmailBackend')
+    def test_console_backend_warns_outside_debug(self):
+        self.assertEqual([warning.id for warning in check_email_delivery(None)], ['notifications.W001'])
+
+    @override_settings(DEBUG=True, EMAIL_BACKEND='django.core.mail.backends.console.EmailBackend')
+    def test_console_backend_is_fine_in_debug(self):
+        self.assertEqual(check_email_delivery(None), [])
+
+    @override_settings(DEBUG=False, EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend')
+    def test_smtp_backend_passes(self):
+        self.assertEqual(check_email_delivery(None), [])
+
+
+class LocalRedisServerTests(SimpleTestCase):
+    """The Redis stand-in is a development dependency"""
+
+    def test_missing_fakeredis_is_reported(self):
+        with mock.patch.dict('sys.modules', {'fakeredis': None}):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'requirements-dev.txt'):
+                LocalRedisServer().start()
+
+
+@skipUnless(find_spec('fakeredis') and find_spec('channels_redis'), 'fakeredis and channels_redis are required')
+class ChannelLayerTests(TestCase):
+    """WebSocket pushes reach sockets served by other processes through Redis"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.redis_server = LocalRedisServer().start()
+        cls.addClassCleanup(cls.redis_server.stop)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(email=f'patient{i}@example.com', password='pass', role='patient')
+            for i in range(4)
+        ]
+
+    def test_send_notification_reaches_other_process(self):
+        async def push_from_other_process():
+            # A separate layer instance stands in for the worker holding the socket
+            worker = channel_layers.make_backend(DEFAULT_CHANNEL_LAYER)
+            channel = await worker.new_channel()
+            await worker.group_add('notifications_7', channel)
+            await sync_to_async(send_notification)(7, {'title': 'Hello'})
+            message = await asyncio.wait_for(worker.receive(channel), 5)
+            await worker.flush()
+            return message
+
+        with override_settings(CHANNEL_LAYERS=self.redis_server.channel_layers()):
+            message = async_to_sync(push_from_other_process)()
+        self.assertEqual(message, {'type': 'send_notification', 'data': {'title': 'Hello'}})
+
+    def test_fanout_benchmark_delivers_everything(self):
+        with override_settings(CHANNEL_LAYERS=self.redis_server.channel_layers()):
+            result = async_to_sync(run_fanout_benchmark)(self.users, sockets=12, rounds=2, timeout=5)
+        self.assertEqual(result['delivered'], result['expected'])
+        self.assertEqual(result['expected'], 24)
+
+    def test_in_memory_layer_stays_in_process(self):
+        in_memory = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+        with override_settings(CHANNEL_LAYERS=in_memory):
+            result = async_to_sync(run_fanout_benchmark)(self.users, sockets=4, rounds=1, timeout=0.2)
+        self.assertEqual(result['delivered'], 0)
+
+
+class NotificationEventTests(TestCase):
+    """Only state changes are pushed, and bursts collapse into one frame per user"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='patient@example.com', password='pass', role='patient')
+        cls.other = User.objects.create_user(email='other@example.com', password='pass', role='patient')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        # Record one call per recipient of each send_notifications() batch
+        self.send = mock.Mock()
+        patcher = mock.patch('notifications.events.send_notifications', side_effect=lambda messages: [
+            self.send(user_id, message) for user_id, message in messages.items()
+        ])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fetching_notifications_pushes_nothing(self):
+        Notification.objects.create(user=self.user, title='Hello', message='World')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(reverse('notifications:notification-list'))
+        self.assertEqual(response.status_code, 200)
+        self.send.assert_not_called()
+
+    def test_new_and_read_notifications_are_pushed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('notifications:create-notification'), {
+                'title': 'Lab results', 'message': 'Your results are ready'
+            })
+        self.send.assert_called_once()
+        user_id, frame = self.send.call_args.args
+        event, count = frame['events']
+        self.assertEqual((user_id, event['type'], event['id']), (self.user.id, 'notification', response.data['id']))
+        self.assertEqual(event['title'], 'Lab results')
+        self.assertEqual(count, {'type': 'unread_count', 'count': 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('notifications:mark-notification-read', args=[response.data['id']]))
+        self.assertEqual(self.send.call_args.args[1]['events'], [
+            {'type': 'notifications_read', 'ids': [response.data['id']]},
+            {'type': 'unread_count', 'count': 0},
+        ])
+
+    def test_burst_is_coalesced_per_user(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_notifications(
+                [Notification(user=self.user, title=f'Update {i}', message='...') for i in range(3)]
+                + [Notification(user=self.other, title='Update', message='...')]
+            )
+        frames = {call.args[0]: call.args[1] for call in self.send.call_args_list}
+        self.assertEqual(self.send.call_count, 2)
+        self.assertEqual([event.get('title') for event in frames[self.user.id]['events']],
+                         ['Update 0', 'Update 1', 'Update 2', None])
+        self.assertEqual(frames[self.user.id]['events'][-1], {'type': 'unread_count', 'count': 3})
+        self.assertEqual(len(frames[self.other.id]['events']), 2)
+
+    def test_events_wait_for_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            push_event(self.user.id, read_event())
+        self.send.assert_not_called()
+        self.assertEqual(len(callbacks), 1)
+
+
+class UnreadCounterTests(TestCase):
+    """The unread count is served from the cache and kept in step incrementally"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='patient@example.com', password='pass', role='patient')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def create(self, count):
+        with self.captureOnCommitCallbacks(execute=True):
+            return create_notifications([
+                Notification(user=self.user, title=f'Update {i}', message='...') for i in range(count)
+            ])
+
+    def test_poll_hits_cache(self):
+        self.create(2)
+        url = reverse('notifications:unread-count')
+        self.assertEqual(self.client.get(url).data, {'unread_count': 2})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).data, {'unread_count': 2})
+
+    def test_counter_follows_changes_without_recounting(self):
+        self.assertEqual(get_unread_count(self.user.id), 0)
+        notifications = self.create(5)
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_notifications_read(self.user, [notifications[0].id, notifications[1].id])
+            # Already read: no change
+            mark_notifications_read(self.user, [notifications[0].id])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_unread_count(self.user.id), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('notifications:mark-all-notifications-read'))
+        self.assertEqual(response.data['count'], 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_unread_count(self.user.id), 0)
+
+    def test_cache_miss_falls_back_to_database(self):
+        self.create(3)
+        cache.clear()
+        self.assertEqual(get_unread_count(self.user.id), 3)
+        # Changes while nothing is cached do not create a wrong count
+        self.create(1)
+        cache.clear()
+        self.create(1)
+        self.assertEqual(get_unread_count(self.user.id), 5)
+
+    def test_mark_as_read_updates_counter(self):
+        notifications = self.create(2)
+        self.assertEqual(get_unread_count(self.user.id), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            notifications[0].mark_as_read()
+        self.assertTrue(notifications[0].is_read)
+        self.assertEqual(get_unread_count(self.user.id), 1)
+
+    def test_row_changes_invalidate_counter(self):
+        notifications = self.create(3)
+        self.assertEqual(get_unread_count(self.user.id), 3)
+        # Admin edits and deletes save rows one by one
+        notifications[0].is_read = True
+        with self.captureOnCommitCallbacks(execute=True):
+            notifications[0].save()
+        self.assertEqual(get_unread_count(self.user.id), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            notifications[1].delete()
+        self.assertEqual(get_unread_count(self.user.id), 1)
+        # Saves not touching is_read keep the cached count
+        with self.captureOnCommitCallbacks(execute=True):
+            notifications[2].mark_as_sent()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_unread_count(self.user.id), 1)
+
+    def test_bulk_mark_read_is_one_update(self):
+        notifications = self.create(50)
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('notifications:mark-all-notifications-read'), {
+                'ids': [notification.id for notification in notifications[:30]],
+            }, format='json')
+        self.assertEqual(response.data['count'], 30)
+        updates = [query for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(get_unread_count(self.user.id), 20)
+
+    def test_mark_all_up_to_id_leaves_newer_unread(self):
+        seen = self.create(3)
+        self.create(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('notifications:mark-all-notifications-read'), {
+                'up_to_id': seen[-1].id,
+            }, format='json')
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(Notification.objects.filter(user=self.user, is_read=False).count(), 2)
+        self.assertEqual(get_unread_count(self.user.id), 2)
+
+        response = self.client.post(reverse('notifications:mark-all-notifications-read'), {
+            'ids': 'all',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class BroadcastTests(TestCase):
+    """Broadcasts notify whole roles or patient cohorts in chunks, in the background"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.secretary = User.objects.create_user(email='secretary@example.com', password='pass', role='secretary')
+        cls.doctor = User.objects.create_user(email='doctor@example.com', password='pass', role='doctor')
+        cls.patients = [
+            Patient.objects.create(
+                user=User.objects.create_user(email=f'patient{i}@example.com', password='pass', role='patient'),
+                blood_type='O+' if i % 2 else 'A+'
+            )
+            for i in range(7)
+        ]
+        cls.day = timezone.localdate() + timedelta(days=3)
+        start = timezone.make_aware(datetime.combine(cls.day, datetime.min.time())) + timedelta(hours=10)
+        for patient, status in ((cls.patients[0], 'scheduled'), (cls.patients[1], 'cancelled')):
+            Appointment.objects.create(
+                patient=patient, doctor=cls.doctor, status=status,
+                start_time=start, end_time=start + timedelta(minutes=30)
+            )
+            start += timedelta(hours=1)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.secretary)
+        patcher = mock.patch('notifications.events.send_notifications')
+        self.send = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def broadcast(self, **data):
+        return self.client.post(reverse('notifications:create-broadcast'), {
+            'title': 'Clinic closed', 'message': 'The clinic is closed on Monday', **data
+        }, format='json')
+
+    def status(self, broadcast_id):
+        return self.client.get(reverse('notifications:broadcast-status', args=[broadcast_id])).data
+
+    @mock.patch('notifications.broadcasts.BROADCAST_CHUNK_SIZE', 3)
+    def test_role_broadcast_is_sent_in_chunks(self):
+        response = self.broadcast(roles=['patient'])
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual((response.data['status'], response.data['total_recipients']), ('pending', 7))
+        self.assertEqual(Notification.objects.count(), 0)
+
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            process_outbox()
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "notifications_notification"')]
+        self.assertEqual(len(inserts), 3)
+        recipients = Notification.objects.filter(related_object_type='broadcast').values_list('user_id', flat=True)
+        self.assertEqual(sorted(recipients), sorted(patient.user_id for patient in self.patients))
+        # One batch of frames per chunk, one frame per recipient
+        self.assertEqual([len(call.args[0]) for call in self.send.call_args_list], [3, 3, 1])
+        self.assertEqual(get_unread_count(self.patients[0].user_id), 1)
+
+        progress = self.status(response.data['id'])
+        self.assertEqual((progress['status'], progress['sent_count'], progress['progress']), ('completed', 7, 1.0))
+
+    def test_interrupted_broadcast_resumes_without_duplicates(self):
+        broadcast_id = self.broadcast(roles=['patient', 'doctor']).data['id']
+        self.assertTrue(send_broadcast_chunk(broadcast_id, chunk_size=5))
+        progress = self.status(broadcast_id)
+        self.assertEqual((progress['status'], progress['sent_count'], progress['total_recipients']), ('running', 5, 8))
+
+        process_outbox()
+        self.assertEqual(Notification.objects.count(), 8)
+        self.assertEqual(Broadcast.objects.get(id=broadcast_id).status, 'completed')
+        self.assertFalse(send_broadcast_chunk(broadcast_id))
+
+    def test_cohort_filters(self):
+        day = self.day.isoformat()
+        response = self.broadcast(filters={'appointment_from': day, 'appointment_to': day})
+        self.assertEqual(response.data['total_recipients'], 1)
+        process_outbox()
+        self.assertEqual(list(Notification.objects.values_list('user_id', flat=True)), [self.patients[0].user_id])
+
+        response = self.broadcast(filters={'blood_types': ['O+']})
+        self.assertEqual(response.data['total_recipients'], 3)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.broadcast(roles=['nurse']).status_code, 400)
+        self.assertEqual(self.broadcast(roles=['doctor'], filters={'blood_types': ['O+']}).status_code, 400)
+        self.assertEqual(self.broadcast(filters={'appointment_from': 'monday'}).status_code, 400)
+        self.assertEqual(self.broadcast(filters={'ward': 3}).status_code, 400)
+
+        self.client.force_authenticate(user=self.patients[0].user)
+        self.assertEqual(self.broadcast(roles=['patient']).status_code, 403)
+        self.assertFalse(Broadcast.objects.exists())
+
+
+class WebSocketAuthTests(TestCase):
+    """Sockets authenticate from the token claims, querying users at most once per TTL"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='patient@example.com', password='pass', role='patient')
+        cls.inactive = User.objects.create_user(
+            email='former@example.com', password='pass', role='patient', is_active=False
+        )
+
+    def setUp(self):
+        user_cache.clear()
+
+    def connect(self, *tokens):
+        """Open a socket per token at once; returns each first message, or the close code"""
+        from cabinet.asgi import application
+
+        async def open_sockets():
+            clients = [SocketClient(application, token) for token in tokens]
+
+            async def handshake(client):
+                try:
+                    return (await client.connect())['user_id']
+                except ConnectionError:
+                    return 'rejected'
+
+            results = await asyncio.gather(*(handshake(client) for client in clients))
+            await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+            return results
+
+        with CaptureQueriesContext(connection) as queries:
+            results = async_to_sync(open_sockets)()
+        return results, len(queries)
+
+    def test_login_token_carries_role(self):
+        response = APIClient().post(reverse('login'), {'email': 'patient@example.com', 'password': 'pass'})
+        self.assertEqual(AccessToken(response.data['access'])['role'], 'patient')
+
+    @override_settings(WEBSOCKET_AUTH_MODE='claims')
+    def test_claims_mode_needs_no_query(self):
+        results, queries = self.connect(*[access_token(self.user)] * 3)
+        self.assertEqual(results, [self.user.id] * 3)
+        self.assertEqual(queries, 0)
+
+        # Tokens issued before the role claim existed fall back to the database
+        results, queries = self.connect(str(AccessToken.for_user(self.user)))
+        self.assertEqual((results, queries), ([self.user.id], 1))
+
+    @override_settings(WEBSOCKET_AUTH_MODE='database', WEBSOCKET_USER_CACHE_TTL=30)
+    def test_database_mode_shares_cached_lookups(self):
+        results, queries = self.connect(*[access_token(self.user)] * 3)
+        self.assertEqual((results, queries), ([self.user.id] * 3, 1))
+        results, queries = self.connect(access_token(self.user))
+        self.assertEqual((results, queries), ([self.user.id], 0))
+
+        results, _ = self.connect(access_token(self.inactive), 'not-a-token')
+        self.assertEqual(results, ['rejected', 'rejected'])
+
+    @override_settings(WEBSOCKET_AUTH_MODE='database', WEBSOCKET_USER_CACHE_TTL=0)
+    def test_connect_benchmark(self):
+        result = async_to_sync(run_connect_benchmark)([self.user], sockets=20, concurrency=5)
+        self.assertEqual(result['connected'], 20)
+
+
+@override_settings(WEBSOCKET_HEARTBEAT_INTERVAL=3600, WEBSOCKET_IDLE_TIMEOUT=90)
+class ConnectionRegistryTests(TestCase):
+    """Idle sockets are reaped from their groups, live ones get heartbeats, and workers report metrics"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(email=f'patient{i}@example.com', password='pass', role='patient')
+            for i in range(2)
+        ]
+        cls.staff = User.objects.create_user(email='admin@example.com', password='pass', role='doctor', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_idle_socket_is_reaped(self):
+        from cabinet.asgi import application
+
+        async def scenario():
+            clients = [SocketClient(application, access_token(user)) for user in self.users]
+            for client in clients:
+                await client.connect()
+            idle, alive = [
+                next(consumer for consumer in connections.connections.values() if consumer.user.id == user.id)
+                for user in self.users
+            ]
+            reaped_before = connections.reaped
+            idle.last_seen -= 120
+            stats = await connections.tick()
+
+            closed = await clients[0].receive()
+            heartbeat = await clients[1].receive_json()
+            groups = {
+                user.id: set(idle.channel_layer.groups.get(f'notifications_{user.id}', {}))
+                for user in self.users
+            }
+            # The server confirms the close with a disconnect, as it does for any socket
+            await asyncio.gather(*(client.close() for client in clients))
+            return stats, connections.reaped - reaped_before, closed, heartbeat, groups, alive.channel_name
+
+        stats, reaped, closed, heartbeat, groups, alive_channel = async_to_sync(scenario)()
+        self.assertEqual(reaped, 1)
+        self.assertEqual(stats['open_connections'], 1)
+        self.assertEqual((closed['type'], closed['code']), ('websocket.close', 4002))
+        self.assertEqual(heartbeat['type'], 'heartbeat')
+        self.assertEqual(groups, {self.users[0].id: set(), self.users[1].id: {alive_channel}})
+        self.assertEqual(connections.connections, {})
+        self.assertIsNone(connections.task)
+
+        client = APIClient()
+        client.force_authenticate(user=self.staff)
+        response = client.get(reverse('notifications:connection-metrics'))
+        self.assertEqual(response.data['open_connections'], 1)
+        self.assertEqual(response.data['workers'][0]['reaped_total'], stats['reaped_total'])
+
+        client.force_authenticate(user=self.users[0])
+        self.assertEqual(client.get(reverse('notifications:connection-metrics')).status_code, 403)
+
+
+class ReplayTests(TestCase):
+    """A reconnecting socket receives only the notifications it missed"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='patient@example.com', password='pass', role='patient')
+        other = User.objects.create_user(email='other@example.com', password='pass', role='patient')
+        cls.notifications = Notification.objects.bulk_create([
+            Notification(user=user, title=f'Update {i}', message='...')
+            for i in range(5) for user in (cls.user, other)
+        ])
+        cls.seen = [notification for notification in cls.notifications if notification.user_id == cls.user.id]
+
+    def setUp(self):
+        cache.clear()
+
+    def reconnect(self, query):
+        from cabinet.asgi import application
+
+        async def scenario():
+            client = SocketClient(application, access_token(self.user))
+            client.communicator.scope['query_string'] += query.encode()
+            await client.connect()
+            try:
+                return await client.receive_json(timeout=1)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                await client.close()
+
+        get_unread_count(self.user.id)
+        with CaptureQueriesContext(connection) as queries:
+            message = async_to_sync(scenario)()
+        return message, len(queries)
+
+    def test_only_newer_notifications_are_replayed(self):
+        message, queries = self.reconnect(f'&last_id={self.seen[2].id}')
+        self.assertEqual(queries, 1)
+        self.assertEqual(message['type'], 'batch')
+        *replayed, marker, count = message['events']
+        self.assertEqual([event['id'] for event in replayed], [self.seen[3].id, self.seen[4].id])
+        self.assertEqual(marker, {'type': 'replay', 'count': 2, 'truncated': False})
+        self.assertEqual(count, {'type': 'unread_count', 'count': 5})
+
+    def test_without_last_id_nothing_is_replayed(self):
+        self.assertEqual(self.reconnect(''), (None, 0))
+        self.assertEqual(self.reconnect('&last_id=abc'), (None, 0))
+
+    @mock.patch('notifications.events.REPLAY_LIMIT', 2)
+    def test_too_many_missed_asks_for_reload(self):
+        message, _ = self.reconnect(f'&last_id={self.seen[1].id}')
+        self.assertEqual(message['events'][0], {'type': 'replay', 'count': 0, 'truncated': True})
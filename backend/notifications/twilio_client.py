@@ -0,0 +1,100 @@
+import json
+import logging
+import threading
+import uuid
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from twilio.http import HttpClient
+from twilio.http.http_client import TwilioHttpClient
+from twilio.http.response import Response
+from twilio.rest import Client
+
+logger = logging.getLogger(__name__)
+
+# Credentials used with the local transport, which never reaches Twilio
+LOCAL_ACCOUNT_SID = 'AC' + '0' * 32
+LOCAL_AUTH_TOKEN = 'local'
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class PooledTwilioHttpClient(TwilioHttpClient):
+    """
+    Twilio HTTP client keeping up to max_concurrency keep-alive connections
+    open and never running more than max_concurrency requests at once, so
+    bulk sends reuse TLS sessions instead of reconnecting for every SMS.
+    """
+
+    def __init__(self, max_concurrency=10, timeout=None, max_retries=2):
+        super().__init__(pool_connections=True, timeout=timeout)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency, max_retries=max_retries)
+        self.session.mount('https://', adapter)
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+
+    def request(self, *args, **kwargs):
+        with self.slots:
+            return super().request(*args, **kwargs)
+
+
+class LocalSMSTransport(HttpClient):
+    """
+    Stand-in for the Twilio API: records every message it is asked to send
+    and answers like Twilio would, without any network access. Set
+    TWILIO_TRANSPORT = 'local' to use it in development and tests.
+    """
+
+    def __init__(self, status_code=201):
+        super().__init__(logger=logger, is_async=False)
+        self.status_code = status_code
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def request(self, method, uri, params=None, data=None, headers=None, auth=None,
+                timeout=None, allow_redirects=False):
+        message = dict(data or {})
+        with self._lock:
+            self.sent.append(message)
+
+        if self.status_code >= 400:
+            body = {'code': 21211, 'message': 'Rejected by the local SMS transport', 'status': self.status_code}
+        else:
+            body = {
+                'sid': 'SM' + uuid.uuid4().hex,
+                'status': 'queued',
+                'to': message.get('To'),
+                'from': message.get('From'),
+                'body': message.get('Body'),
+            }
+        return Response(self.status_code, json.dumps(body))
+
+
+def build_twilio_client():
+    """Create a Twilio client for the configured transport"""
+    if settings.TWILIO_TRANSPORT == 'local':
+        return Client(LOCAL_ACCOUNT_SID, LOCAL_AUTH_TOKEN, http_client=LocalSMSTransport())
+    return Client(
+        settings.TWILIO_ACCOUNT_SID,
+        settings.TWILIO_AUTH_TOKEN,
+        http_client=PooledTwilioHttpClient(
+            max_concurrency=settings.TWILIO_MAX_CONCURRENCY,
+            timeout=settings.TWILIO_HTTP_TIMEOUT
+        )
+    )
+
+
+def get_twilio_client():
+    """The process-wide Twilio client, created on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = build_twilio_client()
+    return _client
+
+
+def reset_twilio_client():
+    """Drop the process-wide client, e.g. after the settings changed"""
+    global _client
+    with _client_lock:
+        _client = None
@@ -8,8 +8,12 @@ urlpatterns = [
     path('', views.get_notifications, name='notification-list'),
     path('<int:notification_id>/mark-read/', views.mark_notification_read, name='mark-notification-read'),
     path('mark-all-read/', views.mark_notification_read, name='mark-all-notifications-read'),
+    path('unread-count/', views.unread_count, name='unread-count'),
     path('create/', views.create_notification, name='create-notification'),
     path('send/', views.send_custom_notification, name='send-custom-notification'),
+    path('broadcasts/', views.create_broadcast, name='create-broadcast'),
+    path('broadcasts/<int:broadcast_id>/', views.broadcast_status, name='broadcast-status'),
+    path('connections/', views.connection_metrics, name='connection-metrics'),
     
     # Notification settings endpoints
     path('settings/', views.notification_settings, name='notification-settings'),
@@ -1,17 +1,38 @@
+import asyncio
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 
+# Group sends in flight at once when notifying many users; each may hold a
+# channel layer connection while it runs
+SEND_CONCURRENCY = 50
+
 def send_notification(user_id, message):
     """
     Send a WebSocket notification to a specific user
     :param user_id: ID of the recipient user
     :param message: Dictionary containing notification data
     """
+    send_notifications({user_id: message})
+
+def send_notifications(messages):
+    """
+    Send WebSocket notifications to many users from a single event loop
+    instead of one async_to_sync() round trip per user
+    :param messages: Dictionary mapping recipient user IDs to their message
+    """
+    if not messages:
+        return
     channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        f'notifications_{user_id}',
-        {
-            'type': 'send_notification',
-            'data': message
-        }
-    )
+    items = list(messages.items())
+
+    async def send_all():
+        for offset in range(0, len(items), SEND_CONCURRENCY):
+            await asyncio.gather(*(
+                channel_layer.group_send(f'notifications_{user_id}', {
+                    'type': 'send_notification',
+                    'data': message
+                })
+                for user_id, message in items[offset:offset + SEND_CONCURRENCY]
+            ))
+
+    async_to_sync(send_all)()
@@ -6,13 +6,13 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .models import Notification, NotificationSetting
-from .utils import send_notification
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from .models import Broadcast, Notification, NotificationSetting
+from .broadcasts import broadcast_progress, start_broadcast
+from .connections import worker_metrics
+from .counters import get_unread_count
 from rest_framework import generics
 from .serializers import NotificationSerializer
-from .services import send_notification_service
+from .services import create_notifications, mark_notifications_read, send_notification_service
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -40,8 +40,8 @@ def get_notifications(request):
     # Order by created_at (newest first) and limit results
     notifications = queryset.order_by('-created_at')[:limit]
     
-    # Count unread notifications
-    unread_count = Notification.objects.filter(user=user, is_read=False).count()
+    # Unread count from the per-user counter (counted in the database only on a cache miss)
+    unread_count = get_unread_count(user.id)
     
     # Format response data
     data = {
@@ -58,51 +58,56 @@ def get_notifications(request):
         'unread_count': unread_count
     }
     
-    # Send WebSocket notification
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        f'notifications_{user.id}',
-        {
-            'type': 'send_notification',
-            'data': {
-                'type': 'info',
-                'message': 'Your notifications were fetched',
-                'timestamp': str(timezone.now())
-            }
-        }
-    )
-    
     return Response(data, status=status.HTTP_200_OK)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def mark_notification_read(request, notification_id=None):
-    """Mark a notification as read, or mark all as read if no ID provided"""
+    """
+    Mark a notification as read, or mark all as read if no ID provided.
+    Marking all accepts optional 'ids' to limit it to some notifications and
+    'up_to_id' to leave out notifications newer than the ones the client saw.
+    """
     user = request.user
     
     if notification_id:
         # Mark specific notification as read
+        get_object_or_404(Notification, id=notification_id, user=user)
+        mark_notifications_read(user, [notification_id])
+        return Response({
+            'success': _('Notification marked as read')
+        }, status=status.HTTP_200_OK)
+    else:
+        # Mark all (or the listed) notifications as read in a single UPDATE
+        notification_ids = request.data.get('ids')
+        up_to_id = request.data.get('up_to_id')
         try:
-            notification = get_object_or_404(Notification, id=notification_id, user=user)
-            notification.mark_as_read()
-            return Response({
-                'success': _('Notification marked as read')
-            }, status=status.HTTP_200_OK)
-        except Notification.DoesNotExist:
+            if notification_ids is not None:
+                if not isinstance(notification_ids, list):
+                    raise TypeError
+                notification_ids = [int(value) for value in notification_ids]
+            if up_to_id is not None:
+                up_to_id = int(up_to_id)
+        except (TypeError, ValueError):
             return Response({
-                'error': _('Notification not found')
-            }, status=status.HTTP_404_NOT_FOUND)
-    else:
-        # Mark all notifications as read
-        notifications = Notification.objects.filter(user=user, is_read=False)
-        for notification in notifications:
-            notification.mark_as_read()
+                'error': _('ids must be a list of notification ids and up_to_id a notification id')
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        count = mark_notifications_read(user, notification_ids, up_to_id)
         
         return Response({
             'success': _('All notifications marked as read'),
-            'count': notifications.count()
+            'count': count
         }, status=status.HTTP_200_OK)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def unread_count(request):
+    """Get the number of unread notifications of the current user (served from cache)"""
+    return Response({
+        'unread_count': get_unread_count(request.user.id)
+    }, status=status.HTTP_200_OK)
+
 @api_view(['GET', 'PUT'])
 @permission_classes([IsAuthenticated])
 def notification_settings(request):
@@ -221,7 +226,8 @@ def create_notification(request):
         from accounts.models import User
         target_user = User.objects.get(id=target_user_id)
         
-        notification = Notification(
+        # Create the notification and push it to the recipient's open sockets
+        notification = create_notifications([Notification(
             user=target_user,
             title=title,
             message=message,
@@ -230,22 +236,7 @@ def create_notification(request):
             related_object_type=related_object_type,
             scheduled_time=scheduled_time,
             is_sent=True  # Mark as sent since we're creating it directly
-        )
-        notification.save()
-        
-        # Send WebSocket notification
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'notifications_{target_user_id}',
-            {
-                'type': 'send_notification',
-                'data': {
-                    'type': 'info',
-                    'message': 'You have a new notification',
-                    'timestamp': str(timezone.now())
-                }
-            }
-        )
+        )])[0]
         
         return Response({
             'success': _('Notification created successfully'),
@@ -288,3 +279,73 @@ def send_custom_notification(request):
         return Response({'message': 'Notification sent successfully.'}, status=status.HTTP_200_OK)
     except Exception as e:
         return Response({'error': f'Failed to send notification: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def can_broadcast(user):
+    return user.is_staff or user.role in ['secretary', 'doctor']
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_broadcast(request):
+    """
+    Send a notification to every user of some roles, or to a patient cohort
+    selected by 'filters'. The recipients are notified in the background;
+    poll broadcast_status for progress.
+    """
+    if not can_broadcast(request.user):
+        return Response({
+            'error': _('You do not have permission to send notifications.')
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    title = request.data.get('title')
+    message = request.data.get('message')
+    notification_type = request.data.get('type', 'system')
+    if not all([title, message]):
+        return Response({
+            'error': _('Please provide all required fields')
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if notification_type not in dict(Notification.TYPE_CHOICES):
+        return Response({
+            'error': _('Invalid notification type')
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        broadcast = start_broadcast(
+            request.user, title, message, notification_type,
+            roles=request.data.get('roles'),
+            filters=request.data.get('filters')
+        )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(broadcast_progress(broadcast), status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def broadcast_status(request, broadcast_id):
+    """Progress of a broadcast"""
+    if not can_broadcast(request.user):
+        return Response({
+            'error': _('You do not have permission to send notifications.')
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    broadcast = get_object_or_404(Broadcast, id=broadcast_id)
+    return Response(broadcast_progress(broadcast), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def connection_metrics(request):
+    """Open notification sockets per worker process, as of each worker's last heartbeat"""
+    if not request.user.is_staff:
+        return Response({
+            'error': _('You do not have permission to view connection metrics')
+        }, status=status.HTTP_403_FORBIDDEN)
+    
+    workers = worker_metrics()
+    return Response({
+        'open_connections': sum(worker['open_connections'] for worker in workers),
+        'workers': workers
+    }, status=status.HTTP_200_OK)
@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
 import { useNotifications } from '../hooks/useNotifications';
+import webSocketService from '../services/websocket';
 
 const NotificationCenter = () => {
   const { user } = useAuth();
@@ -68,11 +69,17 @@ const NotificationCenter = () => {
       }
       
       const data = await response.json();
+      const list = Array.isArray(data) ? data : (data.notifications || []);
       
       // Connection successful, reset error state
       setConnectionError(false);
-      setNotifications(data);
-      setUnreadCount(data.filter(notification => !notification.is_read).length);
+      setNotifications(list);
+      setUnreadCount(list.filter(notification => !notification.is_read).length);
+      
+      // A reconnecting socket replays only what arrived after the newest one loaded
+      if (list.length > 0) {
+        webSocketService.setLastNotificationId(Math.max(...list.map(notification => notification.id)));
+      }
     } catch (error) {
       // Only log to console if it's not an abort error (which we triggered)
       if (error.name !== 'AbortError') {
@@ -4,6 +4,9 @@ import { useAuth } from '../context/AuthContext';
 
 const useNotifications = () => {
   const [notifications, setNotifications] = useState([]);
+  const [unreadCount, setUnreadCount] = useState(null);
+  // Set when more notifications were missed while disconnected than the server replays
+  const [reloadRequired, setReloadRequired] = useState(false);
   const [connectionStatus, setConnectionStatus] = useState('disconnected');
   const { refreshToken } = useAuth();
 
@@ -25,7 +28,28 @@ const useNotifications = () => {
     const handleNotification = (data) => {
       switch(data.type) {
         case 'notification':
-          setNotifications(prev => [data, ...prev]);
+          // A replay after reconnecting may repeat a notification already shown
+          setNotifications(prev => (
+            prev.some(notification => notification.id === data.id) ? prev : [data, ...prev]
+          ));
+          break;
+        case 'replay':
+          setReloadRequired(data.truncated);
+          break;
+        case 'batch':
+          // Several events for this user coalesced into one frame
+          data.events.forEach(handleNotification);
+          break;
+        case 'notifications_read':
+          setNotifications(prev => prev.map(notification =>
+            (data.all || !data.ids || data.ids.includes(notification.id))
+              && (!data.up_to_id || notification.id <= data.up_to_id)
+              ? { ...notification, is_read: true }
+              : notification
+          ));
+          break;
+        case 'unread_count':
+          setUnreadCount(data.count);
           break;
         case 'connection':
           setConnectionStatus('connected');
@@ -58,6 +82,8 @@ const useNotifications = () => {
 
   return { 
     notifications, 
+    unreadCount,
+    reloadRequired,
     connectionStatus,
     clearNotifications 
   };
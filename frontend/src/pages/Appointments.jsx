@@ -25,8 +25,17 @@ const Appointments = () => {
   const fetchAppointments = async () => {
     try {
       setIsLoading(true);
-      const response = await appointmentService.getAll();
+      // Show the first page right away, then follow the cursor through the rest
+      let response = await appointmentService.getAll();
       setAppointments(response.data);
+      setIsLoading(false);
+      let cursor = response.headers['x-next-cursor'];
+      while (cursor) {
+        response = await appointmentService.getAll(cursor);
+        const page = response.data;
+        setAppointments(prev => [...prev, ...page]);
+        cursor = response.headers['x-next-cursor'];
+      }
     } catch (error) {
       console.error('Error fetching appointments:', error);
     } finally {
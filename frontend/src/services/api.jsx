@@ -191,7 +191,8 @@ export const prescriptionService = {
 
 // Service for Appointment management
 export const appointmentService = {
-  getAll: () => api.get('/appointments/'),
+  // One page of the feed; the X-Next-Cursor header holds the cursor of the next one
+  getAll: (cursor = null) => api.get('/appointments/', { params: cursor ? { cursor } : {} }),
   getById: (id) => api.get(`/appointments/${id}/`),
   create: (data) => {
     // Extract the user role from the data if provided
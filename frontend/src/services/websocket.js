@@ -10,6 +10,8 @@ class WebSocketService {
     this.heartbeatTimer = null;
     this.idleTimer = null;
     this.tokenRefreshHandler = null;
+    // Newest notification received, so a reconnect only replays what was missed
+    this.lastNotificationId = null;
   }
 
   getValidToken = async () => {
@@ -40,7 +42,11 @@ class WebSocketService {
         throw new Error('No valid token available');
       }
 
-      this.socket = new WebSocket(`ws://localhost:8000/ws/notifications/?token=${encodeURIComponent(token)}`);
+      let url = `ws://localhost:8000/ws/notifications/?token=${encodeURIComponent(token)}`;
+      if (this.lastNotificationId) {
+        url += `&last_id=${this.lastNotificationId}`;
+      }
+      this.socket = new WebSocket(url);
 
       this.socket.onopen = () => {
         console.log('WebSocket connected');
@@ -50,12 +56,17 @@ class WebSocketService {
       };
 
       this.socket.onmessage = (event) => {
-        this.resetIdleTimer();
         if (event.data === 'pong') {
+          this.resetIdleTimer();
           return; // Ignore heartbeat responses
         }
         try {
           const data = JSON.parse(event.data);
+          if (data.type === 'heartbeat') {
+            return; // Server keepalive; does not count as a notification
+          }
+          this.resetIdleTimer();
+          this.trackLastNotificationId(data);
           this.callbacks.forEach(callback => callback(data));
         } catch (err) {
           console.error('Error parsing WebSocket message:', err);
@@ -78,6 +89,21 @@ class WebSocketService {
     }
   };
 
+  trackLastNotificationId = (data) => {
+    if (data.type === 'batch') {
+      data.events.forEach(this.trackLastNotificationId);
+    } else if (data.type === 'notification' && data.id > (this.lastNotificationId || 0)) {
+      this.lastNotificationId = data.id;
+    }
+  };
+
+  setLastNotificationId = (id) => {
+    // Call after loading the notification list over HTTP
+    if (id > (this.lastNotificationId || 0)) {
+      this.lastNotificationId = id;
+    }
+  };
+
   startHeartbeat = () => {
     this.heartbeatTimer = setInterval(() => {
       if (this.socket?.readyState === WebSocket.OPEN) {